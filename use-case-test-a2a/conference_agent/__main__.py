@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import uvicorn
 import os
@@ -12,10 +13,16 @@ from a2a.types import (
     AgentSkill,
     AgentCapabilities,
 )
-from agents.mcp import MCPServerStdio
+from starlette.responses import Response
+from tool_cache import CachedMCPServerStdio
+from tool_dispatch import ConcurrencyLimitMixin
 
 from agent_executor import ConferenceAgentExecutor
+from compaction import ToolOutputCompactionMixin
 from logging_config import setup_logging
+from metrics import OPENMETRICS_CONTENT_TYPE, ToolCallMetricsMixin, render_metrics
+from replica_pool import ReplicaPool, get_max_leases, get_replica_count
+from task_store import DEFAULT_TASK_DB, BoundedTaskStore
 
 
 # Determine the base directory of the 'agentic-ai-implementations' folder
@@ -36,63 +43,126 @@ BOOKING_MOCK_SCRIPT = os.path.join(
 executor_dependencies = {}
 
 
+class MeteredMCPServerStdio(
+    ToolOutputCompactionMixin, ConcurrencyLimitMixin, ToolCallMetricsMixin, CachedMCPServerStdio
+):
+    """
+    An MCPServerStdio with cached tool lists that records its tool calls in
+    the metrics, runs at most MCP_MAX_IN_FLIGHT of them at once and compacts
+    their results before the agent sees them.
+    """
+
+
+async def metrics_endpoint(request):
+    """
+    Serves the model, tool call and turn metrics in the OpenMetrics text format.
+    """
+    return Response(render_metrics(), media_type=OPENMETRICS_CONTENT_TYPE)
+
+
+def create_replica_set(replica: int) -> dict:
+    """Creates one instance of every MCP server, by the name the executor knows it by."""
+    suffix = f"-{replica + 1}" if replica else ""
+    return {
+        'conferences_server': MeteredMCPServerStdio(
+            name=f"ConferencesServer{suffix}",
+            params={"command": "node", "args": [CONFERENCE_DISCOVERY_SCRIPT]},
+        ),
+        'conference_server': MeteredMCPServerStdio(
+            name=f"ConferenceServer{suffix}",
+            params={"command": "node", "args": [CONFERENCE_MEDIATION_SCRIPT]},
+        ),
+        'booking_server': MeteredMCPServerStdio(
+            name=f"BookingServer{suffix}",
+            params={"command": "node", "args": [BOOKING_MOCK_SCRIPT]},
+        ),
+    }
+
+
 async def startup():
     """
-    Startup handler: Initialize and start the MCP servers.
+    Startup handler: Initialize and start MCP_REPLICAS replica sets of the MCP servers.
     """
     global executor_dependencies
-    # Startup: Initialize and start the MCP servers
-    conferences_server = MCPServerStdio(
-        name="ConferencesServer",
-        params={"command": "node", "args": [CONFERENCE_DISCOVERY_SCRIPT]},
-    )
-    conference_server = MCPServerStdio(
-        name="ConferenceServer",
-        params={"command": "node", "args": [CONFERENCE_MEDIATION_SCRIPT]},
-    )
-    booking_server = MCPServerStdio(
-        name="BookingServer",
-        params={"command": "node", "args": [BOOKING_MOCK_SCRIPT]},
+    pool = ReplicaPool(
+        [create_replica_set(replica) for replica in range(get_replica_count())],
+        max_leases=get_max_leases(),
     )
+    servers = pool.get_servers()
 
     # Manually enter the context for each server
-    await asyncio.gather(
-        conferences_server.__aenter__(),
-        conference_server.__aenter__(),
-        booking_server.__aenter__()
-    )
+    await asyncio.gather(*(server.__aenter__() for server in servers))
 
-    executor_dependencies['conferences_server'] = conferences_server
-    executor_dependencies['conference_server'] = conference_server
-    executor_dependencies['booking_server'] = booking_server
-    
-    print("MCP servers started.")
+    # Load the tool lists up front, from the tool-schema cache if the builds did not change
+    await asyncio.gather(*(server.list_tools() for server in servers))
+
+    executor_dependencies['mcp_pool'] = pool
+
+    print(f"MCP servers started ({len(pool.replica_sets)} replica set(s)).")
 
 
 async def shutdown():
     """
-    Shutdown handler: Stop the MCP servers.
+    Shutdown handler: Stop the MCP servers and write pending tasks to disk.
     """
     global executor_dependencies
     print("Shutting down MCP servers...")
-    
-    conferences_server = executor_dependencies.get('conferences_server')
-    conference_server = executor_dependencies.get('conference_server')
-    booking_server = executor_dependencies.get('booking_server')
-    
-    tasks = []
-    if conferences_server:
-        tasks.append(conferences_server.__aexit__(None, None, None))
-    if conference_server:
-        tasks.append(conference_server.__aexit__(None, None, None))
-    if booking_server:
-        tasks.append(booking_server.__aexit__(None, None, None))
-        
-    await asyncio.gather(*tasks)
+
+    pool = executor_dependencies.get('mcp_pool')
+    if pool is not None:
+        pool.log_stats()
+        await asyncio.gather(*(server.__aexit__(None, None, None) for server in pool.get_servers()))
     print("MCP servers stopped.")
 
+    # Write the finished tasks that are still pending to disk
+    task_store = executor_dependencies.get('task_store')
+    if isinstance(task_store, BoundedTaskStore):
+        await task_store.close()
+
+
+def create_task_store(args):
+    """Creates the task store selected on the command line."""
+    if args.task_store == "memory":
+        return InMemoryTaskStore()
+    return BoundedTaskStore(
+        max_tasks=args.task_store_max_tasks,
+        ttl=args.task_store_ttl,
+        db_path=args.task_store_path if args.task_store == "sqlite" else None,
+    )
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Conference A2A Agent server.")
+    parser.add_argument(
+        "--task-store",
+        choices=["memory", "bounded", "sqlite"],
+        default="memory",
+        help=(
+            "Where tasks are kept: 'memory' keeps all tasks in memory, 'bounded' evicts finished tasks "
+            "beyond --task-store-max-tasks or --task-store-ttl, and 'sqlite' additionally writes finished "
+            "tasks to --task-store-path. Defaults to 'memory'."
+        ),
+    )
+    parser.add_argument(
+        "--task-store-max-tasks",
+        type=int,
+        default=1000,
+        help="The number of finished tasks kept in memory. Defaults to 1000.",
+    )
+    parser.add_argument(
+        "--task-store-ttl",
+        type=float,
+        default=3600,
+        help="The seconds after their last access after which finished tasks are evicted. Defaults to 3600.",
+    )
+    parser.add_argument(
+        "--task-store-path",
+        type=str,
+        default=DEFAULT_TASK_DB,
+        help=f"The SQLite file of the 'sqlite' task store. Defaults to {DEFAULT_TASK_DB}.",
+    )
+    args = parser.parse_args()
+
     # Load environment variables from a .env file
     load_dotenv()
     setup_logging()
@@ -109,6 +179,17 @@ if __name__ == '__main__':
         ],
     )
 
+    lookup_skill = AgentSkill(
+        id='lookup_conference',
+        name='Look up a conference',
+        description='Answers when and where a conference takes place, straight from the conference data.',
+        tags=['conference', 'lookup'],
+        examples=[
+            'When and where is ESWC 2025?',
+            'Where is the International Semantic Web Conference held?'
+        ],
+    )
+
     # This will be the public-facing agent card
     agent_card = AgentCard(
         name='Conference Agent',
@@ -117,8 +198,8 @@ if __name__ == '__main__':
         version='1.0.0',
         default_input_modes=['text'],
         default_output_modes=['text'],
-        capabilities=AgentCapabilities(streaming=False),
-        skills=[skill],
+        capabilities=AgentCapabilities(streaming=True),
+        skills=[skill, lookup_skill],
     )
 
     # The agent executor is now given the mutable dictionary which the lifespan will populate
@@ -127,9 +208,12 @@ if __name__ == '__main__':
         model_name="gpt-4o"  # Or another model from your config
     )
 
+    task_store = create_task_store(args)
+    executor_dependencies['task_store'] = task_store
+
     request_handler = DefaultRequestHandler(
         agent_executor=agent_executor,
-        task_store=InMemoryTaskStore(),
+        task_store=task_store,
     )
 
     server = A2AStarletteApplication(
@@ -141,5 +225,6 @@ if __name__ == '__main__':
     app = server.build()
     app.add_event_handler("startup", startup)
     app.add_event_handler("shutdown", shutdown)
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"])
 
     uvicorn.run(app, host='0.0.0.0', port=9998, log_config=None)
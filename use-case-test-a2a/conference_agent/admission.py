@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTIONS
+
+
+# The assumed duration of a request until the first ones finished, for the retry-after hint
+DEFAULT_SERVICE_TIME = 30.0
+
+# The weight of the latest request in the moving average of the request duration
+SERVICE_TIME_WEIGHT = 0.2
+
+
+@dataclass
+class AdmissionPolicy:
+    """
+    A dataclass to hold the admission policy of the server: at most
+    `max_in_flight` requests run at once, and at most `max_queue` more wait
+    for a slot, the one with the earliest deadline first. Requests beyond
+    that are rejected at once. A request's deadline is set in seconds via
+    the 'deadline' field of its message metadata, or `default_deadline`,
+    and is capped at `max_deadline`.
+    """
+
+    max_in_flight: int = 8
+    max_queue: int = 32
+    default_deadline: float = 120
+    max_deadline: float = 600
+
+
+def get_admission_policy():
+    """
+    Returns the admission policy set via the ADMISSION_CONTROL,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_DEFAULT_DEADLINE
+    and ADMISSION_MAX_DEADLINE variables, or None if it is disabled.
+    """
+    if os.getenv("ADMISSION_CONTROL", "1").lower() not in ["1", "true", "yes"]:
+        return None
+    return AdmissionPolicy(
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+        default_deadline=float(os.getenv("ADMISSION_DEFAULT_DEADLINE", "120")),
+        max_deadline=float(os.getenv("ADMISSION_MAX_DEADLINE", "600")),
+    )
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted, with the seconds after which the
+    client may retry, or None if the request itself is invalid.
+    """
+
+    def __init__(self, reason: str, retry_after: int = None, message: str = None):
+        super().__init__(message or f"Request rejected ({reason}), retry after {retry_after}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admits requests according to an admission policy. Waiting requests are
+    kept in a heap by deadline, and a finished request hands its slot to the
+    waiting request with the earliest deadline. A request whose deadline
+    passes while it waits is rejected, since its client stopped waiting.
+    """
+
+    def __init__(self, policy: AdmissionPolicy):
+        self.policy = policy
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.service_time = None
+        self._queue = []
+        self._sequence = itertools.count()
+
+    def get_retry_after(self) -> int:
+        """Estimates the seconds until a slot is free for a new request, from the mean request duration."""
+        service_time = self.service_time if self.service_time is not None else DEFAULT_SERVICE_TIME
+        return max(1, math.ceil(service_time * (self.waiting + 1) / self.policy.max_in_flight))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        retry_after = self.get_retry_after()
+        logging.warning(
+            "Admission - "
+            f"Rejected: {reason}, "
+            f"In Flight: {self.in_flight}, "
+            f"Queue Depth: {self.waiting}, "
+            f"Retry After: {retry_after}s"
+        )
+        return AdmissionRejected(reason, retry_after)
+
+    def get_deadline(self, value) -> float:
+        """
+        Returns the deadline in seconds a client set for its request, or the
+        policy's default, capped at the policy's maximum. Raises
+        AdmissionRejected if it is not a positive number.
+        """
+        if value is None:
+            return self.policy.default_deadline
+        try:
+            deadline = float(value)
+        except (TypeError, ValueError):
+            deadline = math.nan
+        if not math.isfinite(deadline) or deadline <= 0:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.inc(reason="invalid_deadline")
+            logging.warning(f"Admission - Rejected: invalid_deadline, Deadline: {value!r}")
+            raise AdmissionRejected(
+                "invalid_deadline",
+                message=f"Invalid deadline {value!r}: the deadline must be a positive number of seconds.",
+            )
+        return min(deadline, self.policy.max_deadline)
+
+    async def _acquire(self, deadline: float) -> None:
+        if self.in_flight < self.policy.max_in_flight and not self.waiting:
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight)
+            return
+        if self.waiting >= self.policy.max_queue:
+            raise self._reject("queue_full")
+
+        slot = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (deadline, next(self._sequence), slot))
+        self.waiting += 1
+        ADMISSION_QUEUE_DEPTH.set(self.waiting)
+        try:
+            await asyncio.wait_for(slot, max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if slot.done() and not slot.cancelled():
+                # The slot was handed over just as the wait ended, so pass it on
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("deadline_expired") from None
+            raise
+        finally:
+            # The waiter is done either way; a slot it did not take leaves a stale heap entry
+            self.waiting -= 1
+            ADMISSION_QUEUE_DEPTH.set(self.waiting)
+
+    def _release(self) -> None:
+        """Hands the slot to the waiting request with the earliest deadline, or frees it."""
+        while self._queue:
+            _, _, slot = heapq.heappop(self._queue)
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, timeout: float = None):
+        """
+        Waits for a slot for a request that must start within `timeout`
+        seconds (Default: the policy's default deadline), and holds it until
+        the request is done. Raises AdmissionRejected if the queue is full or
+        the deadline passes.
+        """
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.policy.default_deadline)
+        await self._acquire(deadline)
+        admitted = time.monotonic()
+        ADMISSION_QUEUE_WAIT.observe(admitted - start)
+        if admitted - start > 0.001:
+            logging.info(f"Admission - Waited: {(admitted - start) * 1000:.0f}ms, Queue Depth: {self.waiting}")
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - admitted
+            if self.service_time is None:
+                self.service_time = duration
+            else:
+                self.service_time += SERVICE_TIME_WEIGHT * (duration - self.service_time)
+            self._release()
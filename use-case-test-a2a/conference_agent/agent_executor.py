@@ -1,15 +1,127 @@
+import asyncio
+import contextlib
 import logging
-from agents import Agent, Runner
+import time
+import uuid
+from dataclasses import dataclass
+from agents import Agent, ModelSettings, Runner
 from agents.mcp import MCPServer
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
-from a2a.utils import new_agent_text_message
-from models import get_model_config, setup_model_client
+from a2a.server.tasks import TaskUpdater
+from a2a.types import Part, TaskState, TextPart
+from a2a.utils import new_agent_text_message, new_task
+from admission import AdmissionController, AdmissionRejected, get_admission_policy
+from compaction import log_compaction_stats, start_compaction_stats
+from conference_lookup import ConferenceLookup, is_lookup_enabled, is_lookup_query
+from history_policy import create_run_config
+from metrics import STREAM_FIRST_TOKEN_DURATION, MetricsHooks
+from models import build_model, get_all_configs, get_model_config, get_stage_config, setup_model_client
+
+
+# The maximum number of turns of an agent run
+MAX_TURNS = 15
+
+# How long a cancelled run may take to finish its current turn before it is stopped at once
+CANCEL_GRACE_SECONDS = 30
+
+
+@dataclass
+class ActiveRun:
+    """A dataclass to hold the streamed agent run of a task, so that it can be cancelled."""
+
+    result: object
+    updater: TaskUpdater
+    cancelled: bool = False
+    consumer: asyncio.Task = None
+
+
+class StreamPublisher:
+    """
+    Publishes the events of a streamed agent run to the task's event queue:
+    a working status per tool call and tool result, and the text tokens of
+    the model as chunks of one 'response' artifact. Use one instance per run.
+    """
+
+    def __init__(self, updater: TaskUpdater):
+        self.updater = updater
+        self.artifact_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.events = 0
+        self.token_chunks = 0
+        self._tool_names = {}
+        self._pending_delta = None
+
+    async def publish(self, event) -> None:
+        """Publishes one stream event of the run, if it is of interest to the client."""
+        if event.type == "raw_response_event" and event.data.type == "response.output_text.delta":
+            await self._publish_delta(event.data.delta)
+        elif event.type == "run_item_stream_event" and event.name == "tool_called":
+            raw_item = event.item.raw_item
+            name = getattr(raw_item, "name", None) or "tool"
+            self._tool_names[getattr(raw_item, "call_id", None)] = name
+            await self._publish_status(f"Calling {name}...")
+        elif event.type == "run_item_stream_event" and event.name == "tool_output":
+            raw_item = event.item.raw_item
+            call_id = raw_item.get("call_id") if isinstance(raw_item, dict) else getattr(raw_item, "call_id", None)
+            await self._publish_status(f"{self._tool_names.get(call_id, 'The tool')} returned.")
+
+    async def _publish_status(self, text: str) -> None:
+        await self.updater.start_work(
+            new_agent_text_message(text, self.updater.context_id, self.updater.task_id)
+        )
+        self.events += 1
+
+    async def _publish_delta(self, delta: str) -> None:
+        if not delta:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+        # Hold back one delta, so that the last chunk can be flagged as such
+        if self._pending_delta is not None:
+            await self._publish_chunk(self._pending_delta, last_chunk=False)
+        self._pending_delta = delta
+
+    async def _publish_chunk(self, text: str, last_chunk: bool) -> None:
+        await self.updater.add_artifact(
+            [Part(root=TextPart(text=text))],
+            artifact_id=self.artifact_id,
+            name="response",
+            append=self.token_chunks > 0,
+            last_chunk=last_chunk,
+        )
+        self.events += 1
+        self.token_chunks += 1
+
+    async def flush(self) -> None:
+        """Publishes the last token chunk of the response."""
+        if self._pending_delta is not None:
+            await self._publish_chunk(self._pending_delta, last_chunk=True)
+            self._pending_delta = None
+
+    def log_stats(self, model: str) -> None:
+        """Logs the number of events and the time to the first token, and records it in the metrics."""
+        if self.first_token is not None:
+            STREAM_FIRST_TOKEN_DURATION.observe(self.first_token, model=model)
+        first_token = f"{self.first_token * 1000:.0f}ms" if self.first_token is not None else "n/a"
+        logging.info(
+            "Streaming - "
+            f"Events: {self.events}, "
+            f"Token Chunks: {self.token_chunks}, "
+            f"Time to First Token: {first_token}, "
+            f"Duration: {(time.perf_counter() - self.start) * 1000:.0f}ms"
+        )
 
 
 class ConferenceAgentExecutor(AgentExecutor):
     """
     An AgentExecutor that wraps the conference booking agent functionality.
+    Conference lookups are answered from the discovery data without the
+    agent.
+    The agent runs as a task with streamed events, so streaming clients see
+    the progress of the tool calls and the tokens of the answer as they are
+    produced, and other clients get the completed task.
     """
 
     def __init__(
@@ -19,9 +131,25 @@ class ConferenceAgentExecutor(AgentExecutor):
     ):
         self.dependencies = dependencies
 
-        # Set up the model client once during initialization.
+        # Set up the model clients once during initialization.
         self.model_config = get_model_config(model_name)
-        setup_model_client(self.model_config)
+        for config in get_all_configs(self.model_config):
+            setup_model_client(config)
+        self.booking_config = get_stage_config(self.model_config, "booking")
+        self.model = build_model(self.booking_config)
+
+        # Answers conference lookups from the discovery data, without a model call
+        self.lookup = ConferenceLookup() if is_lookup_enabled() else None
+
+        # Limit the requests running at once, queueing or rejecting the rest
+        admission_policy = get_admission_policy()
+        self.admission = AdmissionController(admission_policy) if admission_policy is not None else None
+
+        # The running agent runs by task id, and the tokens of the finished ones,
+        # to estimate what a cancellation saves
+        self.active_runs = {}
+        self.finished_runs = 0
+        self.finished_run_tokens = 0
 
     async def execute(
         self,
@@ -46,35 +174,72 @@ class ConferenceAgentExecutor(AgentExecutor):
 
         logging.info(f"Received query for conference agent: {query}")
 
-        # Access MCP servers from the dependencies dictionary, populated by the lifespan manager
-        conferences_server = self.dependencies.get('conferences_server')
-        conference_server = self.dependencies.get('conference_server')
-        booking_server = self.dependencies.get('booking_server')
+        # Access the MCP server pool from the dependencies dictionary, populated by the startup handler
+        pool = self.dependencies.get('mcp_pool')
 
-        if not all([conferences_server, conference_server, booking_server]):
+        if pool is None:
             error_message = "I'm sorry, one or more MCP servers are not available. Please check the server logs."
             await event_queue.enqueue_event(new_agent_text_message(error_message))
-            logging.error("One or more MCP servers were not found in the dependencies dictionary.")
+            logging.error("The MCP server pool was not found in the dependencies dictionary.")
             return
-            
-        # Define the agent that will use the MCP servers
-        agent = Agent(
-            name="ConferenceAgent",
-            instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
-            mcp_servers=[
-                conferences_server,
-                conference_server,
-                booking_server,
-            ],
-            model=self.model_config.model_string,
-        )
+
+        # Answer lookups such as 'When and where is ESWC 2025?' straight away,
+        # and leave those that find no conference to the agent
+        if self.lookup is not None and is_lookup_query(query):
+            answer = await self.lookup.answer(query, pool)
+            if answer is not None:
+                await event_queue.enqueue_event(new_agent_text_message(answer, context.context_id))
+                return
+
+        task = context.current_task or new_task(context.message)
+        await event_queue.enqueue_event(task)
+        updater = TaskUpdater(event_queue, task.id, task.context_id)
+        publisher = StreamPublisher(updater)
+        run = None
 
         try:
-            # Run the agent with the user's query
-            result = await Runner.run(agent, query, max_turns=15)
+            # Wait for admission, then lease one replica set of the MCP servers for the whole request
+            async with self.admit(context), pool.lease() as servers:
+                await updater.start_work()
 
-            final_output = result.final_output or "The agent finished without a final output."
-            await event_queue.enqueue_event(new_agent_text_message(final_output))
+                # Define the agent that will use the MCP servers
+                agent = Agent(
+                    name="ConferenceAgent",
+                    instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
+                    mcp_servers=[
+                        servers['conferences_server'],
+                        servers['conference_server'],
+                        servers['booking_server'],
+                    ],
+                    model=self.model,
+                    model_settings=ModelSettings(parallel_tool_calls=self.booking_config.parallel_tool_calls),
+                )
+
+                # Run the agent with the user's query and publish its progress as it streams
+                compaction_stats = start_compaction_stats()
+                run_config, history_filter = create_run_config()
+                result = Runner.run_streamed(
+                    agent, query, max_turns=MAX_TURNS, hooks=MetricsHooks(max_turns=MAX_TURNS), run_config=run_config
+                )
+                run = ActiveRun(result, updater)
+                # The stream is consumed in a task of its own, as the run is cut off at
+                # once if its consumer is cancelled while waiting for an event
+                run.consumer = asyncio.create_task(self.publish_run(run, publisher))
+                self.active_runs[task.id] = run
+                try:
+                    await asyncio.shield(run.consumer)
+                except asyncio.CancelledError:
+                    # The request handler cancels the execution after cancel(), so
+                    # stop the run, which would go on in the background otherwise,
+                    # before the MCP servers are released
+                    run.cancelled = True
+                    await self.stop_run(run)
+                    raise
+                except Exception:
+                    await self.stop_run(run)
+                    raise
+                finally:
+                    self.active_runs.pop(task.id, None)
 
             # Log token usage
             usage = result.context_wrapper.usage
@@ -85,6 +250,34 @@ class ConferenceAgentExecutor(AgentExecutor):
                 f"Output Tokens: {usage.output_tokens}, "
                 f"Total Tokens: {usage.total_tokens}"
             )
+            log_compaction_stats(compaction_stats)
+            if history_filter is not None:
+                history_filter.log_stats()
+
+            if run.cancelled:
+                self.log_cancelled_run(run)
+                return
+
+            self.finished_runs += 1
+            self.finished_run_tokens += usage.total_tokens
+            await publisher.flush()
+            final_output = result.final_output or "The agent finished without a final output."
+            await updater.complete(new_agent_text_message(final_output, task.context_id, task.id))
+            publisher.log_stats(self.booking_config.name)
+
+        except AdmissionRejected as e:
+            if e.retry_after is None:
+                # The request itself is invalid, so retrying it does not help
+                message = updater.new_agent_message([Part(root=TextPart(text=str(e)))])
+                await updater.update_status(TaskState.rejected, message, final=True)
+                return
+            message = updater.new_agent_message(
+                [Part(root=TextPart(text=f"The server is busy. Please retry in {e.retry_after} seconds."))],
+                metadata={"retry_after": e.retry_after},
+            )
+            await updater.update_status(
+                TaskState.rejected, message, final=True, metadata={"retry_after": e.retry_after}
+            )
 
         except Exception as e:
             logging.error(f"An error occurred during agent execution: {e}", exc_info=True)
@@ -92,10 +285,94 @@ class ConferenceAgentExecutor(AgentExecutor):
                 "I'm sorry, an unexpected error occurred while processing your request. "
                 "Please check the server logs for more details."
             )
-            await event_queue.enqueue_event(new_agent_text_message(error_message))
+            # A cancelled task is already in its final state
+            if run is None or not run.cancelled:
+                await updater.failed(new_agent_text_message(error_message, task.context_id, task.id))
+
+    def admit(self, context: RequestContext):
+        """
+        Returns the context manager that admits a request. Its deadline is set
+        in seconds via the 'deadline' field of the message metadata. Raises
+        AdmissionRejected if the deadline is invalid.
+        """
+        if self.admission is None:
+            return contextlib.nullcontext()
+        metadata = context.message.metadata or {}
+        return self.admission.admit(self.admission.get_deadline(metadata.get("deadline")))
+
+    async def publish_run(self, run: ActiveRun, publisher: StreamPublisher) -> None:
+        """Consumes the events of a run, and publishes them until the run is cancelled."""
+        async for event in run.result.stream_events():
+            # A cancelled run only finishes its current turn, which is not published
+            if run.cancelled:
+                continue
+            try:
+                await publisher.publish(event)
+            except RuntimeError:
+                # The task was canceled while the event was being published
+                if not run.cancelled:
+                    raise
+
+    async def stop_run(self, run: ActiveRun) -> None:
+        """
+        Lets a run finish its current turn, so that no tool call is cut off,
+        and waits for it to stop. A run that does not stop within
+        CANCEL_GRACE_SECONDS is stopped at once. Errors of the run are left
+        to the caller.
+        """
+        run.result.cancel(mode="after_turn")
+
+        async def wait():
+            with contextlib.suppress(Exception):
+                await asyncio.shield(run.consumer)
+            # The consumer may have stopped early, e.g. on a failed publish
+            async for _ in run.result.stream_events():
+                pass
+
+        try:
+            try:
+                await asyncio.wait_for(wait(), CANCEL_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                # Stop the run at once, and wait until its tool calls are cancelled
+                run.result.cancel()
+                await wait()
+        except Exception:
+            # The run failed, which is handled by the caller
+            pass
+        if run.cancelled:
+            self.log_cancelled_run(run)
+
+    def log_cancelled_run(self, run: ActiveRun) -> None:
+        """
+        Logs the tokens a cancelled run used, and the tokens the cancellation
+        saved, estimated from the mean tokens of the finished runs.
+        """
+        used = run.result.context_wrapper.usage.total_tokens
+        saved = max(0, self.finished_run_tokens // self.finished_runs - used) if self.finished_runs else "n/a"
+        logging.info(
+            "TOKEN_USAGE - Cancelled Run - "
+            f"Turns: {run.result.current_turn}, "
+            f"Tokens Used: {used}, "
+            f"Saved Tokens (est.): {saved}"
+        )
 
     async def cancel(
         self, context: RequestContext, event_queue: EventQueue
     ) -> None:
-        # For now, cancel is not supported.
-        raise NotImplementedError("Cancel is not supported for this agent.")
+        """
+        Cancels the agent run of a task. The run stops after its current turn,
+        the task is marked as canceled, and the request handler then cancels
+        the execution, which waits for the run to stop and releases its MCP
+        servers.
+        """
+        message = new_agent_text_message("The request was cancelled.", context.context_id, context.task_id)
+        run = self.active_runs.get(context.task_id)
+        if run is None:
+            # The task is not running (yet), e.g. while it waits for MCP servers
+            await TaskUpdater(event_queue, context.task_id, context.context_id).cancel(message)
+            return
+
+        logging.info(f"Cancelling the agent run of task {context.task_id}.")
+        run.cancelled = True
+        run.result.cancel(mode="after_turn")
+        await run.updater.cancel(message)
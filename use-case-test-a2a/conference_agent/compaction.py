@@ -0,0 +1,183 @@
+import contextvars
+import json
+import logging
+import os
+from dataclasses import dataclass
+from metrics import is_error_result
+
+
+# The fields the agent needs from the results of the search tools. A dict
+# keeps the listed keys of an object, a one-element list applies its
+# element to every item of a list, and True keeps a value as it is. The
+# 'errors' key is kept, so that API errors still reach the agent.
+HOTEL_OFFERS_FIELDS = {
+    "data": [
+        {
+            "hotel": {"hotelId": True, "name": True, "cityCode": True},
+            "available": True,
+            "offers": [
+                {
+                    "id": True,
+                    "checkInDate": True,
+                    "checkOutDate": True,
+                    "price": {"currency": True, "total": True},
+                }
+            ],
+        }
+    ],
+    "errors": True,
+}
+
+TOOL_FIELDS = {
+    "search_flight_offers": {
+        "data": [
+            {
+                "id": True,
+                "itineraries": [
+                    {
+                        "segments": [
+                            {
+                                "departure": {"iataCode": True, "at": True},
+                                "arrival": {"iataCode": True, "at": True},
+                                "carrierCode": True,
+                                "number": True,
+                            }
+                        ]
+                    }
+                ],
+                "price": {"currency": True, "total": True},
+            }
+        ],
+        "errors": True,
+    },
+    "search_hotels_by_city": HOTEL_OFFERS_FIELDS,
+    "search_hotels_by_geocode": HOTEL_OFFERS_FIELDS,
+    "get_hotel_offers": HOTEL_OFFERS_FIELDS,
+    "get_nearest_airports": {
+        "data": [{"name": True, "iataCode": True, "distance": {"value": True, "unit": True}}],
+        "errors": True,
+    },
+}
+
+# The characters per token used to estimate the tokens saved
+CHARS_PER_TOKEN = 4
+
+
+def is_compaction_enabled() -> bool:
+    """Returns whether tool results are compacted, as set via the TOOL_COMPACTION variable."""
+    return os.getenv("TOOL_COMPACTION", "1").lower() in ["1", "true", "yes"]
+
+
+def project(value, fields):
+    """Returns the parts of a JSON value selected by a field specification."""
+    if fields is True:
+        return value
+    if isinstance(fields, list):
+        if not isinstance(value, list):
+            return value
+        return [project(item, fields[0]) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(value[key], field) for key, field in fields.items() if key in value}
+
+
+def compact_text(tool_name: str, text: str) -> str:
+    """
+    Compacts the text of a tool result. JSON is minified and, for the tools
+    in TOOL_FIELDS, reduced to the fields the agent needs. Text that is not
+    JSON is returned as it is.
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return text
+    fields = TOOL_FIELDS.get(tool_name)
+    if fields is not None and isinstance(value, dict):
+        projected = project(value, fields)
+        # Keep the whole payload if the projection lost everything, e.g. for an unexpected shape
+        if projected:
+            value = projected
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+@dataclass
+class CompactionStats:
+    """A dataclass to hold the size of the tool results of one run before and after compaction."""
+
+    results: int = 0
+    original_chars: int = 0
+    compacted_chars: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return (self.original_chars - self.compacted_chars) // CHARS_PER_TOKEN
+
+
+# The compaction stats of the current run. The tasks a run spawns copy the
+# context, so they all add to the same stats object.
+_current_stats = contextvars.ContextVar("current_compaction_stats", default=None)
+
+
+def start_compaction_stats() -> CompactionStats:
+    """Starts collecting the compaction stats of a run in the current context."""
+    stats = CompactionStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def log_compaction_stats(stats: CompactionStats) -> None:
+    """Logs the compaction stats of a run to the token usage log."""
+    reduction = 1 - stats.compacted_chars / stats.original_chars if stats.original_chars else 0.0
+    logging.info(
+        "TOKEN_USAGE - Tool Output Compaction - "
+        f"Results: {stats.results}, "
+        f"Original Chars: {stats.original_chars}, "
+        f"Compacted Chars: {stats.compacted_chars}, "
+        f"Reduction: {reduction:.0%}, "
+        f"Saved Tokens (est.): {stats.saved_tokens}"
+    )
+
+
+def compact_tool_result(tool_name: str, result):
+    """
+    Returns a copy of an MCP CallToolResult with compacted text content, and
+    the number of characters before and after compaction. Error results are
+    returned unchanged. The sizes are added to the stats of the current run.
+    """
+    original_chars = sum(len(item.text) for item in result.content if item.type == "text")
+    if not is_compaction_enabled() or is_error_result(result):
+        return result, original_chars, original_chars
+
+    content = [
+        item.model_copy(update={"text": compact_text(tool_name, item.text)}) if item.type == "text" else item
+        for item in result.content
+    ]
+    compacted = result.model_copy(update={"content": content})
+    compacted_chars = sum(len(item.text) for item in content if item.type == "text")
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.results += 1
+        stats.original_chars += original_chars
+        stats.compacted_chars += compacted_chars
+    return compacted, original_chars, compacted_chars
+
+
+class ToolOutputCompactionMixin:
+    """
+    A mixin for MCP servers that compacts every tool result before it is
+    passed on to the agent, and logs the full result at debug level. List it
+    before the server class, e.g.
+    `class CompactingServer(ToolOutputCompactionMixin, MCPServerStdio)`.
+    """
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        if meta is None:
+            result = await super().call_tool(tool_name, arguments)
+        else:
+            result = await super().call_tool(tool_name, arguments, meta=meta)
+        compacted, original_chars, compacted_chars = compact_tool_result(tool_name, result)
+        logging.debug(
+            f"Full result of MCP tool {tool_name} ({original_chars} chars, {compacted_chars} compacted): {result}"
+        )
+        return compacted
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from metrics import is_error_result
+
+
+# Words that ask about a conference itself, and words that ask for a booking.
+# Only queries with the former and none of the latter are answered without the agent.
+LOOKUP_WORDS = {"when", "where", "date", "dates", "location", "venue", "details", "info", "information", "held"}
+BOOKING_WORDS = {"book", "booking", "flight", "flights", "hotel", "hotels", "trip", "travel", "fly", "reserve", "go"}
+
+# Words of a conference title that do not identify it
+STOP_WORDS = {"the", "of", "on", "and", "for", "a", "an", "conference", "annual"}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def is_lookup_enabled() -> bool:
+    """Returns whether conference lookups are answered without the agent, as set via CONFERENCE_LOOKUP (Default: on)."""
+    return os.getenv("CONFERENCE_LOOKUP", "1").lower() in ["1", "true", "yes"]
+
+
+def get_words(text: str) -> list:
+    """Returns the lowercase words of a text."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def is_lookup_query(query: str) -> bool:
+    """Returns whether a query only asks about a conference, e.g. 'When and where is ESWC 2025?'."""
+    words = set(get_words(query))
+    return bool(words & LOOKUP_WORDS) and not words & BOOKING_WORDS
+
+
+def get_text(result) -> str:
+    """Returns the text content of an MCP CallToolResult."""
+    return "".join(item.text for item in result.content if item.type == "text")
+
+
+class ConferenceIndex:
+    """
+    An in-memory index of the conferences of the discovery server. A
+    conference is found by its acronym, e.g. 'eswc', or by all identifying
+    words of its title, e.g. 'european semantic web'.
+    """
+
+    def __init__(self, conferences: dict):
+        self.conferences = conferences
+        self._by_acronym = {}
+        self._by_word = {}
+        self._title_words = {}
+        for name, details in conferences.items():
+            acronym = (get_words(name) or [name.lower()])[0]
+            self._by_acronym.setdefault(acronym, set()).add(name)
+
+            # Ordinals such as '22nd', years and the acronym with its year, e.g. 'eswc2025', do not identify it
+            title = details.get("description", "").split(",")[0]
+            title_words = {
+                word
+                for word in get_words(title)
+                if word not in STOP_WORDS and not re.fullmatch(r"\d+(st|nd|rd|th)?|[a-z]+\d+", word)
+            }
+            self._title_words[name] = title_words
+            for word in title_words:
+                self._by_word.setdefault(word, set()).add(name)
+
+    def find(self, query: str) -> list:
+        """Returns the names of the conferences a query names, narrowed down by a year if it names one."""
+        words = set(get_words(query))
+        matches = set()
+        for word in words:
+            matches |= self._by_acronym.get(word, set())
+            # A title matches if the query has all of its identifying words
+            for name in self._by_word.get(word, set()):
+                if self._title_words[name] <= words:
+                    matches.add(name)
+        years = {word for word in words if re.fullmatch(r"\d{4}", word)}
+        if years:
+            matches = {name for name in matches if years & set(get_words(name))}
+        return sorted(matches)
+
+
+class ConferenceLookup:
+    """
+    Answers conference lookups from the discovery server's data without a
+    model call. The conferences are loaded into a ConferenceIndex on first
+    use, and queries the index does not answer are passed to the server's
+    search. Concurrent identical queries share one lookup.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.lookups = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._load_lock = asyncio.Lock()
+
+    async def _load(self, server) -> ConferenceIndex:
+        async with self._load_lock:
+            if self.index is None:
+                start = time.perf_counter()
+                conferences = json.loads(get_text(await server.call_tool("get_conferences", {})))
+                results = await asyncio.gather(
+                    *(
+                        server.call_tool("get_conference_details", {"conference_name": conference["name"]})
+                        for conference in conferences
+                    )
+                )
+                details = {
+                    conference["name"]: json.loads(get_text(result))
+                    for conference, result in zip(conferences, results)
+                    if not is_error_result(result)
+                }
+                self.index = ConferenceIndex(details)
+                logging.info(
+                    f"Conference Lookup - Indexed {len(details)} conference(s) in "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms"
+                )
+        return self.index
+
+    async def answer(self, query: str, pool):
+        """
+        Returns the answer to a conference lookup, or None if no conference
+        was found. Identical queries that arrive while one is being looked up
+        get its answer.
+        """
+        key = " ".join(get_words(query))
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._answer(query, pool))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self.lookups += 1
+        # Shielded, so a client that goes away does not cancel the lookup of the others
+        return await asyncio.shield(task)
+
+    async def _answer(self, query: str, pool):
+        start = time.perf_counter()
+        names = self.index.find(query) if self.index is not None else []
+        if names:
+            found = [(name, self.index.conferences[name]) for name in names]
+        else:
+            # Load the index on first use, and search the server for what it does not answer
+            async with pool.lease() as servers:
+                server = servers['conferences_server']
+                index = await self._load(server)
+                found = [(name, index.conferences[name]) for name in index.find(query)]
+                if not found:
+                    result = await server.call_tool("search_conferences", {"query": query})
+                    if not is_error_result(result):
+                        found = [(match["name"], match) for match in json.loads(get_text(result))]
+
+        logging.info(
+            "Conference Lookup - "
+            f"Found: {len(found)}, "
+            f"Duration: {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        if not found:
+            return None
+        return "\n".join(
+            f"{name}: {details.get('description', '')}. Location: {details.get('location', 'unknown')}."
+            for name, details in found
+        )
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from agents import RunConfig
+from agents.run_config import ModelInputData
+
+
+# The keys kept in the summaries of older tool results, i.e. what the agent
+# decided on: the selected conference, offer ids, dates, places and prices
+SUMMARY_KEYS = {
+    "id",
+    "hotelId",
+    "name",
+    "date",
+    "location",
+    "latitude",
+    "longitude",
+    "iataCode",
+    "cityCode",
+    "at",
+    "checkInDate",
+    "checkOutDate",
+    "carrierCode",
+    "number",
+    "total",
+    "currency",
+    "status",
+}
+
+# The maximum number of items kept of a list in a summary
+MAX_SUMMARY_ITEMS = 5
+
+# The maximum length of the summary of a tool result that is not JSON
+MAX_SUMMARY_TEXT = 200
+
+# The characters per token used to estimate the size of the model input
+CHARS_PER_TOKEN = 4
+
+# The model output items that start a new turn
+MODEL_ITEM_TYPES = {"function_call", "reasoning"}
+
+
+@dataclass
+class HistoryPolicy:
+    """
+    A dataclass to hold the history policy of an agent run: once the model
+    input exceeds `token_budget` (estimated) tokens, the results of all but
+    the last `keep_turns` turns are replaced with structured summaries. The
+    instructions and the user's query are always kept verbatim.
+    """
+
+    keep_turns: int = 2
+    token_budget: int = 6000
+
+
+def get_history_policy():
+    """
+    Returns the history policy set via the HISTORY_POLICY,
+    HISTORY_KEEP_TURNS and HISTORY_TOKEN_BUDGET variables, or None if it is
+    disabled.
+    """
+    if os.getenv("HISTORY_POLICY", "1").lower() not in ["1", "true", "yes"]:
+        return None
+    return HistoryPolicy(
+        keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "2")),
+        token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "6000")),
+    )
+
+
+def estimate_tokens(instructions, items: list) -> int:
+    """Estimates the tokens of a model input as four characters per token."""
+    chars = len(instructions or "") + len(json.dumps(items, ensure_ascii=False, default=str))
+    return chars // CHARS_PER_TOKEN
+
+
+def get_output_text(output) -> str:
+    """Returns the text of a function call output, which is either text or a list of content parts."""
+    if isinstance(output, list):
+        return "".join(part.get("text", "") for part in output if isinstance(part, dict))
+    return str(output)
+
+
+def summarize_value(value):
+    """
+    Returns the parts of a JSON value under SUMMARY_KEYS, keeping the keys
+    that lead to them, e.g. the name a conference is keyed by. Returns None
+    if nothing is left.
+    """
+    if isinstance(value, dict):
+        summary = {}
+        for key, item in value.items():
+            if key in SUMMARY_KEYS and not isinstance(item, (dict, list)):
+                summary[key] = item
+            else:
+                item_summary = summarize_value(item)
+                if item_summary is not None:
+                    summary[key] = item_summary
+        return summary or None
+    if isinstance(value, list):
+        summary = [s for s in (summarize_value(item) for item in value[:MAX_SUMMARY_ITEMS]) if s is not None]
+        return summary or None
+    return None
+
+
+def summarize_tool_output(tool_name: str, output) -> str:
+    """Returns the structured summary that replaces an older tool result."""
+    text = get_output_text(output)
+    try:
+        summary = summarize_value(json.loads(text))
+    except json.JSONDecodeError:
+        summary = text[:MAX_SUMMARY_TEXT]
+    return "[Summary of an earlier result of " + tool_name + "] " + json.dumps(
+        summary, separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def get_turns(items: list) -> list:
+    """
+    Returns the turn of every input item: 0 for the items before the first
+    model output, e.g. the user's query, and n for the calls of the n-th
+    model response and their results.
+    """
+    turns = []
+    turn = 0
+    previous_is_model_item = False
+    for item in items:
+        is_model_item = isinstance(item, dict) and (
+            item.get("type") in MODEL_ITEM_TYPES or item.get("role") == "assistant"
+        )
+        if is_model_item and not previous_is_model_item:
+            turn += 1
+        turns.append(turn)
+        previous_is_model_item = is_model_item
+    return turns
+
+
+class HistoryFilter:
+    """
+    A call_model_input_filter that applies a history policy to the model
+    input of every turn and keeps the numbers for the usage log. Use one
+    instance per run.
+    """
+
+    def __init__(self, policy: HistoryPolicy):
+        self.policy = policy
+        self.model_calls = 0
+        self.compactions = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.duration = 0.0
+
+    def __call__(self, data) -> ModelInputData:
+        start = time.perf_counter()
+        model_data = data.model_data
+        items = model_data.input
+        tokens = tokens_after = estimate_tokens(model_data.instructions, items)
+        if tokens > self.policy.token_budget:
+            items = self.compact(items)
+            tokens_after = estimate_tokens(model_data.instructions, items)
+            self.compactions += 1
+
+        self.model_calls += 1
+        self.tokens_before += tokens
+        self.tokens_after += tokens_after
+        self.duration += time.perf_counter() - start
+        return ModelInputData(input=items, instructions=model_data.instructions)
+
+    def compact(self, items: list) -> list:
+        """Replaces the tool results of all but the last keep_turns turns with summaries."""
+        turns = get_turns(items)
+        last_kept_turn = max(turns, default=0) - self.policy.keep_turns
+        tool_names = {
+            item["call_id"]: item.get("name", "tool")
+            for item in items
+            if isinstance(item, dict) and item.get("type") == "function_call"
+        }
+
+        compacted = []
+        for item, turn in zip(items, turns):
+            if 0 < turn <= last_kept_turn and isinstance(item, dict) and item.get("type") == "function_call_output":
+                tool_name = tool_names.get(item.get("call_id"), "tool")
+                item = {**item, "output": summarize_tool_output(tool_name, item.get("output", ""))}
+            compacted.append(item)
+        return compacted
+
+    def log_stats(self) -> None:
+        """Logs the estimated input tokens before and after the policy to the token usage log."""
+        logging.info(
+            "TOKEN_USAGE - History Policy - "
+            f"Model Calls: {self.model_calls}, "
+            f"Compactions: {self.compactions}, "
+            f"Input Tokens Before (est.): {self.tokens_before}, "
+            f"Input Tokens After (est.): {self.tokens_after}, "
+            f"Saved Tokens (est.): {self.tokens_before - self.tokens_after}, "
+            f"Filter Time: {self.duration * 1000:.1f}ms"
+        )
+
+
+def create_run_config(**kwargs):
+    """
+    Returns the RunConfig of an agent run with the history policy applied,
+    and its HistoryFilter, which is None if the policy is disabled.
+    """
+    policy = get_history_policy()
+    history_filter = HistoryFilter(policy) if policy is not None else None
+    return RunConfig(call_model_input_filter=history_filter, **kwargs), history_filter
@@ -1,5 +1,8 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 
 class ImportantLogFilter(logging.Filter):
@@ -25,14 +28,99 @@ class UsageLogFilter(logging.Filter):
         """
         return "TOKEN_USAGE" in record.getMessage()
 
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    This handler hands records over to a bounded queue that is drained by a
+    QueueListener on a background thread, so formatting and writing logs
+    never happens on the asyncio event loop. When the queue is full, the
+    'drop' policy never waits: it discards records below WARNING right away,
+    and a WARNING or above takes the place of the oldest queued record below
+    WARNING instead, or is discarded if there is none. The 'block' policy
+    applies backpressure by waiting for free space for up to `block_timeout`
+    seconds before discarding the record.
+    """
+    def __init__(self, log_queue, policy="drop", block_timeout=0.1):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING or not self._replace_queued_record(record):
+                self.dropped += 1
+
+    def _replace_queued_record(self, record):
+        """
+        Puts a record in place of the oldest queued record below WARNING,
+        which is discarded. Returns False if there is no such record.
+        """
+        log_queue = self.queue
+        with log_queue.mutex:
+            for i, queued in enumerate(log_queue.queue):
+                if isinstance(queued, logging.LogRecord) and queued.levelno < logging.WARNING:
+                    del log_queue.queue[i]
+                    log_queue.queue.append(record)
+                    log_queue.not_empty.notify()
+                    self.dropped += 1
+                    return True
+        return False
+
+class BoundedQueueListener(logging.handlers.QueueListener):
+    """
+    A QueueListener that does not fail to stop when the queue is full.
+    """
+    def stop(self, timeout=5.0):
+        """
+        Stops the listener thread once it has handled the records enqueued so
+        far. If the queue stays full, the thread is left to the interpreter
+        with a warning, and the records still queued are lost.
+        """
+        try:
+            self.queue.put(self._sentinel, timeout=timeout)
+        except queue.Full:
+            print("WARNING: Could not stop the log queue listener because the log queue was full.")
+        else:
+            self._thread.join()
+        self._thread = None
+
+# The listener draining the log queue when queued logging is enabled
+_queue_listener = None
+_queue_handler = None
+
+def _stop_queue_listener():
+    """
+    Flushes the log queue and stops its listener thread, reporting any
+    records that had to be dropped.
+    """
+    global _queue_listener, _queue_handler
+    if _queue_listener is None:
+        return
+    _queue_listener.stop()
+    if _queue_handler.dropped:
+        print(f"WARNING: Dropped {_queue_handler.dropped} log records because the log queue was full.")
+    _queue_listener = None
+    _queue_handler = None
+
+atexit.register(_stop_queue_listener)
+
 def setup_logging():
     """
     Sets up logging for the application.
     This includes creating a logs directory, setting up file handlers for
     a full log and a summary log, and a stream handler for console output.
     The log file mode (append or write) is controlled by the LOG_FILE_MODE
-    environment variable.
+    environment variable. Setting LOG_QUEUE to 1 moves all handlers onto a
+    background listener thread behind a bounded queue, whose size and
+    drop/block policy are controlled by LOG_QUEUE_SIZE and LOG_QUEUE_POLICY.
     """
+    global _queue_listener, _queue_handler
+
     log_dir = "logs"
     os.makedirs(log_dir, exist_ok=True)
     log_file_mode = os.getenv("LOG_FILE_MODE", "a").lower()
@@ -41,6 +129,14 @@ def setup_logging():
             f"Invalid LOG_FILE_MODE '{log_file_mode}', defaulting to 'a' (append)."
         )
         log_file_mode = "a"
+    use_log_queue = os.getenv("LOG_QUEUE", "0").lower() in ["1", "true", "yes"]
+    log_queue_policy = os.getenv("LOG_QUEUE_POLICY", "drop").lower()
+    if log_queue_policy not in ["drop", "block"]:
+        print(
+            f"Invalid LOG_QUEUE_POLICY '{log_queue_policy}', defaulting to 'drop'."
+        )
+        log_queue_policy = "drop"
+    log_queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
     log_file = os.path.join(log_dir, "mcp.log")
 
@@ -70,14 +166,26 @@ def setup_logging():
     # Configure the root logger, which will receive messages from all child loggers.
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
-    # Remove any existing handlers to start fresh
+    # Remove any existing handlers to start fresh, flushing the log queue of
+    # a previous setup first
+    _stop_queue_listener()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
-    # Add our configured handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(stream_handler)
-    root_logger.addHandler(summary_handler)
-    root_logger.addHandler(usage_handler)
+    handlers = [file_handler, stream_handler, summary_handler, usage_handler]
+    if use_log_queue:
+        # Hand records over to a background thread that runs our handlers
+        _queue_handler = BoundedQueueHandler(
+            queue.Queue(maxsize=log_queue_size), policy=log_queue_policy
+        )
+        _queue_listener = BoundedQueueListener(
+            _queue_handler.queue, *handlers, respect_handler_level=True
+        )
+        _queue_listener.start()
+        root_logger.addHandler(_queue_handler)
+    else:
+        # Add our configured handlers
+        for handler in handlers:
+            root_logger.addHandler(handler)
 
     # --- Library Logger Configuration ---
     # Ensure library loggers are set to DEBUG and propagate their messages to root.
@@ -90,6 +198,6 @@ def setup_logging():
             logger.removeHandler(handler)
 
     logging.info(
-        f"Logging configured. Full log: '{log_file}', Summary log: '{summary_log_file}', Token Usage log: '{usage_log_file}', Mode: '{log_file_mode}'."
+        f"Logging configured. Full log: '{log_file}', Summary log: '{summary_log_file}', Token Usage log: '{usage_log_file}', Mode: '{log_file_mode}', Queue: '{log_queue_policy if use_log_queue else 'off'}'."
     )
 
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import httpx
+
+
+# The default file recorded model responses are stored in
+DEFAULT_CASSETTE_FILE = os.path.join(".cache", "model_cassette.jsonl")
+
+# The request fields that determine a model's response
+KEY_FIELDS = ["model", "messages", "input", "instructions", "tools", "tool_choice", "response_format", "text"]
+
+
+def get_record_mode() -> str:
+    """
+    Returns the record/replay mode set via the MODEL_RECORD_MODE variable:
+    'off' (Default), 'record' or 'replay'.
+    """
+    mode = os.getenv("MODEL_RECORD_MODE", "off").lower()
+    if mode not in ["off", "record", "replay"]:
+        raise ValueError(f"Invalid MODEL_RECORD_MODE '{mode}'. Use 'off', 'record' or 'replay'.")
+    return mode
+
+
+def get_request_key(path: str, body: dict) -> str:
+    """
+    Returns the canonical hash of a model request. It covers the endpoint,
+    the model, the messages or input items, the tools and the output format,
+    but not fields such as timeouts or metadata that do not change the answer.
+    """
+    canonical = {"path": path}
+    canonical.update({field: body[field] for field in KEY_FIELDS if field in body})
+    data = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    An append-only JSONL store of recorded model responses. A request that
+    was recorded several times, e.g. the same first turn in several trials,
+    is answered with its responses in recorded order, and with the last
+    one once they are used up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._replayed = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+
+    def record(self, key: str, status: int, content_type: str, body: str) -> None:
+        entry = {"key": key, "status": status, "content_type": content_type, "body": body}
+        with self._lock:
+            self.entries.setdefault(key, []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def replay(self, key: str):
+        """Returns the next recorded response for a key, or None if there is none."""
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                return None
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return recorded[min(index, len(recorded) - 1)]
+
+
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    """
+    An httpx transport for the OpenAI client that records model responses to
+    a cassette, or serves them from it without any network access. Only
+    model requests (chat completions and responses) are recorded or
+    replayed; in record mode, all other requests are passed through.
+    """
+
+    MODEL_ENDPOINTS = ("/chat/completions", "/responses")
+
+    def __init__(self, mode: str, cassette: Cassette):
+        self.mode = mode
+        self.cassette = cassette
+        self._transport = httpx.AsyncHTTPTransport() if mode == "record" else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        is_model_request = request.method == "POST" and request.url.path.endswith(self.MODEL_ENDPOINTS)
+        if not is_model_request:
+            if self._transport is None:
+                return self._error_response(404, f"Replay mode does not serve '{request.url.path}'.")
+            return await self._transport.handle_async_request(request)
+
+        key = get_request_key(request.url.path, json.loads(request.content))
+        if self.mode == "replay":
+            entry = self.cassette.replay(key)
+            if entry is None:
+                logging.error(f"No recorded model response for request {key}.")
+                return self._error_response(404, f"No recorded model response for request {key}.")
+            return httpx.Response(
+                entry["status"],
+                headers={"content-type": entry["content_type"]},
+                content=entry["body"].encode("utf-8"),
+            )
+
+        response = await self._transport.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+        if response.status_code == 200:
+            self.cassette.record(
+                key, response.status_code, response.headers.get("content-type", "application/json"), body.decode("utf-8")
+            )
+        # The body is already decoded, so drop the headers describing its encoding on the wire
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in ["content-encoding", "content-length", "transfer-encoding"]
+        }
+        return httpx.Response(response.status_code, headers=headers, content=body)
+
+    @staticmethod
+    def _error_response(status: int, message: str) -> httpx.Response:
+        # A 404 is not retried by the OpenAI client, so a replay miss fails fast
+        return httpx.Response(status, json={"error": {"message": message, "type": "replay_error"}})
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+def create_http_client():
+    """
+    Returns an httpx client that records or replays model calls as set via
+    the MODEL_RECORD_MODE and MODEL_CASSETTE variables, or None if the mode
+    is 'off' and the OpenAI client should use its default.
+    """
+    mode = get_record_mode()
+    if mode == "off":
+        return None
+    cassette = Cassette(os.getenv("MODEL_CASSETTE", DEFAULT_CASSETTE_FILE))
+    if mode == "replay" and not cassette.entries:
+        raise ValueError(f"Cannot replay model calls: the cassette '{cassette.path}' is empty or missing.")
+    return httpx.AsyncClient(transport=RecordReplayTransport(mode, cassette), timeout=httpx.Timeout(600.0))
@@ -1,8 +1,39 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Optional
 import os
 from openai import AsyncOpenAI
-from agents import set_default_openai_client, set_tracing_disabled, set_default_openai_api
+from agents import (
+    Model,
+    OpenAIChatCompletionsModel,
+    OpenAIResponsesModel,
+    set_default_openai_client,
+    set_tracing_disabled,
+    set_default_openai_api,
+)
+from hedged_model import HedgedModel
+from model_recorder import create_http_client, get_record_mode
+from stub_model import create_stub_http_client
+
+
+@dataclass
+class RequestPolicy:
+    """
+    A dataclass to hold the request policy of a model: the deadline of each
+    call in seconds, the retries with jittered exponential backoff within it,
+    and optionally hedging. With a fallback model, a request the model has
+    not answered by its observed latency percentile is also sent to the
+    fallback, and the first valid response wins. Until `hedge_min_samples`
+    latencies were observed, `hedge_delay` seconds are used instead.
+    """
+
+    deadline: float = 120.0
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    fallback: Optional[str] = None
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_delay: float = 10.0
 
 
 @dataclass
@@ -14,6 +45,14 @@ class ModelConfig:
     model_string: str
     api_key_env: Optional[str] = None
     base_url: Optional[str] = None
+    # Whether the model may call several tools in one turn, which the agent then runs concurrently.
+    # None leaves the provider's default, as not every provider accepts the parameter.
+    parallel_tool_calls: Optional[bool] = None
+    # The models of individual stages, e.g. {"discovery": "llama3"}, by their names in MODELS.
+    # Stages that are not listed use this model.
+    stage_models: Optional[dict] = None
+    # The deadline, retries and hedging of every request to this model
+    request_policy: Optional[RequestPolicy] = None
 
 
 # A dictionary mapping a friendly name to its configuration.
@@ -23,6 +62,7 @@ MODELS = {
         name="gpt-4o",
         provider="openai",
         model_string="gpt-4o",
+        parallel_tool_calls=True,
         api_key_env="OPENAI_API_KEY",
     ),
     "claude-3.5-sonnet": ModelConfig(
@@ -51,8 +91,44 @@ MODELS = {
         model_string="litellm/deepseek/deepseek-coder",
         api_key_env="DEEPSEEK_API_KEY",
     ),
+    "stub": ModelConfig(
+        name="stub",
+        provider="stub",
+        # A scripted in-process model, for measuring the framework without model latency
+        model_string="stub",
+        parallel_tool_calls=True,
+    ),
+    "gpt-4o+llama3-discovery": ModelConfig(
+        name="gpt-4o+llama3-discovery",
+        provider="openai",
+        model_string="gpt-4o",
+        parallel_tool_calls=True,
+        api_key_env="OPENAI_API_KEY",
+        # Server discovery is a simple retrieval task, which a small local model handles well
+        stage_models={"discovery": "llama3"},
+    ),
+    "gpt-4o-hedged": ModelConfig(
+        name="gpt-4o-hedged",
+        provider="openai",
+        model_string="gpt-4o",
+        parallel_tool_calls=True,
+        api_key_env="OPENAI_API_KEY",
+        # Requests gpt-4o has not answered by its p95 latency are also sent to DeepSeek
+        request_policy=RequestPolicy(deadline=90.0, fallback="deepseek-chat"),
+    ),
+    "stub-hedged": ModelConfig(
+        name="stub-hedged",
+        provider="stub",
+        model_string="stub",
+        parallel_tool_calls=True,
+        # For testing the request policy locally, e.g. with STUB_MODEL_JITTER_MS and STUB_MODEL_ERROR_RATE
+        request_policy=RequestPolicy(deadline=30.0, fallback="stub", hedge_min_samples=10, hedge_delay=1.0),
+    ),
 }
 
+# The stages of the architectures that can run on a model of their own
+STAGES = ["discovery", "booking"]
+
 
 def get_model_config(name: str) -> ModelConfig:
     """Retrieves the configuration for a given model name."""
@@ -63,25 +139,148 @@ def get_model_config(name: str) -> ModelConfig:
     return MODELS[name]
 
 
-def setup_model_client(config: ModelConfig):
+def with_stage_models(config: ModelConfig, stage_models: dict) -> ModelConfig:
     """
-    Configures the appropriate client and settings for the given model config.
+    Returns a copy of a model config whose stages run on the given models,
+    e.g. {"discovery": "llama3"}. The copy is named after its stage models.
     """
-    # 1. Check for the required API key in environment variables.
-    if config.api_key_env and not os.getenv(config.api_key_env):
+    stage_models = {stage: name for stage, name in stage_models.items() if name}
+    if not stage_models:
+        return config
+    for name in stage_models.values():
+        get_model_config(name)
+    merged = {**(config.stage_models or {}), **stage_models}
+    suffix = ",".join(f"{stage}={name}" for stage, name in sorted(merged.items()))
+    return replace(config, name=f"{config.name.split('+')[0]}+{suffix}", stage_models=merged)
+
+
+def get_stage_config(config: ModelConfig, stage: str) -> ModelConfig:
+    """Returns the config of the model a stage runs on."""
+    if config.stage_models and stage in config.stage_models:
+        return get_model_config(config.stage_models[stage])
+    return config
+
+
+def get_all_configs(config: ModelConfig) -> list:
+    """Returns a model config and the configs of its stage and fallback models."""
+    configs = [config]
+    for name in (config.stage_models or {}).values():
+        stage_config = get_model_config(name)
+        if stage_config not in configs:
+            configs.append(stage_config)
+    for stage_config in list(configs):
+        if stage_config.request_policy and stage_config.request_policy.fallback:
+            fallback_config = get_model_config(stage_config.request_policy.fallback)
+            if fallback_config not in configs:
+                configs.append(fallback_config)
+    return configs
+
+
+def check_api_key(config: ModelConfig):
+    """Raises a ValueError if the API key a model needs is not set."""
+    # Replayed model calls are served offline, so no key is needed for them.
+    if config.api_key_env and not os.getenv(config.api_key_env) and get_record_mode() != "replay":
         raise ValueError(
             f"API key environment variable '{config.api_key_env}' not set."
         )
 
+
+# The OpenAI clients created by get_openai_client, by model name
+_openai_clients = {}
+
+
+def get_openai_client(config: ModelConfig):
+    """
+    Returns the OpenAI client for a model, or None if it is used via LiteLLM.
+    Clients are created once per model.
+    """
+    if config.name in _openai_clients:
+        return _openai_clients[config.name]
+
+    if config.provider == "ollama":
+        # For local models via Ollama or other custom endpoints
+        client = AsyncOpenAI(base_url=config.base_url, api_key="ollama", http_client=create_http_client())
+    elif config.provider == "stub":
+        # For the scripted in-process model, which needs no network access
+        # It does not retry, so that simulated failures reach the request policy
+        client = AsyncOpenAI(
+            base_url="http://stub.invalid/v1",
+            api_key="stub",
+            http_client=create_stub_http_client(),
+            max_retries=0,
+        )
+    elif config.provider == "openai":
+        # Route the model calls through the record/replay transport, if it is enabled
+        client = AsyncOpenAI(
+            api_key=os.getenv(config.api_key_env) or "replay", http_client=create_http_client()
+        )
+    else:
+        client = None
+    _openai_clients[config.name] = client
+    return client
+
+
+def build_model(config: ModelConfig) -> Model:
+    """
+    Returns a Model object for an agent, with its own provider client, so
+    that agents of one process can run on models of different providers at
+    the same time regardless of the default client. If the model has a
+    request policy, the model is wrapped in a HedgedModel applying it.
+    """
+    if config.request_policy is not None:
+        policy = config.request_policy
+        fallback = build_model(get_model_config(policy.fallback)) if policy.fallback else None
+        fallback_parallel_tool_calls = get_model_config(policy.fallback).parallel_tool_calls if policy.fallback else None
+        return HedgedModel(
+            config.name,
+            build_model(replace(config, request_policy=None)),
+            policy,
+            policy.fallback,
+            fallback,
+            fallback_parallel_tool_calls,
+        )
+
+    check_api_key(config)
+    if config.model_string.startswith("litellm/"):
+        # Imported here, as LiteLLM is an optional extra that is slow to import
+        from agents.extensions.models.litellm_model import LitellmModel
+
+        return LitellmModel(
+            model=config.model_string[len("litellm/"):],
+            base_url=config.base_url,
+            api_key=os.getenv(config.api_key_env) if config.api_key_env else None,
+        )
+
+    client = get_openai_client(config)
+    if config.provider == "openai":
+        return OpenAIResponsesModel(model=config.model_string, openai_client=client)
+    return OpenAIChatCompletionsModel(model=config.model_string, openai_client=client)
+
+
+def setup_model_client(config: ModelConfig):
+    """
+    Configures the appropriate client and settings for the given model config.
+    """
+    record_mode = get_record_mode()
+
+    # 1. Check for the required API key in environment variables.
+    check_api_key(config)
+
     # 2. Configure the client based on the provider.
     if config.provider == "ollama":
         # For local models via Ollama or other custom endpoints
-        custom_client = AsyncOpenAI(base_url=config.base_url, api_key="ollama")
-        set_default_openai_client(custom_client)
+        set_default_openai_client(get_openai_client(config))
         set_tracing_disabled(True)
         set_default_openai_api("chat_completions")
         print(f"INFO: Configured to use Ollama model '{config.name}' via {config.base_url}")
 
+    elif config.provider == "stub":
+        # For the scripted in-process model, which needs no network access
+        set_default_openai_client(get_openai_client(config))
+        set_tracing_disabled(True)
+        set_default_openai_api("chat_completions")
+        print(f"INFO: Configured to use the scripted stub model '{config.name}'")
+
     elif config.provider in ["anthropic", "deepseek"]:
         # For models used via LiteLLM
         set_tracing_disabled(True)
@@ -89,12 +288,20 @@ def setup_model_client(config: ModelConfig):
         print(
             f"INFO: Configured to use {config.provider.capitalize()} model '{config.name}' via LiteLLM"
         )
+        if record_mode != "off":
+            print(f"WARNING: MODEL_RECORD_MODE '{record_mode}' is not supported for models used via LiteLLM")
 
     elif config.provider == "openai":
-        # For OpenAI models, the SDK defaults work well, so we just ensure
-        # tracing is enabled and the client is not overridden.
-        # set_tracing_disabled(False) # Optional: ensure tracing is on
-        print(f"INFO: Configured to use OpenAI model '{config.name}'")
+        if record_mode != "off":
+            # Route the model calls through the record/replay transport
+            set_default_openai_client(get_openai_client(config))
+            set_tracing_disabled(record_mode == "replay")
+            print(f"INFO: Configured to use OpenAI model '{config.name}' in {record_mode} mode")
+        else:
+            # For OpenAI models, the SDK defaults work well, so we just ensure
+            # tracing is enabled and the client is not overridden.
+            # set_tracing_disabled(False) # Optional: ensure tracing is on
+            print(f"INFO: Configured to use OpenAI model '{config.name}'")
 
     else:
         # This can be expanded for other providers
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from metrics import MCP_POOL_LEASE_WAIT, MCP_POOL_LEASES
+
+
+def get_replica_count() -> int:
+    """Returns the number of replicas per MCP server, set via MCP_REPLICAS (Default: 1)."""
+    return max(1, int(os.getenv("MCP_REPLICAS", "1")))
+
+
+def get_max_leases() -> int:
+    """
+    Returns the maximum number of concurrent requests per replica set, set
+    via MCP_REPLICA_MAX_LEASES (Default: 0, unlimited).
+    """
+    return int(os.getenv("MCP_REPLICA_MAX_LEASES", "0"))
+
+
+class ReplicaPool:
+    """
+    A pool of replica sets of the MCP servers. A replica set holds one
+    instance of every server, e.g. {'booking_server': ..., ...}. A request
+    leases a whole set, so all of its tool calls go to the same instances,
+    and the set with the fewest active leases is chosen. With `max_leases`,
+    a request waits while every set has that many leases.
+    """
+
+    def __init__(self, replica_sets: list, max_leases: int = 0):
+        self.replica_sets = replica_sets
+        self.max_leases = max_leases
+        self.leases = [0] * len(replica_sets)
+        self.total_leases = 0
+        self.peak_leases = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._condition = asyncio.Condition()
+        self._next = 0
+
+    def _pick(self):
+        """Returns the index of the least-loaded replica set, or None if all are full."""
+        candidates = [
+            i for i, leases in enumerate(self.leases) if not self.max_leases or leases < self.max_leases
+        ]
+        if not candidates:
+            return None
+        fewest = min(self.leases[i] for i in candidates)
+        # Rotate among the equally loaded sets, so idle sets take turns
+        tied = [i for i in candidates if self.leases[i] == fewest]
+        index = min(tied, key=lambda i: (i - self._next) % len(self.leases))
+        self._next = (index + 1) % len(self.leases)
+        return index
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """Leases the least-loaded replica set and yields its servers by name."""
+        start = time.perf_counter()
+        async with self._condition:
+            index = self._pick()
+            while index is None:
+                await self._condition.wait()
+                index = self._pick()
+            self.leases[index] += 1
+        wait = time.perf_counter() - start
+
+        self.total_leases += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.peak_leases = max(self.peak_leases, sum(self.leases))
+        MCP_POOL_LEASES.inc(replica=index)
+        MCP_POOL_LEASE_WAIT.observe(wait)
+        logging.info(
+            "MCP Pool - "
+            f"Replica: {index + 1}/{len(self.replica_sets)}, "
+            f"Wait: {wait * 1000:.0f}ms, "
+            f"Occupancy: {self.get_occupancy():.0%}, "
+            f"Leases: {self.leases}"
+        )
+        try:
+            yield self.replica_sets[index]
+        finally:
+            async with self._condition:
+                self.leases[index] -= 1
+                self._condition.notify_all()
+            MCP_POOL_LEASES.dec(replica=index)
+
+    def get_occupancy(self) -> float:
+        """Returns the share of the pool's capacity in use, or of its sets in use if leases are unlimited."""
+        if self.max_leases:
+            return sum(self.leases) / (self.max_leases * len(self.leases))
+        return sum(1 for leases in self.leases if leases) / len(self.leases)
+
+    def get_servers(self) -> list:
+        """Returns all servers of all replica sets."""
+        return [server for replica_set in self.replica_sets for server in replica_set.values()]
+
+    def log_stats(self) -> None:
+        """Logs the number of leases, the peak of concurrent leases and the time waited for them."""
+        mean_wait = self.total_wait / self.total_leases if self.total_leases else 0.0
+        logging.info(
+            "MCP Pool - "
+            f"Replica Sets: {len(self.replica_sets)}, "
+            f"Leases: {self.total_leases}, "
+            f"Peak Concurrent Leases: {self.peak_leases}, "
+            f"Mean Wait: {mean_wait * 1000:.0f}ms, "
+            f"Max Wait: {self.max_wait * 1000:.0f}ms"
+        )
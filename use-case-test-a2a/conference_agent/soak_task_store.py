@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from uuid import uuid4
+
+from a2a.server.tasks import InMemoryTaskStore
+from a2a.types import Message, Part, Role, Task, TaskState, TaskStatus, TextPart
+from task_store import BoundedTaskStore
+
+
+def create_message(text: str, role: Role, task_id: str, context_id: str) -> Message:
+    return Message(
+        role=role,
+        parts=[Part(root=TextPart(text=text))],
+        message_id=uuid4().hex,
+        task_id=task_id,
+        context_id=context_id,
+    )
+
+
+async def run_task(store, answer: str) -> str:
+    """Saves a task through the states a request goes through, like the request handler does."""
+    task_id, context_id = uuid4().hex, uuid4().hex
+    query = create_message("Book me a trip to ISWC 2025 from Vienna.", Role.user, task_id, context_id)
+    task = Task(
+        id=task_id,
+        context_id=context_id,
+        status=TaskStatus(state=TaskState.submitted),
+        history=[query],
+    )
+    await store.save(task)
+    for state in (TaskState.working, TaskState.completed):
+        message = create_message(answer, Role.agent, task_id, context_id)
+        task = task.model_copy(update={"status": TaskStatus(state=state, message=message)})
+        await store.save(task)
+        await store.get(task_id)
+    return task_id
+
+
+async def soak(args) -> None:
+    """
+    Saves `--tasks` tasks to the selected task store, reading back an old
+    task now and then, and prints the memory held by the process at regular
+    intervals.
+    """
+    db_path = None
+    if args.store == "memory":
+        store = InMemoryTaskStore()
+    else:
+        if args.store == "sqlite":
+            db_path = os.path.join(tempfile.mkdtemp(), "tasks.sqlite")
+        store = BoundedTaskStore(max_tasks=args.max_tasks, ttl=args.ttl, db_path=db_path)
+
+    answer = "x" * args.answer_chars
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_task_id = None
+    print(f"{'Tasks':>8} {'Memory MiB':>11} {'Peak MiB':>9} {'Tasks/s':>9} {'Old Task Found':>15}")
+    for i in range(1, args.tasks + 1):
+        task_id = await run_task(store, answer)
+        first_task_id = first_task_id or task_id
+        if i % args.report_every == 0:
+            # Read back the oldest task, which was evicted from memory by now
+            found = await store.get(first_task_id) is not None
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                f"{i:>8} {current / 2**20:>11.1f} {peak / 2**20:>9.1f} "
+                f"{i / (time.perf_counter() - start):>9.0f} {str(found):>15}"
+            )
+    tracemalloc.stop()
+
+    if isinstance(store, BoundedTaskStore):
+        await store.close()
+    if db_path is not None:
+        print(f"\nSQLite file: '{db_path}' ({os.path.getsize(db_path) / 2**20:.1f} MiB)")
+
+
+def main():
+    """Soak-tests a task store with a steady stream of tasks to check that its memory use stays flat."""
+    parser = argparse.ArgumentParser(description="Soak-test a task store with a steady stream of tasks.")
+    parser.add_argument(
+        "--store", choices=["memory", "bounded", "sqlite"], default="sqlite", help="The task store. Defaults to sqlite."
+    )
+    parser.add_argument("--tasks", type=int, default=50000, help="The number of tasks. Defaults to 50000.")
+    parser.add_argument("--max-tasks", type=int, default=1000, help="The finished tasks kept in memory. Defaults to 1000.")
+    parser.add_argument("--ttl", type=float, default=3600, help="The TTL of finished tasks in seconds. Defaults to 3600.")
+    parser.add_argument("--answer-chars", type=int, default=2000, help="The size of each answer. Defaults to 2000.")
+    parser.add_argument("--report-every", type=int, default=5000, help="Print the memory every n tasks. Defaults to 5000.")
+    asyncio.run(soak(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from a2a.server.tasks import TaskStore
+from a2a.types import Task, TaskState
+
+
+# The states after which a task does not change anymore, so it may be evicted
+TERMINAL_STATES = {TaskState.completed, TaskState.canceled, TaskState.failed, TaskState.rejected}
+
+# The number of full batches of pending writes after which save() waits for a flush
+MAX_PENDING_BATCHES = 4
+
+# The default location of the SQLite file of the 'sqlite' task store
+DEFAULT_TASK_DB = os.path.join(".cache", "tasks.sqlite")
+
+
+class BoundedTaskStore(TaskStore):
+    """
+    A TaskStore that keeps at most `max_tasks` finished tasks in memory and
+    evicts the least recently used one beyond that, as well as finished
+    tasks not accessed for `ttl` seconds. Tasks that are still running are
+    never evicted.
+
+    With a `db_path`, finished tasks are written to a SQLite file, so that
+    evicted tasks can still be read and tasks survive a restart. The writes
+    are collected and flushed in batches of up to `batch_size` tasks at least
+    every `flush_interval` seconds by a background task, on a worker thread,
+    so request handling only waits for the disk if the writes fall behind.
+    """
+
+    def __init__(
+        self,
+        max_tasks: int = 1000,
+        ttl: float = 3600,
+        db_path: str = None,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+    ):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.evicted = 0
+        self.expired = 0
+        self.written = 0
+        self.batches = 0
+        self.disk_reads = 0
+        self._active = {}
+        self._finished = OrderedDict()
+        self._pending_writes = {}
+        self._flush_requested = asyncio.Event()
+        self._flusher = None
+        self._db = None
+        self._db_lock = asyncio.Lock()
+        if db_path is not None:
+            self._db = self._open_db(db_path)
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The connection is only used by one worker thread at a time, guarded by _db_lock
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks "
+            "(id TEXT PRIMARY KEY, context_id TEXT, state TEXT, updated REAL, data TEXT)"
+        )
+        db.commit()
+        return db
+
+    async def save(self, task: Task, context=None) -> None:
+        if task.status.state not in TERMINAL_STATES:
+            self._active[task.id] = task
+            return
+
+        self._active.pop(task.id, None)
+        self._finished[task.id] = (task, time.monotonic())
+        self._finished.move_to_end(task.id)
+        if self._db is not None:
+            self._pending_writes[task.id] = task
+            self._start_flusher()
+            if len(self._pending_writes) >= MAX_PENDING_BATCHES * self.batch_size:
+                # The background flush falls behind, so write on the caller's time to bound memory
+                await self.flush()
+            elif len(self._pending_writes) >= self.batch_size:
+                self._flush_requested.set()
+        self._evict()
+
+    async def get(self, task_id: str, context=None):
+        task = self._active.get(task_id)
+        if task is not None:
+            return task
+
+        entry = self._finished.get(task_id)
+        if entry is not None:
+            self._finished[task_id] = (entry[0], time.monotonic())
+            self._finished.move_to_end(task_id)
+            return entry[0]
+
+        task = self._pending_writes.get(task_id)
+        if task is not None or self._db is None:
+            return task
+        async with self._db_lock:
+            row = await asyncio.to_thread(self._read, task_id)
+        self.disk_reads += 1
+        return Task.model_validate_json(row[0]) if row is not None else None
+
+    async def delete(self, task_id: str, context=None) -> None:
+        self._active.pop(task_id, None)
+        self._finished.pop(task_id, None)
+        self._pending_writes.pop(task_id, None)
+        if self._db is not None:
+            async with self._db_lock:
+                await asyncio.to_thread(self._delete, task_id)
+
+    def _evict(self) -> None:
+        """Evicts the least recently used finished tasks beyond max_tasks and those older than ttl."""
+        while len(self._finished) > self.max_tasks:
+            self._finished.popitem(last=False)
+            self.evicted += 1
+        expiry = time.monotonic() - self.ttl
+        while self._finished:
+            task_id, (_, accessed) = next(iter(self._finished.items()))
+            if accessed > expiry:
+                break
+            del self._finished[task_id]
+            self.expired += 1
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Writing tasks to '{self.db_path}' failed: {e}")
+
+    async def flush(self) -> None:
+        """Writes the pending finished tasks to the SQLite file, in batches."""
+        while self._pending_writes and self._db is not None:
+            batch = []
+            for task_id in list(self._pending_writes)[: self.batch_size]:
+                batch.append(self._pending_writes.pop(task_id))
+            rows = [
+                (task.id, task.context_id, task.status.state.value, time.time(), task.model_dump_json())
+                for task in batch
+            ]
+            async with self._db_lock:
+                await asyncio.to_thread(self._write, rows)
+            self.written += len(rows)
+            self.batches += 1
+
+    def _write(self, rows: list) -> None:
+        self._db.executemany("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?)", rows)
+        self._db.commit()
+
+    def _read(self, task_id: str):
+        return self._db.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+
+    def _delete(self, task_id: str) -> None:
+        self._db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        self._db.commit()
+
+    async def close(self) -> None:
+        """Writes all pending tasks, stops the background flush and closes the SQLite file."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        self.log_stats()
+
+    def log_stats(self) -> None:
+        """Logs the number of tasks in memory, the tasks evicted and the writes to the SQLite file."""
+        logging.info(
+            "Task Store - "
+            f"Running: {len(self._active)}, "
+            f"Finished In Memory: {len(self._finished)}, "
+            f"Evicted: {self.evicted}, "
+            f"Expired: {self.expired}, "
+            f"Written: {self.written} in {self.batches} batch(es), "
+            f"Disk Reads: {self.disk_reads}"
+        )
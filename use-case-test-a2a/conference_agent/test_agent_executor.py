@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+from uuid import uuid4
+
+from agents.mcp import MCPServer
+from mcp.types import CallToolResult, TextContent, Tool
+from a2a.server.agent_execution import RequestContext
+from a2a.server.events import EventQueue
+from a2a.types import Message, MessageSendParams, Part, Role, TaskState, TaskStatusUpdateEvent, TextPart
+from agent_executor import ConferenceAgentExecutor
+
+
+# The tools the scripted ESWC 2025 flow of the stub model calls
+TOOL_NAMES = [
+    "search_conferences",
+    "get_conference_details",
+    "get_coordinates",
+    "get_nearest_airports",
+    "search_flight_offers",
+    "search_hotels_by_geocode",
+    "book_flight",
+    "book_hotel",
+]
+
+
+class SlowMCPServer(MCPServer):
+    """An in-process MCP server whose 'search_conferences' tool blocks until it is released."""
+
+    def __init__(self, name: str, tool_names: list):
+        super().__init__()
+        self._name = name
+        self.tool_names = tool_names
+        self.tool_started = asyncio.Event()
+        self.release_tool = asyncio.Event()
+        self.calls_running = 0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def connect(self):
+        pass
+
+    async def cleanup(self):
+        pass
+
+    async def list_tools(self, run_context=None, agent=None):
+        return [Tool(name=name, inputSchema={"type": "object", "properties": {}}) for name in self.tool_names]
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        self.calls_running += 1
+        try:
+            if tool_name == "search_conferences":
+                self.tool_started.set()
+                await self.release_tool.wait()
+            return CallToolResult(content=[TextContent(type="text", text="{}")])
+        finally:
+            self.calls_running -= 1
+
+    async def list_prompts(self):
+        raise NotImplementedError
+
+    async def get_prompt(self, name, arguments=None):
+        raise NotImplementedError
+
+
+class RecordingPool:
+    """A pool with one replica set, which records how many tool calls ran when its lease was released."""
+
+    def __init__(self):
+        self.server = SlowMCPServer("conferences", TOOL_NAMES)
+        self.servers = {
+            "conferences_server": self.server,
+            "conference_server": SlowMCPServer("conference", []),
+            "booking_server": SlowMCPServer("booking", []),
+        }
+        self.calls_running_at_release = None
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        try:
+            yield self.servers
+        finally:
+            self.calls_running_at_release = self.server.calls_running
+
+
+def create_context(query: str) -> RequestContext:
+    message = Message(role=Role.user, parts=[Part(root=TextPart(text=query))], message_id=uuid4().hex)
+    return RequestContext(request=MessageSendParams(message=message))
+
+
+async def drain_states(queue: EventQueue) -> list:
+    states = []
+    while not queue.is_closed() or not queue.queue.empty():
+        try:
+            event = queue.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        if isinstance(event, TaskStatusUpdateEvent):
+            states.append(event.status.state)
+    return states
+
+
+def test_cancel_during_tool_call(monkeypatch):
+    """Cancelling a task during a tool call lets the call finish before its MCP servers are released."""
+    monkeypatch.setenv("CONFERENCE_LOOKUP", "0")
+
+    async def run():
+        pool = RecordingPool()
+        executor = ConferenceAgentExecutor({"mcp_pool": pool}, model_name="stub")
+        context = create_context("Book me a trip to ESWC 2025 from Vienna.")
+        queue = EventQueue()
+
+        execution = asyncio.create_task(executor.execute(context, queue))
+        await asyncio.wait_for(pool.server.tool_started.wait(), 10)
+
+        # Cancel like the request handler does: cancel() first, then the execution
+        await executor.cancel(context, queue)
+        execution.cancel()
+        await asyncio.sleep(0.1)
+        # The execution waits for the tool call of the current turn
+        assert not execution.done()
+        pool.server.release_tool.set()
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.wait_for(execution, 10)
+
+        assert pool.calls_running_at_release == 0
+        assert not executor.active_runs
+        states = await drain_states(queue)
+        assert states[-1] == TaskState.canceled
+        assert TaskState.failed not in states
+
+    asyncio.run(run())
+
+
+def test_invalid_deadline_is_rejected(monkeypatch):
+    """A request with a deadline that is not a number is rejected, not failed."""
+    monkeypatch.setenv("CONFERENCE_LOOKUP", "0")
+
+    async def run():
+        pool = RecordingPool()
+        executor = ConferenceAgentExecutor({"mcp_pool": pool}, model_name="stub")
+        context = create_context("Book me a trip to ESWC 2025 from Vienna.")
+        context.message.metadata = {"deadline": "soon"}
+        queue = EventQueue()
+
+        await executor.execute(context, queue)
+
+        states = await drain_states(queue)
+        assert states == [TaskState.rejected]
+        assert pool.calls_running_at_release is None
+
+    asyncio.run(run())
@@ -1,23 +1,90 @@
+import argparse
 import logging
 import asyncio
+import time
 from typing import Any
 from uuid import uuid4
 
 import httpx
 
 from a2a.client import A2ACardResolver, A2AClient
-from a2a.types import MessageSendParams, SendMessageRequest
+from a2a.types import (
+    MessageSendParams,
+    SendMessageRequest,
+    SendStreamingMessageRequest,
+    TaskArtifactUpdateEvent,
+    TaskStatusUpdateEvent,
+)
 from a2a.utils.constants import AGENT_CARD_WELL_KNOWN_PATH
 
 
+def describe_event(event) -> str:
+    """Returns a one-line description of a streamed event."""
+    if isinstance(event, TaskStatusUpdateEvent):
+        message = event.status.message
+        text = "".join(getattr(part.root, "text", "") for part in message.parts) if message else ""
+        return f"status {event.status.state.value}: {text}"
+    if isinstance(event, TaskArtifactUpdateEvent):
+        text = "".join(getattr(part.root, "text", "") for part in event.artifact.parts)
+        return f"artifact {event.artifact.name}: {text!r}"
+    return f"{type(event).__name__}"
+
+
+async def send_streaming(client: A2AClient, send_message_payload: dict) -> None:
+    """
+    Sends the query as a streaming request, prints every event as it
+    arrives and the time to the first event, the first token and the final
+    event.
+    """
+    request = SendStreamingMessageRequest(
+        id=str(uuid4()), params=MessageSendParams(**send_message_payload)
+    )
+
+    start = time.perf_counter()
+    first_event = None
+    first_token = None
+    events = 0
+    print("\n--- Agent Events ---")
+    async for response in client.send_message_streaming(request):
+        elapsed = time.perf_counter() - start
+        event = response.root.result
+        events += 1
+        if first_event is None:
+            first_event = elapsed
+        if first_token is None and isinstance(event, TaskArtifactUpdateEvent):
+            first_token = elapsed
+        print(f"[{elapsed * 1000:8.0f}ms] {describe_event(event)}")
+    total = time.perf_counter() - start
+    print("--- End of Events ---")
+
+    print(f"\nEvents: {events}")
+    print(f"Time to first event: {first_event * 1000:.0f}ms" if first_event is not None else "Time to first event: n/a")
+    print(f"Time to first token: {first_token * 1000:.0f}ms" if first_token is not None else "Time to first token: n/a")
+    print(f"Total time: {total * 1000:.0f}ms")
+
+
 async def main() -> None:
     """
     A simple test client to interact with the Conference A2A Agent.
     """
+    parser = argparse.ArgumentParser(description="Send a conference booking query to the Conference A2A Agent.")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the progress and the answer of the agent and measure the time to the first event.",
+    )
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://localhost:9998",
+        help="The base URL of the agent. Defaults to http://localhost:9998.",
+    )
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
-    base_url = 'http://localhost:9998'
+    base_url = args.url
 
     # The agent can take a while to process, so we set a long timeout.
     async with httpx.AsyncClient(timeout=300.0) as httpx_client:
@@ -63,6 +130,11 @@ async def main() -> None:
             },
         }
 
+        if args.stream:
+            logger.info(f"Sending streaming query: '{query}'")
+            await send_streaming(client, send_message_payload)
+            return
+
         request = SendMessageRequest(
             id=str(uuid4()), params=MessageSendParams(**send_message_payload)
         )
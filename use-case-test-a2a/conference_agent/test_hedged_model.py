@@ -0,0 +1,91 @@
+import asyncio
+import httpx
+import pytest
+from a2a.server.events import EventQueue
+from a2a.types import TaskState
+from agent_executor import ConferenceAgentExecutor
+from hedged_model import HedgedModel, is_retryable
+from models import RequestPolicy
+from test_agent_executor import RecordingPool, create_context, drain_states
+
+
+class ScriptedStreamModel:
+    """A model whose streams yield the given events, after failing with the given errors first."""
+
+    model = "scripted"
+
+    def __init__(self, events: list, errors: list = None, delay: float = 0.0):
+        self.events = events
+        self.errors = list(errors or [])
+        self.delay = delay
+        self.streams = 0
+
+    async def stream_response(self, *args, **kwargs):
+        self.streams += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        for event in self.events:
+            await asyncio.sleep(self.delay)
+            yield event
+
+
+async def collect(model: HedgedModel) -> list:
+    return [event async for event in model.stream_response()]
+
+
+def test_streamed_run_on_hedged_model(monkeypatch):
+    """A streamed agent run on a model with a request policy completes."""
+    monkeypatch.setenv("CONFERENCE_LOOKUP", "0")
+
+    async def run():
+        pool = RecordingPool()
+        pool.server.release_tool.set()
+        executor = ConferenceAgentExecutor({"mcp_pool": pool}, model_name="stub-hedged")
+        queue = EventQueue()
+
+        await executor.execute(create_context("Book me a trip to ESWC 2025 from Vienna."), queue)
+
+        states = await drain_states(queue)
+        assert states[-1] == TaskState.completed
+        assert executor.finished_runs == 1
+
+    asyncio.run(run())
+
+
+def test_stream_is_retried_before_its_first_event():
+    primary = ScriptedStreamModel(["a", "b"], errors=[httpx.ConnectError("refused")])
+    model = HedgedModel("scripted", primary, RequestPolicy(backoff_base=0.01))
+
+    assert asyncio.run(collect(model)) == ["a", "b"]
+    assert primary.streams == 2
+
+
+def test_stream_programming_error_is_not_retried():
+    primary = ScriptedStreamModel(["a"], errors=[ValueError("bad argument")])
+    model = HedgedModel("scripted", primary, RequestPolicy(backoff_base=0.01))
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect(model))
+    assert primary.streams == 1
+
+
+def test_stream_deadline():
+    primary = ScriptedStreamModel(["a", "b"], delay=0.2)
+    model = HedgedModel("scripted", primary, RequestPolicy(deadline=0.1))
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(collect(model))
+
+
+def test_is_retryable():
+    class StatusError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(httpx.ReadTimeout("timed out"))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(ValueError("bad argument"))
+    assert not is_retryable(TypeError("bad argument"))
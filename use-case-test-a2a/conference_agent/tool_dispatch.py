@@ -0,0 +1,54 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+def get_max_in_flight() -> int:
+    """Returns the maximum number of concurrent tool calls per MCP server, set via MCP_MAX_IN_FLIGHT (Default: 4)."""
+    return int(os.getenv("MCP_MAX_IN_FLIGHT", "4"))
+
+
+class InFlightLimiter:
+    """
+    Limits the number of concurrent tool calls on one MCP server. The agent
+    runs the tool calls of a turn concurrently, and calls beyond the limit
+    wait for a free slot instead of queueing up on the server's pipe.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Waits for a free slot and yields the time waited in seconds."""
+        start = time.perf_counter()
+        async with self._semaphore:
+            wait = time.perf_counter() - start
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                yield wait
+            finally:
+                self.in_flight -= 1
+
+
+class ConcurrencyLimitMixin:
+    """
+    A mixin for MCP servers that limits their concurrent tool calls to
+    MCP_MAX_IN_FLIGHT. List it before the server class, e.g.
+    `class LimitedServer(ConcurrencyLimitMixin, MCPServerStdio)`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = InFlightLimiter(get_max_in_flight())
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        async with self.limiter.slot():
+            if meta is None:
+                return await super().call_tool(tool_name, arguments)
+            return await super().call_tool(tool_name, arguments, meta=meta)
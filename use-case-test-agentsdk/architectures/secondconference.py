@@ -2,28 +2,31 @@ import asyncio
 import os
 import logging
 from dotenv import load_dotenv
-from agents import Agent, Runner
-from agents.mcp import MCPServerStdio
+from agents import Agent, ModelSettings, Runner
+from compaction import log_compaction_stats, start_compaction_stats
+from history_policy import create_run_config
+from instrumentation import EventHooks, InstrumentedMCPServerStdio
 from logging_config import setup_logging
-from models import get_model_config, setup_model_client
+from mcp_pool import get_default_pool
+from models import (
+    build_model,
+    get_all_configs,
+    get_model_config,
+    get_stage_config,
+    setup_model_client,
+    with_stage_models,
+)
+from prefetch import start_prefetcher
 
 
 # Load environment variables from a .env file
 load_dotenv()
 
 
-async def main(model_name: str, query: str) -> None:
+def get_server_configs() -> list:
     """
-    This script creates and runs a simple agent that connects to local
-    conference and booking MCP servers using stdio.
+    Returns the configurations of the local conference and booking MCP servers.
     """
-    # Setup logging
-    setup_logging()
-
-    # Get the configuration for the specified model and set up the client.
-    model_config = get_model_config(model_name)
-    setup_model_client(model_config)
-
     # Determine the base directory of the 'agentic-ai-implementations' folder
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 
@@ -38,52 +41,121 @@ async def main(model_name: str, query: str) -> None:
         base_dir, "mcp-server-conference-use-case", "mcp-booking-mock", "build", "index.js"
     )
 
-    # The SDK spawns the process, keeps the pipes open, and closes them
-    # automatically when the context manager exits.
-    async with MCPServerStdio(
-        name="ConferencesServer",
-        params={
-            "command": "node",
-            "args": [conference_discovery_server_script],
+    return [
+        {
+            "name": "ConferencesServer",
+            "params": {
+                "command": "node",
+                "args": [conference_discovery_server_script],
+            },
         },
-    ) as conferences_server, MCPServerStdio(
-        name="ConferenceServer",
-        params={
-            "command": "node",
-            "args": [conference_mediation_helpers_server_script],
+        {
+            "name": "ConferenceServer",
+            "params": {
+                "command": "node",
+                "args": [conference_mediation_helpers_server_script],
+            },
         },
-    ) as conference_server, MCPServerStdio(
-        name="BookingServer",
-        params={
-            "command": "node",
-            "args": [booking_mock_server_script],
+        {
+            "name": "BookingServer",
+            "params": {
+                "command": "node",
+                "args": [booking_mock_server_script],
+            },
         },
-    ) as booking_server:
-        # Define the agent that will use the MCP server
-        agent = Agent(
-            name="Agent",
-            instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
-            mcp_servers=[conferences_server, conference_server, booking_server],
-            model=model_config.model_string,
+    ]
+
+
+async def run_agent(model_config, query: str, mcp_servers: list):
+    """
+    Runs the travel agent on the given, already connected MCP servers.
+    """
+    # Define the agent that will use the MCP server, on the model of the booking stage
+    booking_config = get_stage_config(model_config, "booking")
+    agent = Agent(
+        name="Agent",
+        instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
+        mcp_servers=mcp_servers,
+        model=build_model(booking_config),
+        model_settings=ModelSettings(parallel_tool_calls=booking_config.parallel_tool_calls),
+    )
+
+    # Run the agent with a sample query
+    compaction_stats = start_compaction_stats()
+    run_config, history_filter = create_run_config()
+    prefetcher = start_prefetcher(mcp_servers)
+    try:
+        result = await Runner.run(
+            agent, query, max_turns=15, hooks=EventHooks(max_turns=15), run_config=run_config
         )
+    finally:
+        if prefetcher is not None:
+            await prefetcher.close()
+    logging.info("Agent conversation finished.")
+    logging.info("Final output:")
+    logging.info(result.final_output)
+
+    # Log token usage
+    usage = result.context_wrapper.usage
+    logging.info(
+        "TOKEN_USAGE - "
+        f"Requests: {usage.requests}, "
+        f"Input Tokens: {usage.input_tokens}, "
+        f"Output Tokens: {usage.output_tokens}, "
+        f"Total Tokens: {usage.total_tokens}"
+    )
+    log_compaction_stats(compaction_stats)
+    if history_filter is not None:
+        history_filter.log_stats()
+    return result
+
 
-        # Run the agent with a sample query
-        result = await Runner.run(agent, query, max_turns=15)
-        logging.info("Agent conversation finished.")
-        logging.info("Final output:")
-        logging.info(result.final_output)
-
-        # Log token usage
-        usage = result.context_wrapper.usage
-        logging.info(
-            "TOKEN_USAGE - "
-            f"Requests: {usage.requests}, "
-            f"Input Tokens: {usage.input_tokens}, "
-            f"Output Tokens: {usage.output_tokens}, "
-            f"Total Tokens: {usage.total_tokens}"
+async def run(model_config, query: str):
+    """
+    Creates and runs a simple agent that connects to local conference and
+    booking MCP servers using stdio. Expects logging and the model client to
+    be configured already and returns the agent's run result. If a warm MCP
+    server pool is set up, the servers are leased from it instead of being
+    spawned for this run.
+    """
+    server_configs = get_server_configs()
+
+    pool = get_default_pool()
+    if pool is not None:
+        async with pool.lease(server_configs) as mcp_servers:
+            return await run_agent(model_config, query, mcp_servers)
+
+    # The SDK spawns the process, keeps the pipes open, and closes them
+    # automatically when the context manager exits.
+    conferences_config, conference_config, booking_config = server_configs
+    async with InstrumentedMCPServerStdio(
+        **conferences_config
+    ) as conferences_server, InstrumentedMCPServerStdio(
+        **conference_config
+    ) as conference_server, InstrumentedMCPServerStdio(
+        **booking_config
+    ) as booking_server:
+        return await run_agent(
+            model_config, query, [conferences_server, conference_server, booking_server]
         )
 
 
+async def main(model_name: str, query: str, stage_models: dict = None) -> None:
+    """
+    This script creates and runs a simple agent that connects to local
+    conference and booking MCP servers using stdio.
+    """
+    # Setup logging
+    setup_logging()
+
+    # Get the configuration for the specified model and its stage models and set up their clients.
+    model_config = with_stage_models(get_model_config(model_name), stage_models or {})
+    for config in get_all_configs(model_config):
+        setup_model_client(config)
+
+    await run(model_config, query)
+
+
 if __name__ == "__main__":
     # This script is intended to be run from run_test.py, which provides the query.
     # For standalone testing, you can uncomment the following lines:
@@ -3,139 +3,273 @@ import json
 import logging
 import sys
 import os
+import time
 from dotenv import load_dotenv
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from agents import Agent, Runner
-from agents.mcp import MCPServerStdio
-from logging_config import setup_logging
-from models import get_model_config, setup_model_client
+from agents import Agent, ModelSettings, Runner
+from capability_resolver import resolve_servers
+from compaction import log_compaction_stats, start_compaction_stats
+from discovery_cache import get_discovery_cache, get_registry_hash, is_valid_server_config
+from history_policy import create_run_config
+from instrumentation import EventHooks, InstrumentedMCPServerStdio
+from logging_config import log_event, setup_logging
+from mcp_pool import get_default_pool
+from models import (
+    build_model,
+    get_all_configs,
+    get_model_config,
+    get_stage_config,
+    setup_model_client,
+    with_stage_models,
+)
+from prefetch import start_prefetcher
 
 
 # Load environment variables from a .env file
 load_dotenv()
 
 
+def get_registry_server_script() -> str:
+    """Returns the path of the registry server script."""
+    # Construct the registry server script path relative to the project root
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    return os.path.join(
+        project_root, "mcp-server-conference-use-case", "mpc-registry-conferences", "build", "index.js"
+    )
+
+
+def get_registry_server_config() -> dict:
+    """Returns the configuration of the registry server."""
+    return {
+        "name": "RegistryServer",
+        "params": {"command": "node", "args": [get_registry_server_script()]},
+    }
+
+
 async def discover_servers(
     model_config, query: str, registry_server_script: str
 ) -> list:
     """
     Uses a discovery agent to find the servers required for a given query.
-    Returns a list of server configurations.
+    Returns a list of server configurations. If the local capability
+    resolver is confident, or the discovery cache has a result for the query
+    and the current registry contents, the discovery agent is not run.
+    """
+    start = time.perf_counter()
+    server_configs, method = await find_server_configs(model_config, query, registry_server_script)
+    log_event(
+        "discovery",
+        method=method,
+        duration_ms=round((time.perf_counter() - start) * 1000, 3),
+        servers=len(server_configs),
+    )
+    return server_configs
+
+
+async def find_server_configs(
+    model_config, query: str, registry_server_script: str
+):
+    """
+    Returns the server configurations for a query and how they were found:
+    by the 'resolver', from the 'cache' or by the discovery 'agent'.
+    """
+    server_configs = resolve_servers(registry_server_script, query)
+    if server_configs is not None:
+        logging.info(f"Resolved server configs without the discovery agent: {server_configs}")
+        return server_configs, "resolver"
+
+    discovery_cache = get_discovery_cache()
+    if discovery_cache is not None:
+        registry_hash = get_registry_hash(registry_server_script)
+        server_configs = discovery_cache.get(query, registry_hash)
+        if server_configs is not None:
+            logging.info(f"Using cached server configs: {server_configs}")
+            return server_configs, "cache"
+
+    server_configs = await run_discovery(model_config, query, registry_server_script)
+
+    # Only cache usable results, so a failed discovery is retried on the next run
+    if discovery_cache is not None and server_configs and all(
+        is_valid_server_config(config) for config in server_configs
+    ):
+        discovery_cache.put(query, registry_hash, server_configs)
+    return server_configs, "agent"
+
+
+async def run_discovery(
+    model_config, query: str, registry_server_script: str
+) -> list:
+    """
+    Starts the registry server, or leases it from the warm pool, and runs the
+    discovery agent on it.
     """
     logging.info("Starting server discovery...")
-    # 1. Start the registry server
-    async with MCPServerStdio(
-        name="RegistryServer",
-        params={"command": "node", "args": [registry_server_script]},
-    ) as registry_server:
-        # 2. Create a discovery agent
-        discovery_agent = Agent(
-            name="DiscoveryAgent",
-            instructions=(
-                "You are a discovery agent. Your job is to find ALL MCP servers "
-                "needed to fulfill a user's request. First, analyze the user's query "
-                "to determine what capabilities are needed (e.g., conference search, "
-                "flight booking, hotel booking, helper tools like geocoding). For each "
-                "capability, use the RegistryServer to search for a relevant server. "
-                "After finding all servers, get their addresses. Your final output "
-                "must be only a JSON list of server configurations. Each configuration "
-                "must contain 'name' and 'params' (with 'command' and 'args')."
-            ),
-            mcp_servers=[registry_server],
-            model=model_config.model_string,
-        )
+    registry_config = {
+        "name": "RegistryServer",
+        "params": {"command": "node", "args": [registry_server_script]},
+    }
 
-        # 3. Run the discovery agent
-        discovery_query = (
-            "The user wants to plan a conference trip. The query is: "
-            f"'{query}'. Find all servers needed for this, including conference "
-            "discovery, booking (flights and hotels), and any mediation helpers. "
-            "Return the final list of server configurations as a JSON object."
-        )
-        result = await Runner.run(discovery_agent, discovery_query, max_turns=10)
-
-        # 4. Parse the result and return the server list
-        try:
-            # The output from the agent might have extra text, so we find the JSON
-            json_start = result.final_output.find("[")
-            json_end = result.final_output.rfind("]") + 1
-            json_string = result.final_output[json_start:json_end]
-            server_configs = json.loads(json_string)
-            logging.info(f"Discovered server configs: {server_configs}")
-            return server_configs
-        except (json.JSONDecodeError, IndexError) as e:
-            logging.error(f"Failed to parse server configs from agent output: {e}")
-            logging.error(f"Agent output was: {result.final_output}")
-            return []
-
-
-async def main(model_name: str, query: str) -> None:
+    # 1. Start the registry server, or lease it from the warm pool
+    pool = get_default_pool()
+    if pool is not None:
+        async with pool.lease([registry_config]) as (registry_server,):
+            return await run_discovery_agent(model_config, query, registry_server)
+
+    async with InstrumentedMCPServerStdio(**registry_config) as registry_server:
+        return await run_discovery_agent(model_config, query, registry_server)
+
+
+async def run_discovery_agent(model_config, query: str, registry_server) -> list:
     """
-    This script discovers and runs the necessary MCP servers for a conference
-    booking task, then runs an agent to complete the task.
+    Runs the discovery agent on the connected registry server and returns the
+    list of server configurations it found.
     """
-    # Setup logging
-    setup_logging()
+    # 2. Create a discovery agent, on the model of the discovery stage
+    discovery_config = get_stage_config(model_config, "discovery")
+    discovery_agent = Agent(
+        name="DiscoveryAgent",
+        instructions=(
+            "You are a discovery agent. Your job is to find ALL MCP servers "
+            "needed to fulfill a user's request. First, analyze the user's query "
+            "to determine what capabilities are needed (e.g., conference search, "
+            "flight booking, hotel booking, helper tools like geocoding). For each "
+            "capability, use the RegistryServer to search for a relevant server. "
+            "After finding all servers, get their addresses. Your final output "
+            "must be only a JSON list of server configurations. Each configuration "
+            "must contain 'name' and 'params' (with 'command' and 'args')."
+        ),
+        mcp_servers=[registry_server],
+        model=build_model(discovery_config),
+        model_settings=ModelSettings(parallel_tool_calls=discovery_config.parallel_tool_calls),
+    )
 
-    # Get the configuration for the specified model and set up the client.
-    model_config = get_model_config(model_name)
-    setup_model_client(model_config)
+    # 3. Run the discovery agent
+    discovery_query = (
+        "The user wants to plan a conference trip. The query is: "
+        f"'{query}'. Find all servers needed for this, including conference "
+        "discovery, booking (flights and hotels), and any mediation helpers. "
+        "Return the final list of server configurations as a JSON object."
+    )
+    result = await Runner.run(
+        discovery_agent, discovery_query, max_turns=10, hooks=EventHooks(max_turns=10)
+    )
 
-    # Construct the registry server script path relative to the project root
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    registry_server_script = os.path.join(
-        project_root, "mcp-server-conference-use-case", "mpc-registry-conferences", "build", "index.js"
+    # 4. Parse the result and return the server list
+    try:
+        # The output from the agent might have extra text, so we find the JSON
+        json_start = result.final_output.find("[")
+        json_end = result.final_output.rfind("]") + 1
+        json_string = result.final_output[json_start:json_end]
+        server_configs = json.loads(json_string)
+        logging.info(f"Discovered server configs: {server_configs}")
+        return server_configs
+    except (json.JSONDecodeError, IndexError) as e:
+        logging.error(f"Failed to parse server configs from agent output: {e}")
+        logging.error(f"Agent output was: {result.final_output}")
+        return []
+
+
+async def run_agent(model_config, query: str, mcp_servers: list):
+    """
+    Runs the travel agent on the given, already connected MCP servers.
+    """
+    # Define the main agent that will use the MCP servers, on the model of the booking stage
+    booking_config = get_stage_config(model_config, "booking")
+    agent = Agent(
+        name="Agent",
+        instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
+        mcp_servers=mcp_servers,
+        model=build_model(booking_config),
+        model_settings=ModelSettings(parallel_tool_calls=booking_config.parallel_tool_calls),
     )
 
+    # Run the agent with the user query
+    compaction_stats = start_compaction_stats()
+    run_config, history_filter = create_run_config()
+    prefetcher = start_prefetcher(mcp_servers)
+    try:
+        result = await Runner.run(
+            agent, query, max_turns=15, hooks=EventHooks(max_turns=15), run_config=run_config
+        )
+    finally:
+        if prefetcher is not None:
+            await prefetcher.close()
+    logging.info("Agent conversation finished.")
+    logging.info("Final output:")
+    logging.info(result.final_output)
+
+    # Log token usage
+    usage = result.context_wrapper.usage
+    logging.info(
+        "TOKEN_USAGE - "
+        f"Requests: {usage.requests}, "
+        f"Input Tokens: {usage.input_tokens}, "
+        f"Output Tokens: {usage.output_tokens}, "
+        f"Total Tokens: {usage.total_tokens}"
+    )
+    log_compaction_stats(compaction_stats)
+    if history_filter is not None:
+        history_filter.log_stats()
+    return result
+
+
+async def run(model_config, query: str):
+    """
+    Discovers and runs the necessary MCP servers for a conference booking
+    task, then runs an agent to complete the task. Expects logging and the
+    model client to be configured already and returns the agent's run result,
+    or None if no servers were discovered. If a warm MCP server pool is set
+    up, the servers are leased from it instead of being spawned for this run.
+    """
     # Step 1: Discover required servers
-    server_configs = await discover_servers(model_config, query, registry_server_script)
+    server_configs = await discover_servers(model_config, query, get_registry_server_script())
 
     if not server_configs:
         logging.error("No servers discovered. Exiting.")
-        return
+        return None
 
-    # Step 2: Dynamically start the discovered servers
-    servers = [MCPServerStdio(**config) for config in server_configs]
     server_names = ", ".join(config['name'] for config in server_configs)
+
+    # Step 2: Lease the discovered servers from the warm pool if there is one
+    pool = get_default_pool()
+    if pool is not None:
+        logging.info(f"Leasing the following servers: {server_names}")
+        async with pool.lease(server_configs) as servers:
+            return await run_agent(model_config, query, servers)
+
+    # Otherwise, dynamically start the discovered servers
+    servers = [InstrumentedMCPServerStdio(**config) for config in server_configs]
     logging.info(f"Starting the following servers: {server_names}")
 
     try:
         # Manually enter the async context for each server
         await asyncio.gather(*(server.__aenter__() for server in servers))
-
-        # Define the main agent that will use the MCP servers
-        agent = Agent(
-            name="Agent",
-            instructions="You are a helpful travel agent that can book flights and hotels for a conference.",
-            mcp_servers=servers,
-            model=model_config.model_string,
-        )
-
-        # Run the agent with the user query
-        result = await Runner.run(agent, query, max_turns=15)
-        logging.info("Agent conversation finished.")
-        logging.info("Final output:")
-        logging.info(result.final_output)
-
-        # Log token usage
-        usage = result.context_wrapper.usage
-        logging.info(
-            "TOKEN_USAGE - "
-            f"Requests: {usage.requests}, "
-            f"Input Tokens: {usage.input_tokens}, "
-            f"Output Tokens: {usage.output_tokens}, "
-            f"Total Tokens: {usage.total_tokens}"
-        )
-
+        return await run_agent(model_config, query, servers)
     finally:
         # Ensure all server contexts are properly exited
         logging.info("Shutting down servers...")
         await asyncio.gather(*(server.__aexit__(None, None, None) for server in servers))
 
 
+async def main(model_name: str, query: str, stage_models: dict = None) -> None:
+    """
+    This script discovers and runs the necessary MCP servers for a conference
+    booking task, then runs an agent to complete the task.
+    """
+    # Setup logging
+    setup_logging()
+
+    # Get the configuration for the specified model and its stage models and set up their clients.
+    model_config = with_stage_models(get_model_config(model_name), stage_models or {})
+    for config in get_all_configs(model_config):
+        setup_model_client(config)
+
+    await run(model_config, query)
+
+
 if __name__ == "__main__":
     # This script is intended to be run from run_test.py, which provides the query.
     # For standalone testing, you can uncomment the following lines:
@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+from logging_config import setup_logging
+from mcp_pool import set_default_pool
+from metrics import write_metrics_textfile
+from models import MODELS
+from run_test import (
+    ARCHITECTURES,
+    add_stage_model_arguments,
+    get_stage_models,
+    percentile,
+    positive_int,
+    run_matrix_trials,
+    start_warm_pool,
+)
+from scenarios import DEFAULT_SCENARIO, SCENARIOS
+
+
+def read_events(events_file):
+    """Reads all events of a JSONL event log, skipping lines that are not valid JSON."""
+    events = []
+    if not os.path.exists(events_file):
+        return events
+    with open(events_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+
+def get_tool_batch_phases(batch):
+    """
+    Returns the wall time of the tool calls of one turn and the sum of their
+    durations in milliseconds, if there are several calls. The closer the
+    wall time is to the longest call rather than to the sum, the more the
+    calls overlapped.
+    """
+    if len(batch) < 2:
+        return []
+    starts = [event["ts"] * 1000 - event["duration_ms"] for event in batch]
+    ends = [event["ts"] * 1000 for event in batch]
+    return [
+        ("tool_batch/wall", max(ends) - min(starts)),
+        ("tool_batch/serial", sum(event["duration_ms"] for event in batch)),
+    ]
+
+
+def get_phase_timings(outcome):
+    """
+    Returns the timings of one run in milliseconds as (phase, duration)
+    pairs. Phases are named after what they time, e.g. 'model_turn/Agent' or
+    'tool/BookingServer/book_flight', and speculative calls of the prefetcher
+    as 'prefetch/...'. The tool calls of a turn with several
+    calls are also timed as a batch, as 'tool_batch/wall' and
+    'tool_batch/serial' (the sum of the call durations).
+    """
+    timings = []
+    batch = []
+    for event in read_events(os.path.join(outcome["log_dir"], "events.jsonl")):
+        if event["event"] == "model_request" and batch:
+            timings.extend(get_tool_batch_phases(batch))
+            batch = []
+
+        duration = event.get("duration_ms")
+        if duration is None:
+            continue
+        if event["event"] == "server_start":
+            timings.append((f"server_start/{event['server']}", duration))
+        elif event["event"] == "discovery":
+            timings.append(("discovery", duration))
+        elif event["event"] == "model_request":
+            timings.append((f"model_turn/{event['agent']}", duration))
+        elif event["event"] == "tool_result" and event.get("speculative"):
+            timings.append((f"prefetch/{event['server']}/{event['tool']}", duration))
+        elif event["event"] == "tool_result":
+            timings.append((f"tool/{event['server']}/{event['tool']}", duration))
+            batch.append(event)
+    if batch:
+        timings.extend(get_tool_batch_phases(batch))
+
+    if outcome["evaluation_latency"] is not None:
+        timings.append(("evaluation", outcome["evaluation_latency"] * 1000))
+    if outcome["latency"] is not None:
+        timings.append(("run", outcome["latency"] * 1000))
+    return timings
+
+
+def get_token_usage(outcome):
+    """
+    Returns the input and output tokens of one run per agent and model,
+    e.g. 'DiscoveryAgent/llama3', so that stages on different models can
+    be compared.
+    """
+    usage = {}
+    for event in read_events(os.path.join(outcome["log_dir"], "events.jsonl")):
+        if event["event"] != "model_request":
+            continue
+        tokens = usage.setdefault(f"{event['agent']}/{event['model']}", [0, 0])
+        tokens[0] += event.get("input_tokens") or 0
+        tokens[1] += event.get("output_tokens") or 0
+    return usage
+
+
+def summarize(values):
+    """Returns the count, mean and p50/p95/p99 of a list of durations."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def build_report(outcomes, args):
+    """Aggregates the phase timings of all runs per scenario, model and architecture."""
+    groups = {}
+    for outcome in outcomes:
+        key = f"{outcome['scenario']}/{outcome['model']}/{outcome['architecture']}"
+        group = groups.setdefault(key, {"runs": 0, "passed": 0, "timings": {}, "tokens": {}})
+        group["runs"] += 1
+        group["passed"] += 1 if outcome["passed"] else 0
+        for phase, duration in get_phase_timings(outcome):
+            group["timings"].setdefault(phase, []).append(duration)
+        for stage, tokens in get_token_usage(outcome).items():
+            group["tokens"].setdefault(stage, []).append(tokens)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "models": args.models,
+            "architectures": args.architectures,
+            "scenarios": args.scenarios,
+            "repetitions": args.repetitions,
+            "concurrency": args.concurrency,
+            "warm_pool": args.warm_pool,
+            "stage_models": get_stage_models(args),
+        },
+        "groups": {
+            key: {
+                "runs": group["runs"],
+                "passed": group["passed"],
+                "phases": {phase: summarize(values) for phase, values in sorted(group["timings"].items())},
+                "tokens": {
+                    stage: {
+                        "runs": len(values),
+                        "mean_input": sum(tokens[0] for tokens in values) / len(values),
+                        "mean_output": sum(tokens[1] for tokens in values) / len(values),
+                    }
+                    for stage, values in sorted(group["tokens"].items())
+                },
+            }
+            for key, group in sorted(groups.items())
+        },
+    }
+
+
+def print_report(report):
+    """Prints the phase timings of a report as one table per group."""
+    for key, group in report["groups"].items():
+        print(f"\n{key} ({group['passed']}/{group['runs']} passed)")
+        header = f"{'Phase':<64} {'Count':>6} {'Mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        print(header)
+        print("-" * len(header))
+        for phase, stats in group["phases"].items():
+            print(
+                f"{phase:<64} {stats['count']:>6} {stats['mean']:>9.1f} {stats['p50']:>9.1f} "
+                f"{stats['p95']:>9.1f} {stats['p99']:>9.1f}"
+            )
+        if group.get("tokens"):
+            header = f"{'Tokens per run (agent/model)':<64} {'Runs':>6} {'Input':>9} {'Output':>9}"
+            print(header)
+            print("-" * len(header))
+            for stage, stats in group["tokens"].items():
+                print(f"{stage:<64} {stats['runs']:>6} {stats['mean_input']:>9.0f} {stats['mean_output']:>9.0f}")
+
+
+def compare_reports(baseline, current, threshold, min_delta_ms):
+    """
+    Prints the change of the p50 and p95 of every phase found in both reports
+    and returns the list of regressions, i.e. phases that got slower by more
+    than the relative threshold and by more than `min_delta_ms`.
+    """
+    regressions = []
+    header = f"{'Group / Phase':<90} {'Stat':>4} {'Base ms':>9} {'New ms':>9} {'Change':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, group in current["groups"].items():
+        baseline_group = baseline["groups"].get(key)
+        if baseline_group is None:
+            continue
+        for phase, stats in group["phases"].items():
+            baseline_stats = baseline_group["phases"].get(phase)
+            if baseline_stats is None:
+                continue
+            for stat in ["p50", "p95"]:
+                old, new = baseline_stats[stat], stats[stat]
+                change = (new - old) / old if old else 0.0
+                is_regression = change > threshold and new - old > min_delta_ms
+                marker = "  REGRESSION" if is_regression else ""
+                print(f"{key + ' / ' + phase:<90} {stat:>4} {old:>9.1f} {new:>9.1f} {change:>+8.0%}{marker}")
+                if is_regression:
+                    regressions.append({"group": key, "phase": phase, "stat": stat, "baseline": old, "current": new})
+    return regressions
+
+
+async def run_benchmark(args):
+    """Runs all repetitions and writes the phase timing report."""
+    run_dir = os.path.join(args.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    print(
+        f"--- Starting Benchmark: {len(args.scenarios)} scenario(s) x {len(args.models)} model(s) x "
+        f"{len(args.architectures)} architecture(s) x {args.repetitions} repetition(s), "
+        f"concurrency {args.concurrency} ---"
+    )
+
+    setup_logging()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    # Reuse the test matrix, with one trial per repetition
+    args.trials = args.repetitions
+    pool = None
+    if args.warm_pool:
+        pool = await start_warm_pool(args, args.architectures)
+    try:
+        outcomes = await run_matrix_trials(args, run_dir, args.models, args.architectures, semaphore)
+    finally:
+        if pool is not None:
+            await pool.close()
+            set_default_pool(None)
+
+    report = build_report(outcomes, args)
+    print_report(report)
+
+    report_file = args.report or os.path.join(run_dir, "benchmark.json")
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    write_metrics_textfile(os.path.join(run_dir, "metrics.prom"))
+    print(f"\n--- Benchmark Finished. Report: '{report_file}' ---")
+
+
+def main():
+    """
+    Times every phase of the conference agent runs (server start, discovery,
+    model turns, tool calls and evaluation) across repetitions, or compares
+    two benchmark reports.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the phases of conference agent runs, or compare two benchmark reports."
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        default=["stub"],
+        choices=list(MODELS.keys()),
+        help="The models to run. Defaults to stub.",
+    )
+    add_stage_model_arguments(parser)
+    parser.add_argument(
+        "--architectures",
+        nargs="+",
+        default=list(ARCHITECTURES.keys()),
+        choices=list(ARCHITECTURES.keys()),
+        help="The architectures to run. Defaults to all.",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=[DEFAULT_SCENARIO],
+        choices=list(SCENARIOS.keys()),
+        help=f"The scenarios to run. Defaults to {DEFAULT_SCENARIO}.",
+    )
+    parser.add_argument("--repetitions", type=positive_int, default=10, help="Runs per combination. Defaults to 10.")
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=1,
+        help="The maximum number of runs at once. Defaults to 1, so runs do not skew each other's timings.",
+    )
+    parser.add_argument("--warm-pool", action="store_true", help="Lease MCP servers from a warm pool.")
+    parser.add_argument("--pool-size", type=positive_int, default=1, help="Pre-started instances per MCP server. Defaults to 1.")
+    parser.add_argument("--pool-max-uses", type=positive_int, default=50, help="Leases before a pooled server is recycled. Defaults to 50.")
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=os.path.join("logs", "benchmark"),
+        help="The directory for per-run logs. Defaults to logs/benchmark.",
+    )
+    parser.add_argument("--report", type=str, help="Where to write the JSON report. Defaults to the run's log directory.")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CURRENT"),
+        help="Compare two reports instead of running a benchmark. Exits with 1 on regressions.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Compare mode: the relative slowdown that counts as a regression. Defaults to 0.1.",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="Compare mode: the absolute slowdown below which changes are ignored. Defaults to 1.",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], "r", encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare_reports(baseline, current, args.threshold, args.min_delta_ms)
+        print(f"\n{len(regressions)} regression(s) found.")
+        sys.exit(1 if regressions else 0)
+
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import logging_config
+from logging_config import setup_logging
+from run_test import percentile
+
+
+async def measure_event_loop_stalls(duration, records_per_burst, payload_size, interval=0.001):
+    """
+    Measures how late a ticker that wakes up every `interval` seconds is
+    scheduled, while a producer floods the root logger with DEBUG records
+    the way the agents, openai and httpx loggers do during a run.
+    Returns the observed stalls in milliseconds and the number of records logged.
+    """
+    stalls = []
+    logged = 0
+    deadline = time.perf_counter() + duration
+    payload = "x" * payload_size
+
+    async def ticker():
+        while time.perf_counter() < deadline:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            stalls.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    async def producer():
+        nonlocal logged
+        logger = logging.getLogger("httpx")
+        while time.perf_counter() < deadline:
+            for _ in range(records_per_burst):
+                logger.debug("HTTP Response: %s", payload)
+            logged += records_per_burst
+            await asyncio.sleep(0)
+
+    await asyncio.gather(ticker(), producer())
+    return stalls, logged
+
+
+class SlowStream:
+    """
+    Wraps a log stream so every flush blocks for a fixed time, simulating a
+    slow disk, network file system or console pipe.
+    """
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        time.sleep(self.latency)
+
+    def close(self):
+        self.stream.close()
+
+
+def slow_down_log_streams(latency):
+    """
+    Makes the streams of all configured log handlers block on every flush.
+    """
+    listener = logging_config._queue_listener
+    handlers = listener.handlers if listener is not None else logging.getLogger().handlers
+    for handler in handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is not None:
+            handler.stream = SlowStream(handler.stream, latency)
+
+
+def run_benchmark(use_queue, args):
+    """
+    Configures logging with or without the queue and measures the stalls.
+    """
+    os.environ["LOG_FILE_MODE"] = "w"
+    os.environ["LOG_QUEUE"] = "1" if use_queue else "0"
+    os.environ["LOG_QUEUE_POLICY"] = args.policy
+    os.environ["LOG_QUEUE_SIZE"] = str(args.queue_size)
+
+    # Keep the console handler from flooding the terminal
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, "w")
+    try:
+        setup_logging()
+        if args.io_latency_ms > 0:
+            slow_down_log_streams(args.io_latency_ms / 1000)
+        stalls, logged = asyncio.run(
+            measure_event_loop_stalls(args.duration, args.burst, args.payload_size)
+        )
+        handler = logging_config._queue_handler
+        dropped = handler.dropped if handler is not None else 0
+        # Reconfiguring flushes the queue of the queued run before the next one
+        os.environ["LOG_QUEUE"] = "0"
+        setup_logging()
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+    return {
+        "mode": f"queue ({args.policy})" if use_queue else "synchronous",
+        "logged": logged,
+        "dropped": dropped,
+        "p50": percentile(stalls, 50),
+        "p99": percentile(stalls, 99),
+        "max": max(stalls),
+    }
+
+
+def main():
+    """
+    Compares the event-loop stall time of synchronous and queue-backed logging.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure event-loop stalls caused by synchronous vs. queue-backed logging."
+    )
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds to run each mode. Defaults to 3.")
+    parser.add_argument("--burst", type=int, default=50, help="Records logged per producer step. Defaults to 50.")
+    parser.add_argument("--payload-size", type=int, default=2000, help="Characters per record. Defaults to 2000.")
+    parser.add_argument("--queue-size", type=int, default=10000, help="Log queue size. Defaults to 10000.")
+    parser.add_argument("--policy", choices=["drop", "block"], default="drop", help="Log queue policy. Defaults to drop.")
+    parser.add_argument(
+        "--io-latency-ms",
+        type=float,
+        default=0.0,
+        help="Simulated blocking time per log write, e.g. for slow disks or console pipes. Defaults to 0.",
+    )
+    args = parser.parse_args()
+
+    # Write the benchmark logs to a scratch directory instead of 'logs/'
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        cwd = os.getcwd()
+        os.chdir(scratch_dir)
+        try:
+            results = [run_benchmark(False, args), run_benchmark(True, args)]
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'Mode':<16} {'Logged':>9} {'Dropped':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for result in results:
+        print(
+            f"{result['mode']:<16} {result['logged']:>9} {result['dropped']:>9} "
+            f"{result['p50']:>8.2f} {result['p99']:>8.2f} {result['max']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
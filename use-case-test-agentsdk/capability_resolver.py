@@ -0,0 +1,227 @@
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from tool_cache import get_cache_key, get_cached_tools, hash_file, is_tool_cache_enabled
+
+
+@dataclass
+class Capability:
+    """
+    A dataclass to hold a capability a task may need, the terms that
+    describe what a server offering it does, and the query terms that call
+    for it. A capability without triggers is always needed.
+    """
+
+    name: str
+    terms: list
+    triggers: list = field(default_factory=list)
+
+
+# The query terms that call for travelling to the conference, and for a stay there
+FLIGHT_TRIGGERS = ["flight", "fly", "trip", "travel", "go", "from", "book"]
+HOTEL_TRIGGERS = ["hotel", "stay", "accommodation", "night", "trip", "travel", "book"]
+
+# The capabilities a conference trip may need. These are the same capabilities
+# the discovery agent is asked to find servers for. The airports and hotels
+# near the venue are found from its coordinates.
+CONFERENCE_TRIP_CAPABILITIES = [
+    Capability("conference search", ["conference", "summit", "symposium", "event", "venue"]),
+    Capability(
+        "geocoding",
+        ["geocode", "geocoding", "coordinate", "latitude", "longitude", "address"],
+        FLIGHT_TRIGGERS + HOTEL_TRIGGERS,
+    ),
+    Capability("airport search", ["airport", "iata"], FLIGHT_TRIGGERS),
+    Capability("flight booking", ["flight", "airline", "fare", "itinerary"], FLIGHT_TRIGGERS),
+    Capability("hotel booking", ["hotel", "accommodation", "lodging", "room"], HOTEL_TRIGGERS),
+]
+
+# The saturation of the term frequency in the scores, as in BM25
+TERM_FREQUENCY_SATURATION = 1.2
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits a text into lowercase word tokens and strips a plural 's', so
+    that e.g. 'flights' and 'flight' match.
+    """
+    tokens = re.findall(r"[a-z0-9]+", text.lower())
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+
+def get_needed_capabilities(query: str, capabilities: list) -> list:
+    """Returns the capabilities a query calls for: those without triggers, and those it mentions a trigger of."""
+    tokens = set(tokenize(query))
+    return [
+        capability for capability in capabilities
+        if not capability.triggers or tokens & set(tokenize(" ".join(capability.triggers)))
+    ]
+
+
+def get_registry_file(registry_server_script: str) -> str:
+    """
+    Returns the servers.json the registry server reads, which is copied
+    next to the server script by its build.
+    """
+    servers_file = os.path.join(os.path.dirname(registry_server_script), "servers.json")
+    if not os.path.isfile(servers_file):
+        # Fall back to the source file if the registry was built without it
+        servers_file = os.path.join(
+            os.path.dirname(os.path.dirname(registry_server_script)), "src", "servers.json"
+        )
+    return servers_file
+
+
+class CapabilityResolver:
+    """
+    Resolves capabilities to registry servers without a model. A server is
+    described by its registry name and description, and by the names and
+    descriptions of its tools if they are in the tool-schema cache. The
+    resolver keeps an inverted index from the tokens of these descriptions
+    to the servers and their term frequencies, so a lookup only touches the
+    servers that share a term with the capability, and scores them with the
+    inverse document frequency and the saturated frequency of the matching
+    terms.
+    """
+
+    def __init__(self, registry: dict, base_dir: str, server_tools: dict = None):
+        self.registry = registry
+        self.base_dir = base_dir
+        self._index = {}
+        for server_id, entry in registry.items():
+            texts = [server_id, entry.get("description", "")]
+            for tool in (server_tools or {}).get(server_id, []):
+                texts += [tool.name, tool.description or ""]
+            for token in tokenize(" ".join(texts)):
+                postings = self._index.setdefault(token, {})
+                postings[server_id] = postings.get(server_id, 0) + 1
+
+    def _idf(self, token: str) -> float:
+        n = len(self.registry)
+        df = len(self._index.get(token, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, capability: Capability) -> dict:
+        """Returns the score of every server that matches at least one term of the capability."""
+        k = TERM_FREQUENCY_SATURATION
+        scores = {}
+        for term in set(tokenize(" ".join(capability.terms))):
+            idf = self._idf(term)
+            for server_id, tf in self._index.get(term, {}).items():
+                scores[server_id] = scores.get(server_id, 0.0) + idf * tf * (k + 1) / (tf + k)
+        return scores
+
+    def resolve_capability(self, capability: Capability):
+        """
+        Returns the best matching server of a capability and the confidence
+        of the match, i.e. the share of the best score in the sum of the two
+        best scores. Returns (None, 0.0) if no server matches.
+        """
+        scores = self.score(capability)
+        if not scores:
+            return None, 0.0
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_id, best_score = ranked[0]
+        second_score = ranked[1][1] if len(ranked) > 1 else 0.0
+        return best_id, best_score / (best_score + second_score)
+
+    def get_server_config(self, server_id: str) -> dict:
+        """
+        Returns the configuration of a registry server. Arguments that are
+        paths relative to the MCP server directory are made absolute.
+        """
+        address = self.registry[server_id]["address"]
+        args = []
+        for arg in address.get("args", []):
+            path = os.path.join(self.base_dir, arg)
+            args.append(path if not os.path.isabs(arg) and os.path.exists(path) else arg)
+        return {"name": server_id, "params": {"command": address["command"], "args": args}}
+
+    def resolve(self, capabilities: list, threshold: float):
+        """
+        Resolves all capabilities to a list of distinct server configurations.
+        Returns None if any capability is resolved with a confidence below
+        the threshold.
+        """
+        server_ids = []
+        for capability in capabilities:
+            server_id, confidence = self.resolve_capability(capability)
+            logging.info(
+                f"Resolved capability '{capability.name}' to '{server_id}' "
+                f"with confidence {confidence:.2f}."
+            )
+            if server_id is None or confidence < threshold:
+                return None
+            if server_id not in server_ids:
+                server_ids.append(server_id)
+        return [self.get_server_config(server_id) for server_id in server_ids]
+
+
+def get_server_tools(resolver: CapabilityResolver) -> dict:
+    """Returns the cached tools of the registry's servers by server id, and the cache keys they were found under."""
+    server_tools = {}
+    cache_keys = []
+    if not is_tool_cache_enabled():
+        return server_tools, cache_keys
+    for server_id in resolver.registry:
+        params = resolver.get_server_config(server_id)["params"]
+        key = get_cache_key(params["command"], params["args"])
+        tools = get_cached_tools(key)
+        if tools is not None:
+            server_tools[server_id] = tools
+            cache_keys.append(key)
+    return server_tools, cache_keys
+
+
+# Maps the hash of a registry file to the resolver built from the registry
+# alone, and the hash and the tool-schema cache keys of the registry's
+# servers to the resolver built from both
+_registry_resolvers = {}
+_resolvers = {}
+
+
+def get_resolver(registry_server_script: str) -> CapabilityResolver:
+    """
+    Returns the resolver for the registry of the given server script. The
+    index is only rebuilt when the registry contents or the cached tools of
+    its servers change.
+    """
+    registry_file = get_registry_file(registry_server_script)
+    registry_hash = hash_file(registry_file)
+    if registry_hash not in _registry_resolvers:
+        with open(registry_file, "r", encoding="utf-8") as f:
+            registry = json.load(f)
+        # The registry's server paths are relative to the MCP server directory
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(registry_server_script)))
+        _registry_resolvers[registry_hash] = CapabilityResolver(registry, base_dir)
+    resolver = _registry_resolvers[registry_hash]
+
+    server_tools, cache_keys = get_server_tools(resolver)
+    if not server_tools:
+        return resolver
+    key = (registry_hash, *cache_keys)
+    if key not in _resolvers:
+        _resolvers[key] = CapabilityResolver(resolver.registry, resolver.base_dir, server_tools)
+    return _resolvers[key]
+
+
+def resolve_servers(registry_server_script: str, query: str, capabilities: list = None):
+    """
+    Resolves the capabilities of a conference trip that the query calls for
+    to server configurations, with the resolver configured via the
+    CAPABILITY_RESOLVER and CAPABILITY_RESOLVER_THRESHOLD variables. Returns
+    None if the resolver is disabled, fails or is not confident enough.
+    """
+    if os.getenv("CAPABILITY_RESOLVER", "1").lower() not in ["1", "true", "yes"]:
+        return None
+    threshold = float(os.getenv("CAPABILITY_RESOLVER_THRESHOLD", "0.6"))
+    try:
+        resolver = get_resolver(registry_server_script)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Capability resolver could not load the registry: {e}")
+        return None
+    needed = get_needed_capabilities(query, capabilities or CONFERENCE_TRIP_CAPABILITIES)
+    return resolver.resolve(needed, threshold)
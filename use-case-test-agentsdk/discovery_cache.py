@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from capability_resolver import get_registry_file
+from tool_cache import hash_file, write_cache_file
+
+
+# The on-disk cache of discovered server configurations
+DISCOVERY_CACHE_FILE = os.path.join(".cache", "discovery.json")
+
+
+def is_discovery_cache_enabled() -> bool:
+    """Returns whether the discovery cache is enabled via the DISCOVERY_CACHE variable."""
+    return os.getenv("DISCOVERY_CACHE", "1").lower() in ["1", "true", "yes"]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for the cache key, so that differences in case,
+    punctuation and whitespace do not cause a cache miss.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def get_registry_hash(registry_server_script: str) -> str:
+    """Returns the hash of the registry contents, i.e. the servers.json the registry server reads."""
+    registry_file = get_registry_file(registry_server_script)
+    if os.path.isfile(registry_file):
+        return hash_file(registry_file)
+    return hash_file(registry_server_script)
+
+
+def is_valid_server_config(config) -> bool:
+    """Returns whether a discovered server configuration can be used to start a server."""
+    return (
+        isinstance(config, dict)
+        and isinstance(config.get("name"), str)
+        and isinstance(config.get("params"), dict)
+        and isinstance(config["params"].get("command"), str)
+    )
+
+
+class DiscoveryCache:
+    """
+    A persistent cache of the server configurations found by the discovery
+    agent. Entries are keyed by the normalized query and the hash of the
+    registry contents, expire after `ttl` seconds and are evicted least
+    recently used first when there are more than `max_entries`.
+    """
+
+    def __init__(self, cache_file: str, ttl: float, max_entries: int):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Ignoring unreadable discovery cache '{self.cache_file}': {e}")
+                self._entries = {}
+        return self._entries
+
+    @staticmethod
+    def get_key(query: str, registry_hash: str) -> str:
+        key = json.dumps({"query": normalize_query(query), "registry": registry_hash}, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, registry_hash: str):
+        """Returns the cached server configurations for a query, or None on a miss."""
+        entries = self._load()
+        key = self.get_key(query, registry_hash)
+        entry = entries.get(key)
+        now = time.time()
+
+        if entry is not None and now - entry["created"] > self.ttl:
+            del entries[key]
+            self.evictions += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            self._log_stats("miss")
+            return None
+
+        self.hits += 1
+        entry["last_used"] = now
+        write_cache_file(self.cache_file, entries)
+        self._log_stats("hit")
+        return entry["server_configs"]
+
+    def put(self, query: str, registry_hash: str, server_configs: list) -> None:
+        """Stores the server configurations found for a query."""
+        entries = self._load()
+        now = time.time()
+        entries[self.get_key(query, registry_hash)] = {
+            "query": normalize_query(query),
+            "created": now,
+            "last_used": now,
+            "server_configs": server_configs,
+        }
+
+        # Drop expired entries, then the least recently used ones
+        for key in [k for k, entry in entries.items() if now - entry["created"] > self.ttl]:
+            del entries[key]
+            self.evictions += 1
+        while len(entries) > self.max_entries:
+            del entries[min(entries, key=lambda k: entries[k]["last_used"])]
+            self.evictions += 1
+
+        write_cache_file(self.cache_file, entries)
+
+    def _log_stats(self, outcome: str) -> None:
+        lookups = self.hits + self.misses
+        logging.info(
+            f"Discovery cache {outcome} - "
+            f"Hits: {self.hits}, "
+            f"Misses: {self.misses}, "
+            f"Hit Rate: {self.hits / lookups:.0%}, "
+            f"Evictions: {self.evictions}"
+        )
+
+
+# The discovery cache of this process, created on first use
+_discovery_cache = None
+
+
+def get_discovery_cache():
+    """
+    Returns the discovery cache configured via the DISCOVERY_CACHE,
+    DISCOVERY_CACHE_TTL and DISCOVERY_CACHE_SIZE variables, or None if it
+    is disabled.
+    """
+    global _discovery_cache
+    if not is_discovery_cache_enabled():
+        return None
+    if _discovery_cache is None:
+        _discovery_cache = DiscoveryCache(
+            DISCOVERY_CACHE_FILE,
+            ttl=float(os.getenv("DISCOVERY_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("DISCOVERY_CACHE_SIZE", "128")),
+        )
+    return _discovery_cache
@@ -1,12 +1,26 @@
+import ast
 import re
 import json
 import logging
 import os
-import codecs
+from logging_config import read_log_checkpoint
+from scenarios import DEFAULT_SCENARIO, get_scenario
 
-def setup_evaluation_logging():
+
+# The tools whose results carry the booking confirmations
+FLIGHT_BOOKING_TOOL = "book_flight"
+HOTEL_BOOKING_TOOL = "book_hotel"
+
+# The log lines that carry the booking confirmations returned by the MCP tools
+FLIGHT_BOOKING_MARKER = b"MCP tool book_flight returned"
+HOTEL_BOOKING_MARKER = b"MCP tool book_hotel returned"
+
+# Matches the repr of the text content, which is quoted with either single
+# or double quotes depending on the text.
+TEXT_CONTENT_PATTERN = re.compile(r"""text=('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+
+def setup_evaluation_logging(log_dir="logs"):
     """Sets up a dedicated logger for the evaluation results."""
-    log_dir = "logs"
     os.makedirs(log_dir, exist_ok=True)
     
     eval_log_file = os.path.join(log_dir, "evaluation.log")
@@ -20,6 +34,7 @@ def setup_evaluation_logging():
     # Remove existing handlers to avoid duplication
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
+        handler.close()
 
     # Add a file handler to write evaluation results
     file_handler = logging.FileHandler(eval_log_file, mode='w')
@@ -30,44 +45,96 @@ def setup_evaluation_logging():
     
     return logger
 
-def parse_log_for_bookings(log_file="logs/mcp.log"):
-    """Parses the log file to find flight and hotel booking confirmations."""
+def parse_booking_line(line):
+    """
+    Extracts the JSON booking confirmation from the text content logged for
+    a booking tool call. Returns None if the line cannot be parsed.
+    """
+    match = TEXT_CONTENT_PATTERN.search(line)
+    if not match:
+        return None
     try:
-        # Open with a robust encoding setting
-        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-            log_content = f.read()
+        # The text is logged as a Python string literal, so evaluating it
+        # undoes the escaping exactly.
+        text = ast.literal_eval(match.group(1))
+        booking = json.loads(text)
+    except (ValueError, SyntaxError, json.JSONDecodeError):
+        return None # Failed to parse
+    return booking if isinstance(booking, dict) else None
+
+def parse_log_for_bookings(log_file="logs/mcp.log", start_offset=None):
+    """
+    Parses the log file to find flight and hotel booking confirmations.
+    The log is streamed line by line starting at `start_offset`, which defaults
+    to the checkpoint recorded when the latest run started, so only the
+    latest run's portion of the log is scanned and the last booking of that
+    run is returned.
+    """
+    if start_offset is None:
+        start_offset = read_log_checkpoint(log_file)
+
+    flight_booking = None
+    hotel_booking = None
+
+    try:
+        # Read bytes so the offset can be used directly and undecodable
+        # bytes in unrelated lines are never an issue
+        with open(log_file, 'rb') as f:
+            f.seek(start_offset)
+            for raw_line in f:
+                if FLIGHT_BOOKING_MARKER in raw_line:
+                    booking = parse_booking_line(raw_line.decode('utf-8', errors='ignore'))
+                    flight_booking = booking or flight_booking
+                elif HOTEL_BOOKING_MARKER in raw_line:
+                    booking = parse_booking_line(raw_line.decode('utf-8', errors='ignore'))
+                    hotel_booking = booking or hotel_booking
     except FileNotFoundError:
         return None, None
 
+    return flight_booking, hotel_booking
+
+def parse_events_for_bookings(events_file="logs/events.jsonl", start_offset=None, run_id=None):
+    """
+    Reads the flight and hotel booking confirmations from the structured
+    tool_result events of the event log. Like parse_log_for_bookings, it
+    streams the log from the latest run's checkpoint and returns the last
+    booking found, optionally restricted to the events of one run id.
+    """
+    if start_offset is None:
+        start_offset = read_log_checkpoint(events_file)
+
     flight_booking = None
     hotel_booking = None
 
-    # Regex to find the JSON data within the text content of the log
-    flight_pattern = re.search(r"MCP tool book_flight returned.*?text='({.*?})'", log_content, re.DOTALL)
-    hotel_pattern = re.search(r"MCP tool book_hotel returned.*?text='({.*?})'", log_content, re.DOTALL)
-
-    if flight_pattern:
-        try:
-            flight_data_str = flight_pattern.group(1)
-            # The string from the log is escaped, so we need to unescape it
-            unescaped_flight_str = codecs.decode(flight_data_str, 'unicode_escape')
-            flight_booking = json.loads(unescaped_flight_str)
-        except (json.JSONDecodeError, IndexError):
-            pass # Failed to parse
-
-    if hotel_pattern:
-        try:
-            hotel_data_str = hotel_pattern.group(1)
-            # The string from the log is escaped, so we need to unescape it
-            unescaped_hotel_str = codecs.decode(hotel_data_str, 'unicode_escape')
-            hotel_booking = json.loads(unescaped_hotel_str)
-        except (json.JSONDecodeError, IndexError):
-            pass # Failed to parse
+    try:
+        with open(events_file, 'rb') as f:
+            f.seek(start_offset)
+            for raw_line in f:
+                try:
+                    event = json.loads(raw_line)
+                except json.JSONDecodeError:
+                    continue # Skip partially written lines
+                if event.get("event") != "tool_result" or event.get("is_error"):
+                    continue
+                if run_id is not None and event.get("run_id") != run_id:
+                    continue
+                payload = event.get("payload")
+                if not isinstance(payload, dict):
+                    continue
+                if event.get("tool") == FLIGHT_BOOKING_TOOL:
+                    flight_booking = payload
+                elif event.get("tool") == HOTEL_BOOKING_TOOL:
+                    hotel_booking = payload
+    except FileNotFoundError:
+        return None, None
 
     return flight_booking, hotel_booking
 
-def evaluate_bookings(flight_booking, hotel_booking):
+def evaluate_bookings(flight_booking, hotel_booking, scenario=None):
     """Evaluates if the extracted bookings match the expected conference data."""
+    if scenario is None:
+        scenario = get_scenario(DEFAULT_SCENARIO)
+
     results = {
         "flight_booking_valid": False,
         "hotel_booking_valid": False,
@@ -76,13 +143,13 @@ def evaluate_bookings(flight_booking, hotel_booking):
         "errors": []
     }
     
-    # Expected data for ISWC 2025
-    expected_flight_id = "CONF-FLIGHT-NARA"
-    expected_arrival_date = "2025-11-01"
-    expected_return_date = "2025-11-07"
-    expected_hotel_id = "ISWC-OFFER-1"
-    expected_check_in = "2025-11-01"
-    expected_check_out = "2025-11-07"
+    # Expected data for the scenario (ISWC 2025 by default)
+    expected_flight_id = scenario.expected_flight_id
+    expected_arrival_date = scenario.expected_arrival_date
+    expected_return_date = scenario.expected_return_date
+    expected_hotel_id = scenario.expected_hotel_id
+    expected_check_in = scenario.expected_check_in
+    expected_check_out = scenario.expected_check_out
 
     # Validate Flight Booking
     flight_errors = []
@@ -129,14 +196,23 @@ def evaluate_bookings(flight_booking, hotel_booking):
             
     return results
 
-def main():
-    """Main function to run the evaluation."""
-    logger = setup_evaluation_logging()
+def main(log_dir="logs", scenario=None, verbose=True):
+    """
+    Main function to run the evaluation. Scores the run logged in `log_dir`
+    against the given scenario and returns the evaluation results.
+    """
+    logger = setup_evaluation_logging(log_dir)
     logger.info("Starting evaluation...")
 
-    flight_booking, hotel_booking = parse_log_for_bookings()
+    # Prefer the structured event log and only fall back to scraping the
+    # full log for runs recorded before the event log existed
+    events_file = os.path.join(log_dir, "events.jsonl")
+    if os.path.exists(events_file):
+        flight_booking, hotel_booking = parse_events_for_bookings(events_file)
+    else:
+        flight_booking, hotel_booking = parse_log_for_bookings(os.path.join(log_dir, "mcp.log"))
     
-    results = evaluate_bookings(flight_booking, hotel_booking)
+    results = evaluate_bookings(flight_booking, hotel_booking, scenario)
     
     # Log detailed results
     flight_status = "VALID" if results["flight_booking_valid"] else "INVALID"
@@ -146,21 +222,32 @@ def main():
     logger.info(f"Hotel Booking Status: {hotel_status}")
     logger.info(f"Overall Score: {results['score']}/{results['total_possible_score']}")
     
-    print(f"Flight Booking Status: {flight_status}")
-    print(f"Hotel Booking Status: {hotel_status}")
-    print(f"Overall Score: {results['score']}/{results['total_possible_score']}")
+    if verbose:
+        print(f"Flight Booking Status: {flight_status}")
+        print(f"Hotel Booking Status: {hotel_status}")
+        print(f"Overall Score: {results['score']}/{results['total_possible_score']}")
 
     if results["errors"]:
         logger.error("Evaluation FAILED: Invalid bookings found.")
-        print("\nEvaluation FAILED: Invalid bookings found.")
+        if verbose:
+            print("\nEvaluation FAILED: Invalid bookings found.")
         for error in results["errors"]:
             logger.error(f"- {error}")
-            print(f"- {error}")
+            if verbose:
+                print(f"- {error}")
     else:
         logger.info("Evaluation PASSED: All bookings are valid.")
-        print("\nEvaluation PASSED: All bookings are valid.")
+        if verbose:
+            print("\nEvaluation PASSED: All bookings are valid.")
 
     logger.info("Evaluation finished.")
 
+    # Close the file handler so per-run evaluations do not leak file handles
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+
+    return results
+
 if __name__ == "__main__":
     main()
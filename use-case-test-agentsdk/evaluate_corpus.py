@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from evaluate import evaluate_bookings, parse_events_for_bookings, parse_log_for_bookings
+from run_test import positive_int
+from scenarios import DEFAULT_SCENARIO, SCENARIOS, load_scenarios
+
+
+# The log files that mark a directory as the log directory of a run
+RUN_LOG_FILES = ("events.jsonl", "mcp.log")
+
+# The columns of the per-run and aggregate scorecards
+RUN_COLUMNS = [
+    "run_dir",
+    "scenario",
+    "model",
+    "architecture",
+    "trial",
+    "flight_booking_valid",
+    "hotel_booking_valid",
+    "score",
+    "total_possible_score",
+    "passed",
+    "errors",
+]
+SUMMARY_COLUMNS = [
+    "scenario",
+    "model",
+    "architecture",
+    "runs",
+    "passed",
+    "pass_rate",
+    "flight_valid_rate",
+    "hotel_valid_rate",
+    "mean_score",
+]
+
+# The scenarios of the worker processes, set once per process by init_worker
+_scenarios = {}
+
+
+def find_run_dirs(corpus_dir: str) -> list:
+    """Returns every directory below `corpus_dir` that holds the logs of a run, in sorted order."""
+    run_dirs = []
+    for dir_path, dir_names, file_names in os.walk(corpus_dir):
+        dir_names.sort()
+        if any(name in file_names for name in RUN_LOG_FILES):
+            run_dirs.append(dir_path)
+    return run_dirs
+
+
+def describe_run(corpus_dir: str, run_dir: str, scenario_names, default_scenario: str) -> dict:
+    """
+    Returns the scenario, model, architecture and trial of a run. The test
+    matrix and the benchmark lay out their runs as
+    `<scenario>/<model>/<architecture>/trial-<n>`. For other layouts, the
+    scenario is the first path component that names a known scenario, or
+    the default scenario.
+    """
+    parts = os.path.relpath(run_dir, corpus_dir).split(os.sep)
+    run = {"run_dir": run_dir, "scenario": default_scenario, "model": "", "architecture": "", "trial": ""}
+    for i, part in enumerate(parts):
+        if part in scenario_names:
+            run["scenario"] = part
+            layout = parts[i + 1:]
+            if len(layout) == 3:
+                run["model"], run["architecture"], run["trial"] = layout
+            break
+    return run
+
+
+def init_worker(scenarios: dict) -> None:
+    """Hands the scenarios to a worker process once, instead of with every run."""
+    global _scenarios
+    _scenarios = scenarios
+
+
+def score_run(run: dict) -> dict:
+    """
+    Scores one archived run against its scenario. Like evaluate.main, it
+    prefers the event log and only scrapes mcp.log for runs without one, but
+    it does not write an evaluation.log, so the archive is left untouched.
+    """
+    run_dir = run["run_dir"]
+    events_file = os.path.join(run_dir, "events.jsonl")
+    if os.path.exists(events_file):
+        flight_booking, hotel_booking = parse_events_for_bookings(events_file)
+    else:
+        flight_booking, hotel_booking = parse_log_for_bookings(os.path.join(run_dir, "mcp.log"))
+
+    scenario = _scenarios.get(run["scenario"])
+    if scenario is None:
+        results = {
+            "flight_booking_valid": False,
+            "hotel_booking_valid": False,
+            "score": 0.0,
+            "total_possible_score": 2.0,
+            "errors": [f"Scenario '{run['scenario']}' not found."],
+        }
+    else:
+        results = evaluate_bookings(flight_booking, hotel_booking, scenario)
+    return {**run, **results, "passed": not results["errors"]}
+
+
+def score_runs(runs: list, scenarios: dict, workers=None) -> list:
+    """Scores runs in parallel in a pool of worker processes and returns the scores in the order of the runs."""
+    # Hand out the runs in chunks, so thousands of small runs do not pay for a round trip each
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(runs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(scenarios,)) as executor:
+        return list(executor.map(score_run, runs, chunksize=chunksize))
+
+
+def summarize_scores(scores: list) -> list:
+    """Aggregates the scores per scenario, model and architecture."""
+    groups = {}
+    for score in scores:
+        key = (score["scenario"], score["model"], score["architecture"])
+        groups.setdefault(key, []).append(score)
+
+    summary = []
+    for (scenario, model, architecture), group in sorted(groups.items()):
+        passed = sum(1 for s in group if s["passed"])
+        summary.append(
+            {
+                "scenario": scenario,
+                "model": model,
+                "architecture": architecture,
+                "runs": len(group),
+                "passed": passed,
+                "pass_rate": passed / len(group),
+                "flight_valid_rate": sum(1 for s in group if s["flight_booking_valid"]) / len(group),
+                "hotel_valid_rate": sum(1 for s in group if s["hotel_booking_valid"]) / len(group),
+                "mean_score": sum(s["score"] for s in group) / len(group),
+            }
+        )
+    return summary
+
+
+def write_csv(path: str, rows: list, columns: list) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            if isinstance(row.get("errors"), list):
+                row = {**row, "errors": " | ".join(row["errors"])}
+            writer.writerow(row)
+
+
+def write_scorecards(output_dir: str, scores: list, summary: list) -> list:
+    """Writes the per-run and aggregate scorecards as CSV and JSON and returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, name) for name in ("scores.csv", "scores.json", "scorecard.csv", "scorecard.json")]
+    write_csv(paths[0], scores, RUN_COLUMNS)
+    with open(paths[1], "w", encoding="utf-8") as f:
+        json.dump(scores, f, indent=2)
+    write_csv(paths[2], summary, SUMMARY_COLUMNS)
+    with open(paths[3], "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return paths
+
+
+def print_scorecard(summary: list) -> None:
+    """Prints the aggregate scorecard as a table."""
+    header = (
+        f"{'Scenario':<12} {'Model':<20} {'Arch':<6} {'Runs':>6} {'Passed':>6} "
+        f"{'Rate':>6} {'Flight':>6} {'Hotel':>6} {'Score':>6}"
+    )
+    print("\n" + header)
+    print("-" * len(header))
+    for group in summary:
+        print(
+            f"{group['scenario']:<12} {group['model'] or '-':<20} {group['architecture'] or '-':<6} "
+            f"{group['runs']:>6} {group['passed']:>6} {group['pass_rate']:>6.0%} "
+            f"{group['flight_valid_rate']:>6.0%} {group['hotel_valid_rate']:>6.0%} {group['mean_score']:>6.2f}"
+        )
+
+
+def main():
+    """
+    Scores every archived run below a directory against the expected
+    bookings of its scenario in parallel, and writes per-run and aggregate
+    scorecards.
+    """
+    parser = argparse.ArgumentParser(
+        description="Score a directory of archived run logs against the expected bookings of their scenarios."
+    )
+    parser.add_argument("corpus_dir", type=str, help="The directory holding the log directories of the runs.")
+    parser.add_argument(
+        "--scenario-file",
+        type=str,
+        help="A JSON file with the expected bookings of the scenarios. Defaults to the scenarios in scenarios.py.",
+    )
+    parser.add_argument(
+        "--default-scenario",
+        type=str,
+        default=DEFAULT_SCENARIO,
+        help=f"The scenario of runs whose path names none. Defaults to {DEFAULT_SCENARIO}.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=os.path.join("logs", "scorecards"),
+        help="The directory for the scorecards, which must not be the corpus directory. Defaults to logs/scorecards.",
+    )
+    args = parser.parse_args()
+    # The archive is left untouched, so re-scoring it gives the same runs
+    if os.path.abspath(args.output_dir) == os.path.abspath(args.corpus_dir):
+        parser.error("--output-dir must not be the corpus directory")
+
+    scenarios = load_scenarios(args.scenario_file) if args.scenario_file else dict(SCENARIOS)
+    start = time.perf_counter()
+    runs = [
+        describe_run(args.corpus_dir, run_dir, scenarios, args.default_scenario)
+        for run_dir in find_run_dirs(args.corpus_dir)
+    ]
+    if not runs:
+        print(f"No run logs found in '{args.corpus_dir}'.")
+        return
+
+    scores = score_runs(runs, scenarios, args.workers)
+    summary = summarize_scores(scores)
+    print_scorecard(summary)
+    paths = write_scorecards(args.output_dir, scores, summary)
+    print(
+        f"\n--- Scored {len(scores)} run(s) in {time.perf_counter() - start:.2f}s. "
+        f"Scorecards: {', '.join(repr(path) for path in paths)} ---"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+import collections
+import logging
+import math
+import random
+import time
+from dataclasses import replace
+import httpx
+import openai
+from agents import Model
+
+
+# The observed latencies of the primary models in seconds, by model name.
+# They are kept for the whole process, as a model object lives for one run.
+_latencies = {}
+
+# The number of latencies kept per model
+MAX_LATENCY_SAMPLES = 200
+
+
+def get_latencies(name: str) -> collections.deque:
+    """Returns the observed latencies of a model."""
+    return _latencies.setdefault(name, collections.deque(maxlen=MAX_LATENCY_SAMPLES))
+
+
+# The errors of a model request that are worth retrying when they have no
+# status code. The httpx and OpenAI connection errors include their timeouts.
+RETRYABLE_ERRORS = (asyncio.TimeoutError, httpx.TransportError, openai.APIConnectionError)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Returns whether a failed model request is worth retrying: timeouts,
+    connection errors, rate limits and server errors are, other client
+    errors such as a bad request, and any other exception, are not.
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in [408, 409, 429] or status_code >= 500
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class HedgedModel(Model):
+    """
+    A Model that applies a request policy to another model. Each call has a
+    deadline, failed attempts are retried with jittered exponential backoff
+    within it, and if a fallback model is configured, a request the primary
+    model has not answered by its observed p95 latency is also sent to the
+    fallback and the first valid response wins. The path that answered is
+    logged to the token usage log. Streamed responses get the deadline and
+    the retries, but are not hedged, and a stream that has already yielded
+    events is not retried.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        primary: Model,
+        policy,
+        fallback_name: str = None,
+        fallback: Model = None,
+        fallback_parallel_tool_calls: bool = None,
+    ):
+        self.name = name
+        self.model = getattr(primary, "model", name)
+        self.primary = primary
+        self.policy = policy
+        self.fallback_name = fallback_name
+        self.fallback = fallback
+        # The fallback gets its own parallel_tool_calls setting, as its provider may not accept the primary's
+        self.fallback_parallel_tool_calls = fallback_parallel_tool_calls
+
+    def get_hedge_delay(self) -> float:
+        """Returns how long to wait for the primary model before hedging, its observed p95 latency."""
+        latencies = get_latencies(self.name)
+        if len(latencies) < self.policy.hedge_min_samples:
+            return self.policy.hedge_delay
+        ordered = sorted(latencies)
+        rank = max(1, math.ceil(self.policy.hedge_percentile / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    async def get_response(self, *args, **kwargs):
+        start = time.perf_counter()
+        deadline = start + self.policy.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.perf_counter()
+            try:
+                response, path = await asyncio.wait_for(self._get_hedged_response(args, kwargs), remaining)
+            except Exception as e:
+                backoff = self._get_retry_backoff(e, attempt, deadline)
+                if backoff is None:
+                    self._log_request("failed", attempt, start, error=e)
+                    raise
+                logging.warning(
+                    f"Model request to '{self.name}' failed (attempt {attempt}), retrying in {backoff:.2f}s: {e}"
+                )
+                await asyncio.sleep(backoff)
+                continue
+
+            self._log_request(path, attempt, start)
+            return response
+
+    def _get_retry_backoff(self, error: Exception, attempt: int, deadline: float):
+        """Returns how long to wait before retrying a failed attempt, or None if it is not retried."""
+        remaining = deadline - time.perf_counter()
+        # Full jitter: a random delay up to the exponential backoff
+        backoff = random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2 ** (attempt - 1)))
+        if (
+            isinstance(error, asyncio.TimeoutError)
+            or attempt > self.policy.max_retries
+            or not is_retryable(error)
+            or backoff >= remaining
+        ):
+            return None
+        return backoff
+
+    async def _get_hedged_response(self, args, kwargs):
+        """Returns the first valid response and whether the 'primary' or the 'hedge' path sent it."""
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(self.primary.get_response(*args, **kwargs))
+        paths = {primary: "primary"}
+        try:
+            hedge_delay = self.get_hedge_delay() if self.fallback is not None else None
+            done, pending = await asyncio.wait([primary], timeout=hedge_delay)
+            if not done:
+                hedge = asyncio.ensure_future(self.fallback.get_response(*args, **self._get_fallback_kwargs(kwargs)))
+                paths[hedge] = "hedge"
+                pending = {primary, hedge}
+
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            get_latencies(self.name).append(time.perf_counter() - start)
+                        return task.result(), paths[task]
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cancel the slower path, or both if the deadline passed. A primary
+            # cancelled this way took at least this long, which is recorded as
+            # a lower bound, so the hedge delay is not taken from the fast
+            # responses only.
+            if not primary.done():
+                get_latencies(self.name).append(time.perf_counter() - start)
+            for task in paths:
+                if not task.done():
+                    task.cancel()
+
+    def _get_fallback_kwargs(self, kwargs: dict) -> dict:
+        """Returns the arguments of a request to the fallback model, with its parallel_tool_calls setting."""
+        model_settings = kwargs.get("model_settings")
+        if model_settings is None:
+            return kwargs
+        return {**kwargs, "model_settings": replace(model_settings, parallel_tool_calls=self.fallback_parallel_tool_calls)}
+
+    def _log_request(self, path: str, attempt: int, start: float, error: Exception = None) -> None:
+        model = self.fallback_name if path == "hedge" else self.name
+        message = (
+            "TOKEN_USAGE - Model Request - "
+            f"Path: {path}, "
+            f"Model: {model}, "
+            f"Attempts: {attempt}, "
+            f"Duration: {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        if error is not None:
+            message += f", Error: {type(error).__name__}"
+        logging.info(message)
+
+    async def stream_response(self, *args, **kwargs):
+        start = time.perf_counter()
+        deadline = start + self.policy.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            stream = self.primary.stream_response(*args, **kwargs)
+            started = False
+            try:
+                # The stream runs in the calling task, as the model sets context
+                # variables such as the current span across its events. The
+                # deadline is paused while an event is yielded, so that it never
+                # cancels the consumer's code.
+                loop_deadline = asyncio.get_running_loop().time() + deadline - time.perf_counter()
+                async with asyncio.timeout_at(loop_deadline) as timeout:
+                    async for event in stream:
+                        started = True
+                        timeout.reschedule(None)
+                        yield event
+                        timeout.reschedule(loop_deadline)
+            except Exception as e:
+                # Events already yielded cannot be taken back, so only a stream that failed before its first event is retried
+                backoff = None if started else self._get_retry_backoff(e, attempt, deadline)
+                if backoff is None:
+                    self._log_request("failed", attempt, start, error=e)
+                    raise
+                logging.warning(
+                    f"Streamed model request to '{self.name}' failed (attempt {attempt}), retrying in {backoff:.2f}s: {e}"
+                )
+                await asyncio.sleep(backoff)
+                continue
+            finally:
+                await stream.aclose()
+
+            self._log_request("stream", attempt, start)
+            return
+
+    async def close(self) -> None:
+        await self.primary.close()
+        if self.fallback is not None:
+            await self.fallback.close()
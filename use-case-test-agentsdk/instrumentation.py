@@ -0,0 +1,162 @@
+import json
+import time
+from compaction import compact_tool_result
+from logging_config import log_event
+from metrics import MetricsHooks, ToolCallMetricsMixin, get_model_name, is_error_result
+from prefetch import get_current_prefetcher, is_speculative_call
+from tool_cache import CachedMCPServerStdio
+from tool_dispatch import InFlightLimiter, get_max_in_flight
+
+
+def parse_tool_result(result):
+    """
+    Turns the content of an MCP CallToolResult into plain Python data. Text
+    content holding JSON is decoded, so the event log carries the payload
+    itself instead of its escaped text.
+    """
+    items = []
+    for item in result.content:
+        if item.type == "text":
+            try:
+                items.append(json.loads(item.text))
+            except json.JSONDecodeError:
+                items.append(item.text)
+        else:
+            items.append({"type": item.type})
+    return items[0] if len(items) == 1 else items
+
+
+class EventHooks(MetricsHooks):
+    """
+    Run hooks that emit one event per model request, including its duration,
+    token usage and a compact view of what the model returned, and record
+    the request in the metrics.
+    """
+
+    async def on_llm_end(self, context, agent, response):
+        duration = await super().on_llm_end(context, agent, response)
+        duration_ms = duration * 1000 if duration is not None else None
+
+        output = []
+        for item in response.output:
+            if item.type == "function_call":
+                try:
+                    arguments = json.loads(item.arguments) if item.arguments else {}
+                except json.JSONDecodeError:
+                    arguments = item.arguments
+                output.append({"type": "function_call", "name": item.name, "arguments": arguments})
+            elif item.type == "message":
+                text = "".join(
+                    getattr(content, "text", "") for content in item.content
+                )
+                output.append({"type": "message", "text": text})
+            else:
+                output.append({"type": item.type})
+
+        log_event(
+            "model_request",
+            agent=agent.name,
+            model=get_model_name(agent),
+            duration_ms=round(duration_ms, 3) if duration_ms is not None else None,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            payload=output,
+        )
+
+
+class InstrumentedMCPServerStdio(ToolCallMetricsMixin, CachedMCPServerStdio):
+    """
+    An MCPServerStdio that emits one event per tool call and per tool result,
+    including the call duration and the full parsed result payload, and
+    records the call in the metrics. The agent gets the compacted result.
+    Its tool list is served from the on-disk tool-schema cache. Starting the
+    server emits an event with the time to spawn and initialize it.
+
+    At most MCP_MAX_IN_FLIGHT tool calls run on the server at once. The
+    tool_call event records how long a call waited for a slot and how many
+    calls were in flight on the server, including itself.
+
+    If the run has a prefetcher, calls it issued are flagged as speculative,
+    calls of the agent are served from prefetched results where possible,
+    and every result is passed on to it to predict the next calls.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = InFlightLimiter(get_max_in_flight())
+
+    async def connect(self):
+        start = time.perf_counter()
+        try:
+            await super().connect()
+        finally:
+            log_event(
+                "server_start",
+                server=self.name,
+                duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                is_error=self.session is None,
+            )
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        prefetcher = get_current_prefetcher()
+        speculative = is_speculative_call()
+        if prefetcher is not None and not speculative:
+            start = time.perf_counter()
+            prefetched = await prefetcher.take(tool_name, arguments)
+            if prefetched is not None:
+                log_event("tool_call", server=self.name, tool=tool_name, prefetched=True, payload=arguments)
+                log_event(
+                    "tool_result",
+                    server=self.name,
+                    tool=tool_name,
+                    duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                    is_error=is_error_result(prefetched),
+                    prefetched=True,
+                )
+                return prefetched
+
+        async with self.limiter.slot() as wait:
+            log_event(
+                "tool_call",
+                server=self.name,
+                tool=tool_name,
+                wait_ms=round(wait * 1000, 3),
+                in_flight=self.limiter.in_flight,
+                speculative=speculative,
+                payload=arguments,
+            )
+            start = time.perf_counter()
+            try:
+                if meta is None:
+                    result = await super().call_tool(tool_name, arguments)
+                else:
+                    result = await super().call_tool(tool_name, arguments, meta=meta)
+            except Exception as e:
+                log_event(
+                    "tool_result",
+                    server=self.name,
+                    tool=tool_name,
+                    duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                    is_error=True,
+                    speculative=speculative,
+                    error=str(e),
+                )
+                raise
+
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        compacted, original_chars, compacted_chars = compact_tool_result(tool_name, result)
+        payload = parse_tool_result(result)
+        log_event(
+            "tool_result",
+            server=self.name,
+            tool=tool_name,
+            duration_ms=duration_ms,
+            is_error=is_error_result(result),
+            original_chars=original_chars,
+            compacted_chars=compacted_chars,
+            speculative=speculative,
+            payload=payload,
+        )
+        if prefetcher is not None and not is_error_result(result):
+            prefetcher.observe(tool_name, payload)
+        return compacted
@@ -1,5 +1,14 @@
+import asyncio
+import contextlib
+import contextvars
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import uuid
 
 
 class ImportantLogFilter(logging.Filter):
@@ -25,14 +34,316 @@ class UsageLogFilter(logging.Filter):
         """
         return "TOKEN_USAGE" in record.getMessage()
 
+class EventLogFilter(logging.Filter):
+    """
+    This filter is used to capture only the structured event records emitted via log_event().
+    """
+    def filter(self, record):
+        """
+        Determines if a log record should be logged.
+        """
+        return hasattr(record, "event")
+
+class JsonlEventFormatter(logging.Formatter):
+    """
+    This formatter renders a structured event record as one compact JSON line.
+    """
+    def format(self, record):
+        event = {
+            "run_id": record.run_id,
+            "ts": round(record.created, 6),
+            "event": record.event,
+        }
+        event.update(record.event_fields)
+        return json.dumps(event, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# The id of the run started by the latest setup_logging() call. Runs started
+# with run_logging() have their own id in the run context instead.
+_process_run_id = uuid.uuid4().hex[:12]
+_current_run_id = contextvars.ContextVar("current_run_id", default=None)
+
+# Holds the handlers of the run the current asyncio task belongs to, if any.
+# Tasks copy the context they are created in, so every record logged while
+# driving a run (including from the MCP and HTTP client tasks it spawns)
+# carries the run's handlers with it.
+_current_run_handlers = contextvars.ContextVar("current_run_handlers", default=None)
+
+
+def _get_run_handlers(record):
+    """
+    Returns the handlers of the run a record was emitted in, if any.
+    """
+    # Records handed over by the queue handler carry the run context they
+    # were emitted in, since the listener thread has a context of its own
+    if hasattr(record, "run_handlers"):
+        return record.run_handlers
+    return _current_run_handlers.get()
+
+
+class SharedLogFilter(logging.Filter):
+    """
+    This filter keeps records emitted inside a run context out of the shared
+    handlers, so concurrent runs only write to their own log files.
+    """
+    def filter(self, record):
+        """
+        Determines if a log record should be logged.
+        """
+        return _get_run_handlers(record) is None
+
+
+class RunLogRouter(logging.Handler):
+    """
+    This handler dispatches each record to the handlers of the run that
+    emitted it. Records emitted outside a run context are ignored.
+    """
+    def emit(self, record):
+        handlers = _get_run_handlers(record)
+        if handlers is None:
+            return
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_run_log_router = RunLogRouter()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    This handler hands records over to a bounded queue that is drained by a
+    QueueListener on a background thread, so formatting and writing logs
+    never happens on the asyncio event loop. When the queue is full, the
+    'drop' policy never waits: it discards records below WARNING right away,
+    and a WARNING or above takes the place of the oldest queued record below
+    WARNING instead, or is discarded if there is none. The 'block' policy
+    applies backpressure by waiting for free space for up to `block_timeout`
+    seconds before discarding the record.
+    """
+    def __init__(self, log_queue, policy="drop", block_timeout=0.1):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.run_handlers = _current_run_handlers.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING or not self._replace_queued_record(record):
+                self.dropped += 1
+
+    def _replace_queued_record(self, record):
+        """
+        Puts a record in place of the oldest queued record below WARNING,
+        which is discarded. Returns False if there is no such record.
+        """
+        log_queue = self.queue
+        with log_queue.mutex:
+            for i, queued in enumerate(log_queue.queue):
+                if isinstance(queued, logging.LogRecord) and queued.levelno < logging.WARNING:
+                    del log_queue.queue[i]
+                    log_queue.queue.append(record)
+                    log_queue.not_empty.notify()
+                    self.dropped += 1
+                    return True
+        return False
+
+
+class CloseHandlers:
+    """
+    A queue item asking the listener to close a run's handlers, once it has
+    handled the records enqueued before it.
+    """
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.closed = threading.Event()
+
+
+class RunQueueListener(logging.handlers.QueueListener):
+    """
+    A QueueListener that closes the handlers of a finished run on its own
+    thread, after the run's queued records have been written.
+    """
+    def handle(self, record):
+        if isinstance(record, CloseHandlers):
+            for handler in record.handlers:
+                handler.close()
+            record.closed.set()
+            return
+        super().handle(record)
+
+    def close_handlers(self, handlers, timeout=5.0):
+        """
+        Blocks until all records enqueued before this call have been handled
+        and the handlers are closed. If the queue stays full, the handlers
+        are closed at once with a warning, and their queued records are lost.
+        Meant to be run off the event loop, e.g. via asyncio.to_thread().
+        """
+        item = CloseHandlers(handlers)
+        try:
+            self.queue.put(item, timeout=timeout)
+        except queue.Full:
+            print("WARNING: Closed the run's log files before their records were written, as the log queue was full.")
+            for handler in handlers:
+                handler.close()
+            return
+        item.closed.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        """
+        Stops the listener thread once it has handled the records enqueued so
+        far. If the queue stays full, the thread is left to the interpreter
+        with a warning, and the records still queued are lost.
+        """
+        try:
+            self.queue.put(self._sentinel, timeout=timeout)
+        except queue.Full:
+            print("WARNING: Could not stop the log queue listener because the log queue was full.")
+        else:
+            self._thread.join()
+        self._thread = None
+
+
+# The listener draining the log queue when queued logging is enabled
+_queue_listener = None
+_queue_handler = None
+
+
+def _stop_queue_listener():
+    """
+    Flushes the log queue and stops its listener thread, reporting any
+    records that had to be dropped.
+    """
+    global _queue_listener, _queue_handler
+    if _queue_listener is None:
+        return
+    _queue_listener.stop()
+    if _queue_handler.dropped:
+        print(f"WARNING: Dropped {_queue_handler.dropped} log records because the log queue was full.")
+    _queue_listener = None
+    _queue_handler = None
+
+
+atexit.register(_stop_queue_listener)
+
+
+def get_run_id():
+    """
+    Returns the id of the run the current context belongs to.
+    """
+    return _current_run_id.get() or _process_run_id
+
+
+_event_logger = logging.getLogger("events")
+
+
+def log_event(event, **fields):
+    """
+    Emits a structured event record for the current run. The record is written
+    as one JSON line to the events log, while the other logs get a short
+    summary of its scalar fields.
+    """
+    summary = " ".join(
+        f"{key}={value}" for key, value in fields.items()
+        if isinstance(value, (str, int, float, bool))
+    )
+    _event_logger.info(
+        f"EVENT {event} {summary}".rstrip(),
+        extra={"event": event, "event_fields": fields, "run_id": get_run_id()},
+    )
+
+
+def get_log_checkpoint_file(log_file):
+    """
+    Returns the path of the file holding the byte offset at which the current
+    run started writing to `log_file`.
+    """
+    return f"{log_file}.checkpoint"
+
+
+def write_log_checkpoint(log_file):
+    """
+    Records the current size of `log_file` as the start offset of a new run,
+    so the evaluation only has to scan what this run appends to the log.
+    """
+    offset = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    with open(get_log_checkpoint_file(log_file), "w", encoding="utf-8") as f:
+        json.dump({"offset": offset}, f)
+    return offset
+
+
+def read_log_checkpoint(log_file):
+    """
+    Returns the start offset of the latest run in `log_file`, or 0 if no
+    checkpoint was recorded or the log was truncated since.
+    """
+    try:
+        with open(get_log_checkpoint_file(log_file), "r", encoding="utf-8") as f:
+            offset = int(json.load(f).get("offset", 0))
+    except (FileNotFoundError, ValueError, AttributeError):
+        return 0
+    if not os.path.exists(log_file) or offset > os.path.getsize(log_file):
+        return 0
+    return offset
+
+
+def _create_file_handlers(log_dir, log_file_mode):
+    """
+    Creates the full, summary, token usage and event file handlers for a log directory.
+    """
+    file_handler = logging.FileHandler(os.path.join(log_dir, "mcp.log"), mode=log_file_mode)
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+
+    summary_handler = logging.FileHandler(
+        os.path.join(log_dir, "mcp_summary.log"), mode=log_file_mode
+    )
+    summary_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    summary_handler.addFilter(ImportantLogFilter())
+
+    usage_handler = logging.FileHandler(
+        os.path.join(log_dir, "token_usage.log"), mode=log_file_mode
+    )
+    usage_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(message)s")
+    )
+    usage_handler.addFilter(UsageLogFilter())
+
+    event_handler = logging.FileHandler(
+        os.path.join(log_dir, "events.jsonl"), mode=log_file_mode, encoding="utf-8"
+    )
+    event_handler.setFormatter(JsonlEventFormatter())
+    event_handler.addFilter(EventLogFilter())
+
+    return [file_handler, summary_handler, usage_handler, event_handler]
+
+
 def setup_logging():
     """
     Sets up logging for the application.
     This includes creating a logs directory, setting up file handlers for
-    a full log and a summary log, and a stream handler for console output.
+    a full log, a summary log and a JSONL event log, and a stream handler
+    for console output.
     The log file mode (append or write) is controlled by the LOG_FILE_MODE
-    environment variable.
+    environment variable. Setting LOG_QUEUE to 1 moves all handlers onto a
+    background listener thread behind a bounded queue, whose size and
+    drop/block policy are controlled by LOG_QUEUE_SIZE and LOG_QUEUE_POLICY.
     """
+    global _queue_listener, _queue_handler
+
     log_dir = "logs"
     os.makedirs(log_dir, exist_ok=True)
     log_file_mode = os.getenv("LOG_FILE_MODE", "a").lower()
@@ -41,47 +352,97 @@ def setup_logging():
             f"Invalid LOG_FILE_MODE '{log_file_mode}', defaulting to 'a' (append)."
         )
         log_file_mode = "a"
+    use_log_queue = os.getenv("LOG_QUEUE", "0").lower() in ["1", "true", "yes"]
+    log_queue_policy = os.getenv("LOG_QUEUE_POLICY", "drop").lower()
+    if log_queue_policy not in ["drop", "block"]:
+        print(
+            f"Invalid LOG_QUEUE_POLICY '{log_queue_policy}', defaulting to 'drop'."
+        )
+        log_queue_policy = "drop"
+    log_queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
     log_file = os.path.join(log_dir, "mcp.log")
+    summary_log_file = os.path.join(log_dir, "mcp_summary.log")
+    usage_log_file = os.path.join(log_dir, "token_usage.log")
+    event_log_file = os.path.join(log_dir, "events.jsonl")
+
+    # Every call starts a new run with its own id in the event log
+    global _process_run_id
+    _process_run_id = uuid.uuid4().hex[:12]
 
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
-    # Remove any existing handlers to avoid duplicating logs
+    # Remove any existing handlers to avoid duplicating logs, flushing the
+    # log queue of a previous setup first
+    _stop_queue_listener()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-
-    # Create file handler to save logs to a file
-    file_handler = logging.FileHandler(log_file, mode=log_file_mode)
-    file_handler.setFormatter(
-        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    )
-    logger.addHandler(file_handler)
+        if handler is not _run_log_router:
+            handler.close()
 
     # Create stream handler to also print logs to the console
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
-    logger.addHandler(stream_handler)
 
-    # Create a handler for the summary log file
-    summary_log_file = os.path.join(log_dir, "mcp_summary.log")
-    summary_handler = logging.FileHandler(summary_log_file, mode=log_file_mode)
-    summary_handler.setFormatter(
-        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    )
-    summary_handler.addFilter(ImportantLogFilter())
-    logger.addHandler(summary_handler)
+    # Create the full, summary, token usage and event file handlers. Records emitted
+    # inside a run context are kept out of them and routed to the run's own
+    # log files instead.
+    handlers = [stream_handler] + _create_file_handlers(log_dir, log_file_mode)
+    for handler in handlers:
+        handler.addFilter(SharedLogFilter())
+    handlers.append(_run_log_router)
 
-    # Create a handler for the token usage log file
-    usage_log_file = os.path.join(log_dir, "token_usage.log")
-    usage_handler = logging.FileHandler(usage_log_file, mode=log_file_mode)
-    usage_handler.setFormatter(
-        logging.Formatter("%(asctime)s - %(message)s")
-    )
-    usage_handler.addFilter(UsageLogFilter())
-    logger.addHandler(usage_handler)
+    if use_log_queue:
+        _queue_handler = BoundedQueueHandler(
+            queue.Queue(maxsize=log_queue_size), policy=log_queue_policy
+        )
+        _queue_listener = RunQueueListener(
+            _queue_handler.queue, *handlers, respect_handler_level=True
+        )
+        _queue_listener.start()
+        logger.addHandler(_queue_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    # Remember where this run starts in the full and event logs, which are
+    # appended to across runs by default.
+    write_log_checkpoint(log_file)
+    write_log_checkpoint(event_log_file)
 
     logging.info(
-        f"Logging configured. Full log: '{log_file}', Summary log: '{summary_log_file}', Token Usage log: '{usage_log_file}', Mode: '{log_file_mode}'."
+        f"Logging configured. Full log: '{log_file}', Summary log: '{summary_log_file}', Token Usage log: '{usage_log_file}', Event log: '{event_log_file}', Run ID: '{_process_run_id}', Mode: '{log_file_mode}', Queue: '{log_queue_policy if use_log_queue else 'off'}'."
     )
 
+
+@contextlib.asynccontextmanager
+async def run_logging(log_dir):
+    """
+    Routes all records emitted in the current context to a dedicated set of
+    full, summary, token usage and event log files in `log_dir`, so several
+    runs can execute concurrently in one process without sharing 'logs/mcp.log'.
+    The run gets its own id in the event log. Expects setup_logging() to have
+    configured the root logger.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    handlers = _create_file_handlers(log_dir, "w")
+
+    root_logger = logging.getLogger()
+    if _queue_listener is None and _run_log_router not in root_logger.handlers:
+        root_logger.addHandler(_run_log_router)
+
+    handlers_token = _current_run_handlers.set(handlers)
+    run_id_token = _current_run_id.set(uuid.uuid4().hex[:12])
+    try:
+        yield log_dir
+    finally:
+        _current_run_id.reset(run_id_token)
+        _current_run_handlers.reset(handlers_token)
+        # Let the listener write out the run's queued records before it
+        # closes the run's files, waiting for it off the event loop
+        if _queue_listener is not None:
+            await asyncio.to_thread(_queue_listener.close_handlers, handlers)
+        else:
+            for handler in handlers:
+                handler.close()
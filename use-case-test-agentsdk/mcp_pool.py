@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+from instrumentation import InstrumentedMCPServerStdio
+
+
+class PooledServer:
+    """
+    Keeps one MCP server process and its session alive for the pool. The
+    server's context is entered and exited by a dedicated task, since the
+    stdio transport must be torn down by the task that set it up, while the
+    session itself can be used from any task that leases the server.
+    """
+
+    def __init__(self, name: str, params: dict):
+        self.server = InstrumentedMCPServerStdio(name=name, params=params)
+        self.uses = 0
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error = None
+        self._task = None
+
+    async def start(self) -> None:
+        """Spawns the server process and waits for the MCP initialize handshake."""
+        # Run in an empty context, so the long-lived server does not log to
+        # the run that happened to trigger its start
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self) -> None:
+        try:
+            async with self.server:
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+
+    async def stop(self) -> None:
+        """Shuts the server process down."""
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+
+    async def is_healthy(self, timeout: float) -> bool:
+        """Checks that the server still answers on its session."""
+        if self._task is None or self._task.done() or self.server.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.server.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """
+    A process-wide pool of pre-started, health-checked MCP server sessions.
+
+    Each server configuration (a dict with 'name' and 'params', as used for
+    MCPServerStdio) gets its own set of instances. A run leases one instance
+    per configuration for its whole duration, so no two runs share a session.
+    On release, an instance is health-checked and either returned to the
+    pool or recycled after `max_uses` leases or a failed check.
+    """
+
+    def __init__(self, size: int = 1, max_uses: int = 50, health_check_timeout: float = 5.0):
+        self.size = size
+        self.max_uses = max_uses
+        self.health_check_timeout = health_check_timeout
+        self._idle = {}
+        self._all = set()
+        self._background = set()
+
+    @staticmethod
+    def _key(config: dict) -> tuple:
+        params = config["params"]
+        return (config["name"], params["command"], tuple(params.get("args", [])))
+
+    def _idle_queue(self, config: dict) -> asyncio.Queue:
+        return self._idle.setdefault(self._key(config), asyncio.Queue())
+
+    async def _spawn(self, config: dict) -> PooledServer:
+        pooled = PooledServer(config["name"], config["params"])
+        await pooled.start()
+        self._all.add(pooled)
+        return pooled
+
+    async def start(self, server_configs: list) -> None:
+        """Pre-starts `size` instances of every given server configuration."""
+        configs = [config for config in server_configs for _ in range(self.size)]
+        spawned = await asyncio.gather(*(self._spawn(config) for config in configs))
+        for config, pooled in zip(configs, spawned):
+            self._idle_queue(config).put_nowait(pooled)
+        logging.info(f"MCP server pool started {len(spawned)} server(s).")
+
+    async def _acquire(self, config: dict) -> PooledServer:
+        idle = self._idle_queue(config)
+        if not idle.empty():
+            return idle.get_nowait()
+        # All instances are leased, so grow the pool for this configuration
+        logging.info(f"MCP server pool is spawning another '{config['name']}' server.")
+        return await self._spawn(config)
+
+    async def _release(self, config: dict, pooled: PooledServer) -> None:
+        pooled.uses += 1
+        if pooled.uses < self.max_uses and await pooled.is_healthy(self.health_check_timeout):
+            self._idle_queue(config).put_nowait(pooled)
+            return
+
+        # Recycle the instance and start its replacement in the background
+        logging.info(f"MCP server pool is recycling a '{config['name']}' server after {pooled.uses} lease(s).")
+        self._all.discard(pooled)
+        await pooled.stop()
+        task = asyncio.create_task(self._replace(config), context=contextvars.Context())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _replace(self, config: dict) -> None:
+        try:
+            self._idle_queue(config).put_nowait(await self._spawn(config))
+        except Exception as e:
+            logging.error(f"MCP server pool failed to replace a '{config['name']}' server: {e}")
+
+    @contextlib.asynccontextmanager
+    async def lease(self, server_configs: list):
+        """
+        Leases one server instance per configuration and yields the list of
+        MCP servers, in the order of the configurations.
+        """
+        leased = []
+        try:
+            for config in server_configs:
+                leased.append((config, await self._acquire(config)))
+            yield [pooled.server for _, pooled in leased]
+        finally:
+            await asyncio.gather(*(self._release(config, pooled) for config, pooled in leased))
+
+    async def close(self) -> None:
+        """Shuts down all server instances of the pool."""
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await asyncio.gather(*(pooled.stop() for pooled in self._all), return_exceptions=True)
+        self._all.clear()
+        self._idle.clear()
+
+
+# The pool used by the architectures, if one was set up for this process
+_default_pool = None
+
+
+def get_default_pool():
+    """Returns the process-wide MCP server pool, or None if there is none."""
+    return _default_pool
+
+
+def set_default_pool(pool):
+    """Sets (or with None, clears) the process-wide MCP server pool."""
+    global _default_pool
+    _default_pool = pool
@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+from agents import RunHooks
+
+
+# The content type of the OpenMetrics text format
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+TURN_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 30)
+
+
+def escape_label_value(value) -> str:
+    """Escapes a label value for the OpenMetrics text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    """Formats a label set as '{name="value",...}'."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metric:
+    """The base class of a metric family with a fixed set of label names."""
+
+    type_name = None
+
+    def __init__(self, name: str, description: str, label_names: tuple, unit: str = None):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.unit = unit
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> list:
+        """Returns the lines of the metric family in the OpenMetrics text format."""
+        lines = [f"# TYPE {self.name} {self.type_name}"]
+        if self.unit:
+            lines.append(f"# UNIT {self.name} {self.unit}")
+        lines.append(f"# HELP {self.name} {self.description}")
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_samples(dict(zip(self.label_names, key)), value))
+        return lines
+
+
+class Counter(Metric):
+    """A monotonically increasing count."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, labels: dict, value) -> list:
+        return [f"{self.name}_total{format_labels(labels)} {value}"]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. the number of active leases."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _render_samples(self, labels: dict, value) -> list:
+        return [f"{self.name}{format_labels(labels)} {value}"]
+
+
+class Histogram(Metric):
+    """A distribution of observed values over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: tuple, buckets: tuple, unit: str = None):
+        super().__init__(name, description, label_names, unit)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            bucket_counts, count, total = self._values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[index] += 1
+            self._values[key] = (bucket_counts, count + 1, total + value)
+
+    def _render_samples(self, labels: dict, value) -> list:
+        bucket_counts, count, total = value
+        lines = [
+            f"{self.name}_bucket{format_labels({**labels, 'le': float(bound)})} {bucket_count}"
+            for bound, bucket_count in zip(self.buckets, bucket_counts)
+        ]
+        lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {count}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+        return lines
+
+
+MODEL_REQUEST_DURATION = Histogram(
+    "model_request_duration_seconds", "Latency of model requests.", ("model",), LATENCY_BUCKETS, unit="seconds"
+)
+MODEL_TURN_TOKENS = Histogram(
+    "model_turn_tokens", "Tokens per model turn.", ("model", "direction"), TOKEN_BUCKETS, unit="tokens"
+)
+TOOL_CALL_DURATION = Histogram(
+    "mcp_tool_call_duration_seconds", "Latency of MCP tool calls.", ("server", "tool"), LATENCY_BUCKETS, unit="seconds"
+)
+TOOL_CALL_ERRORS = Counter("mcp_tool_call_errors", "MCP tool calls that failed or returned an error.", ("server", "tool"))
+AGENT_RUN_TURNS = Histogram(
+    "agent_run_turns", "Turns used by an agent run, by its max_turns limit.", ("agent", "max_turns"), TURN_BUCKETS
+)
+AGENT_MAX_TURNS_REACHED = Counter(
+    "agent_max_turns_reached", "Agent runs that used all of their turns.", ("agent", "max_turns")
+)
+STREAM_FIRST_TOKEN_DURATION = Histogram(
+    "stream_first_token_duration_seconds",
+    "Time from the start of a streamed agent run to its first text token.",
+    ("model",),
+    LATENCY_BUCKETS,
+    unit="seconds",
+)
+MCP_POOL_LEASES = Gauge("mcp_pool_leases", "Active leases of an MCP server replica set.", ("replica",))
+MCP_POOL_LEASE_WAIT = Histogram(
+    "mcp_pool_lease_wait_seconds",
+    "Time waited for a lease of an MCP server replica set.",
+    (),
+    LATENCY_BUCKETS,
+    unit="seconds",
+)
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Admitted requests that are running.", ())
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for admission.", ())
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time requests waited for admission.", (), LATENCY_BUCKETS, unit="seconds"
+)
+ADMISSION_REJECTIONS = Counter("admission_rejections", "Requests rejected by the admission control.", ("reason",))
+
+ALL_METRICS = [
+    MODEL_REQUEST_DURATION,
+    MODEL_TURN_TOKENS,
+    TOOL_CALL_DURATION,
+    TOOL_CALL_ERRORS,
+    AGENT_RUN_TURNS,
+    AGENT_MAX_TURNS_REACHED,
+    STREAM_FIRST_TOKEN_DURATION,
+    MCP_POOL_LEASES,
+    MCP_POOL_LEASE_WAIT,
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_QUEUE_WAIT,
+    ADMISSION_REJECTIONS,
+]
+
+
+def render_metrics() -> str:
+    """Returns all metrics in the OpenMetrics text format."""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_textfile(path: str) -> None:
+    """Writes all metrics to an OpenMetrics textfile, replacing it atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+def get_model_name(agent) -> str:
+    """Returns a printable name for the model an agent runs on."""
+    if isinstance(agent.model, str):
+        return agent.model
+    return getattr(agent.model, "model", type(agent.model).__name__)
+
+
+def is_error_result(result) -> bool:
+    """Returns whether an MCP CallToolResult is flagged as an error."""
+    # The flag was renamed from 'isError' to 'is_error' in mcp 2.x
+    return bool(getattr(result, "is_error", None) or getattr(result, "isError", None))
+
+
+class MetricsHooks(RunHooks):
+    """
+    Run hooks that record the latency and token usage of every model request
+    and the number of turns an agent run used versus its max_turns limit.
+    Use one instance per run.
+    """
+
+    def __init__(self, max_turns: int = None):
+        self.max_turns = max_turns
+        self.turns = 0
+        self._llm_started = {}
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        # Model calls of one agent are sequential, so the agent identifies the call
+        self._llm_started[agent.name] = time.perf_counter()
+
+    async def on_llm_end(self, context, agent, response):
+        started = self._llm_started.pop(agent.name, None)
+        duration = time.perf_counter() - started if started is not None else None
+        model = get_model_name(agent)
+        if duration is not None:
+            MODEL_REQUEST_DURATION.observe(duration, model=model)
+        MODEL_TURN_TOKENS.observe(response.usage.input_tokens, model=model, direction="input")
+        MODEL_TURN_TOKENS.observe(response.usage.output_tokens, model=model, direction="output")
+
+        self.turns += 1
+        if self.max_turns is not None and self.turns == self.max_turns:
+            AGENT_MAX_TURNS_REACHED.inc(agent=agent.name, max_turns=self.max_turns)
+        return duration
+
+    async def on_agent_end(self, context, agent, output):
+        AGENT_RUN_TURNS.observe(self.turns, agent=agent.name, max_turns=self.max_turns or "none")
+
+
+class ToolCallMetricsMixin:
+    """
+    A mixin for MCP servers that records the latency and errors of every tool
+    call. List it before the server class, e.g.
+    `class MeteredServer(ToolCallMetricsMixin, MCPServerStdio)`.
+    """
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        start = time.perf_counter()
+        try:
+            if meta is None:
+                result = await super().call_tool(tool_name, arguments)
+            else:
+                result = await super().call_tool(tool_name, arguments, meta=meta)
+        except Exception:
+            TOOL_CALL_ERRORS.inc(server=self.name, tool=tool_name)
+            raise
+        finally:
+            TOOL_CALL_DURATION.observe(time.perf_counter() - start, server=self.name, tool=tool_name)
+
+        if is_error_result(result):
+            TOOL_CALL_ERRORS.inc(server=self.name, tool=tool_name)
+        return result
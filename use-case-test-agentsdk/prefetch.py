@@ -0,0 +1,180 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from logging_config import log_event
+
+
+# The tools that may be called speculatively. They only read data, so an
+# unused result costs nothing but the call. Booking tools are never prefetched.
+PREFETCHABLE_TOOLS = {"get_coordinates", "get_nearest_airports", "search_hotels_by_geocode"}
+
+# The date range in a conference description, e.g. 'Date: November 2-6, 2025'
+DATE_RANGE_PATTERN = re.compile(r"Date:\s*([A-Za-z]+)\s+(\d{1,2})\s*-\s*(\d{1,2}),\s*(\d{4})")
+
+# The prefetcher of the current run, and whether the current task is a
+# speculative call. Tasks copy the context, so the tool calls of a run see
+# its prefetcher.
+_current_prefetcher = contextvars.ContextVar("current_prefetcher", default=None)
+_is_speculative = contextvars.ContextVar("is_speculative", default=False)
+
+
+def is_prefetch_enabled() -> bool:
+    """Returns whether the prefetch stage is enabled via the PREFETCH variable (Default: off)."""
+    return os.getenv("PREFETCH", "0").lower() in ["1", "true", "yes"]
+
+
+def get_call_key(tool_name: str, arguments) -> str:
+    """Returns the key of a tool call, which identifies its result."""
+    return json.dumps({"tool": tool_name, "arguments": arguments or {}}, sort_keys=True, separators=(",", ":"))
+
+
+def get_stay_dates(conference: dict):
+    """
+    Returns the check-in and check-out dates for a conference, the day
+    before it starts and the day after it ends, or None if its description
+    has no date range.
+    """
+    match = DATE_RANGE_PATTERN.search(conference.get("description", ""))
+    if match is None:
+        return None
+    month, first_day, last_day, year = match.groups()
+    try:
+        start = datetime.strptime(f"{month} {first_day} {year}", "%B %d %Y").date()
+        end = date(start.year, start.month, int(last_day))
+    except ValueError:
+        return None
+    return (start - timedelta(days=1)).isoformat(), (end + timedelta(days=1)).isoformat()
+
+
+class Prefetcher:
+    """
+    Watches the tool results of a run and speculatively calls the read-only
+    tools the agent is likely to call next: once a conference is resolved,
+    its coordinates, and once the coordinates are known, the nearest
+    airports and the hotels around them for the conference dates. A later
+    call of the agent with the same arguments is served from the prefetched
+    result. Use one instance per run.
+    """
+
+    def __init__(self, mcp_servers: list):
+        self.mcp_servers = mcp_servers
+        self.stay_dates = None
+        self.issued = 0
+        self.hits = 0
+        self.failed = 0
+        self._servers_by_tool = None
+        self._pending = {}
+        self._called = set()
+
+    async def _get_server(self, tool_name: str):
+        if self._servers_by_tool is None:
+            self._servers_by_tool = {}
+            for server in self.mcp_servers:
+                for tool in await server.list_tools():
+                    self._servers_by_tool.setdefault(tool.name, server)
+        return self._servers_by_tool.get(tool_name)
+
+    def predict(self, tool_name: str, payload) -> list:
+        """Returns the (tool name, arguments) calls likely to follow a tool result."""
+        if not isinstance(payload, dict):
+            return []
+        if tool_name == "get_conference_details" and isinstance(payload.get("location"), str):
+            self.stay_dates = get_stay_dates(payload)
+            return [("get_coordinates", {"address": payload["location"]})]
+        if tool_name == "get_coordinates" and "lat" in payload and "lng" in payload:
+            latitude, longitude = payload["lat"], payload["lng"]
+            calls = [("get_nearest_airports", {"latitude": latitude, "longitude": longitude})]
+            if self.stay_dates is not None:
+                check_in, check_out = self.stay_dates
+                calls.append(
+                    (
+                        "search_hotels_by_geocode",
+                        {
+                            "latitude": latitude,
+                            "longitude": longitude,
+                            "checkInDate": check_in,
+                            "checkOutDate": check_out,
+                        },
+                    )
+                )
+            return calls
+        return []
+
+    def observe(self, tool_name: str, payload) -> None:
+        """Starts the speculative calls predicted from a tool result in the background."""
+        for predicted_tool, arguments in self.predict(tool_name, payload):
+            key = get_call_key(predicted_tool, arguments)
+            if predicted_tool not in PREFETCHABLE_TOOLS or key in self._pending or key in self._called:
+                continue
+            self._pending[key] = asyncio.create_task(self._prefetch(predicted_tool, arguments))
+            self.issued += 1
+
+    async def _prefetch(self, tool_name: str, arguments: dict):
+        server = await self._get_server(tool_name)
+        if server is None:
+            raise LookupError(f"No server provides the tool '{tool_name}'.")
+        _is_speculative.set(True)
+        return await server.call_tool(tool_name, arguments)
+
+    async def take(self, tool_name: str, arguments):
+        """
+        Returns the prefetched result of a tool call, waiting for it if it is
+        still running, or None if it was not prefetched or failed.
+        """
+        key = get_call_key(tool_name, arguments)
+        self._called.add(key)
+        task = self._pending.pop(key, None)
+        if task is None:
+            return None
+        try:
+            result = await task
+        except Exception as e:
+            logging.warning(f"Prefetching {tool_name} failed, calling it again: {e}")
+            self.failed += 1
+            return None
+        self.hits += 1
+        return result
+
+    async def close(self) -> None:
+        """Cancels the speculative calls that are still running and reports the hit and waste ratios."""
+        for task in self._pending.values():
+            task.cancel()
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        wasted = self.issued - self.hits
+        self._pending = {}
+
+        log_event("prefetch", issued=self.issued, hits=self.hits, wasted=wasted, failed=self.failed)
+        logging.info(
+            "Prefetch - "
+            f"Issued: {self.issued}, "
+            f"Hits: {self.hits}, "
+            f"Wasted: {wasted}, "
+            f"Hit Rate: {self.hits / self.issued if self.issued else 0:.0%}, "
+            f"Waste Rate: {wasted / self.issued if self.issued else 0:.0%}"
+        )
+
+
+def start_prefetcher(mcp_servers: list):
+    """
+    Starts the prefetch stage of a run in the current context and returns
+    its Prefetcher, or None if prefetching is disabled.
+    """
+    if not is_prefetch_enabled():
+        return None
+    prefetcher = Prefetcher(mcp_servers)
+    _current_prefetcher.set(prefetcher)
+    return prefetcher
+
+
+def get_current_prefetcher():
+    """Returns the prefetcher of the current run, if any."""
+    return _current_prefetcher.get()
+
+
+def is_speculative_call() -> bool:
+    """Returns whether the current tool call was issued by the prefetcher."""
+    return _is_speculative.get()
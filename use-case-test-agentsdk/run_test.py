@@ -1,54 +1,78 @@
 import asyncio
+import json
 import logging
 import argparse
 import importlib  # Import the importlib module
+import math
+import os
+import time
+from datetime import datetime
 from evaluate import main as run_evaluation
-from models import MODELS
+from logging_config import run_logging, setup_logging
+from mcp_pool import MCPServerPool, set_default_pool
+from metrics import write_metrics_textfile
+from models import MODELS, STAGES, get_all_configs, get_model_config, setup_model_client, with_stage_models
+from scenarios import DEFAULT_SCENARIO, SCENARIOS, get_scenario
 
 
-async def main():
+# Maps the architecture names accepted on the command line to their modules.
+ARCHITECTURES = {
+    "second": "architectures.secondconference",
+    "third": "architectures.thirdconference",
+}
+
+
+def positive_int(value: str) -> int:
+    """An argparse type for counts that must be at least 1, such as the number of trials."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def add_stage_model_arguments(parser):
+    """Adds a --<stage>-model option per stage, e.g. --discovery-model."""
+    for stage in STAGES:
+        parser.add_argument(
+            f"--{stage}-model",
+            type=str,
+            choices=list(MODELS.keys()),
+            help=f"The model of the {stage} stage. Defaults to the model of the run.",
+        )
+
+
+def get_stage_models(args) -> dict:
+    """Returns the stage models set on the command line, by stage."""
+    return {stage: getattr(args, f"{stage}_model") for stage in STAGES if getattr(args, f"{stage}_model")}
+
+
+def percentile(values, pct):
+    """Returns the nearest-rank percentile of a list of values, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+async def run_single(args):
     """
-    Centralizes the process of running a conference agent and evaluating its output.
-    Allows selection of the architecture (e.g., static vs. dynamic servers).
+    Runs one query against one model and architecture, then evaluates it
+    against the shared logs in the 'logs/' directory.
     """
-    # Set up command-line argument parsing
-    parser = argparse.ArgumentParser(
-        description="Run conference agent test with a specified model and architecture."
-    )
-    parser.add_argument(
-        "--model",
-        type=str,
-        default="gpt-4o",
-        choices=list(MODELS.keys()),
-        help="The model to use for the test run. Defaults to gpt-4o.",
-    )
-    parser.add_argument(
-        "--architecture",
-        type=str,
-        default="second",
-        choices=["second", "third"],
-        help="The architecture to run ('second' for static, 'third' for dynamic). Defaults to 'second'.",
-    )
-    args = parser.parse_args()
-
     print(f"--- Starting Test Run with Model: {args.model} and Architecture: {args.architecture} ---")
 
     # Define the user query to be used for both architectures
-    user_query = (
-        "i want to go to the INTERNATIONAL SEMANTIC WEB CONFERENCE from vienna. "
-        "Book the flight and hotel for me, you dont need to get my permission for booking"
-    )
+    user_query = get_scenario(DEFAULT_SCENARIO).query
 
     # Step 1: Dynamically select and run the chosen conference agent architecture
     print(f"\n>>> Running conference agent with architecture '{args.architecture}' and model '{args.model}'...")
     try:
-        if args.architecture == "second":
-            module_name = "architectures.secondconference"
-        elif args.architecture == "third":
-            module_name = "architectures.thirdconference"
-        
-        architecture_module = importlib.import_module(module_name)
-        await architecture_module.main(args.model, user_query)
+        architecture_module = importlib.import_module(ARCHITECTURES[args.architecture])
+        await architecture_module.main(args.model, user_query, stage_models=get_stage_models(args))
         print(">>> Conference agent finished successfully.")
     except Exception as e:
         logging.error(f"An error occurred while running the conference agent: {e}")
@@ -64,7 +88,266 @@ async def main():
         logging.error(f"An error occurred during evaluation: {e}")
         print(">>> Evaluation failed. See logs for details.")
 
+    write_metrics_textfile(os.path.join("logs", "metrics.prom"))
+
     print("\n--- Test Run Finished ---")
 
+
+async def run_trial(semaphore, trial_dir, scenario, model_config, architecture, trial):
+    """
+    Runs and evaluates a single trial of the matrix. All logs and the
+    evaluation of the trial are written to `trial_dir`.
+    """
+    outcome = {
+        "scenario": scenario.name,
+        "model": model_config.name,
+        "architecture": architecture,
+        "trial": trial,
+        "log_dir": trial_dir,
+        "passed": False,
+        "latency": None,
+        "evaluation_latency": None,
+        "total_tokens": None,
+        "error": None,
+    }
+
+    async with semaphore:
+        async with run_logging(trial_dir):
+            logging.info(
+                f"Starting trial {trial} of scenario '{scenario.name}' with model "
+                f"'{model_config.name}' and architecture '{architecture}'."
+            )
+            start = time.perf_counter()
+            try:
+                architecture_module = importlib.import_module(ARCHITECTURES[architecture])
+                result = await architecture_module.run(model_config, scenario.query)
+                if result is not None:
+                    outcome["total_tokens"] = result.context_wrapper.usage.total_tokens
+            except Exception as e:
+                logging.error(f"An error occurred while running the conference agent: {e}")
+                outcome["error"] = str(e)
+            outcome["latency"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            results = run_evaluation(log_dir=trial_dir, scenario=scenario, verbose=False)
+            outcome["passed"] = not results["errors"]
+        except Exception as e:
+            outcome["error"] = outcome["error"] or f"Evaluation failed: {e}"
+        outcome["evaluation_latency"] = time.perf_counter() - start
+
+    status = "PASSED" if outcome["passed"] else "FAILED"
+    print(
+        f"[{status}] {scenario.name} / {model_config.name} / {architecture} / "
+        f"trial {trial} in {outcome['latency']:.1f}s"
+    )
+    return outcome
+
+
+def print_matrix_summary(outcomes):
+    """Prints one aggregated pass-rate and latency table for all trials."""
+    groups = {}
+    for outcome in outcomes:
+        key = (outcome["scenario"], outcome["model"], outcome["architecture"])
+        groups.setdefault(key, []).append(outcome)
+
+    header = (
+        f"{'Scenario':<12} {'Model':<20} {'Arch':<6} {'Trials':>6} {'Passed':>6} "
+        f"{'Rate':>6} {'Errors':>6} {'Mean s':>8} {'p50 s':>8} {'p95 s':>8}"
+    )
+    print("\n" + header)
+    print("-" * len(header))
+    for (scenario, model, architecture), group in sorted(groups.items()):
+        latencies = [o["latency"] for o in group if o["latency"] is not None]
+        passed = sum(1 for o in group if o["passed"])
+        errors = sum(1 for o in group if o["error"])
+        mean = sum(latencies) / len(latencies) if latencies else 0.0
+        print(
+            f"{scenario:<12} {model:<20} {architecture:<6} {len(group):>6} {passed:>6} "
+            f"{passed / len(group):>6.0%} {errors:>6} {mean:>8.1f} "
+            f"{percentile(latencies, 50) or 0.0:>8.1f} {percentile(latencies, 95) or 0.0:>8.1f}"
+        )
+
+
+async def start_warm_pool(args, architectures):
+    """
+    Sets up the process-wide MCP server pool and pre-starts the servers the
+    selected architectures are known to use. Servers discovered at run time
+    are started on first use and kept warm for later trials.
+    """
+    pool = MCPServerPool(size=args.pool_size, max_uses=args.pool_max_uses)
+    server_configs = []
+    for architecture in architectures:
+        architecture_module = importlib.import_module(ARCHITECTURES[architecture])
+        if hasattr(architecture_module, "get_server_configs"):
+            server_configs.extend(architecture_module.get_server_configs())
+        if hasattr(architecture_module, "get_registry_server_config"):
+            server_configs.append(architecture_module.get_registry_server_config())
+
+    print(f"Pre-starting {args.pool_size} instance(s) of {len(server_configs)} MCP server(s)...")
+    await pool.start(server_configs)
+    set_default_pool(pool)
+    return pool
+
+
+async def run_matrix_trials(args, matrix_dir, models, architectures, semaphore):
+    """Runs all trials of the matrix and returns their outcomes."""
+    # Every agent gets a model object with its own client, so the trials of
+    # all models, including their stage models, run concurrently.
+    trials = []
+    for model_name in models:
+        model_config = with_stage_models(get_model_config(model_name), get_stage_models(args))
+        try:
+            for config in get_all_configs(model_config):
+                setup_model_client(config)
+        except ValueError as e:
+            print(f">>> Skipping model '{model_config.name}': {e}")
+            continue
+
+        for scenario_name in args.scenarios:
+            scenario = get_scenario(scenario_name)
+            for architecture in architectures:
+                for trial in range(1, args.trials + 1):
+                    trial_dir = os.path.join(
+                        matrix_dir, scenario.name, model_config.name, architecture, f"trial-{trial:03d}"
+                    )
+                    trials.append(
+                        run_trial(semaphore, trial_dir, scenario, model_config, architecture, trial)
+                    )
+    return list(await asyncio.gather(*trials))
+
+
+async def run_matrix(args):
+    """
+    Runs every combination of the selected scenarios, models and architectures
+    for the given number of trials, running trials concurrently up to the
+    configured limit, and prints an aggregated summary.
+    """
+    matrix_dir = os.path.join(args.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    models = args.models or [args.model]
+    architectures = args.architectures or [args.architecture]
+
+    print(
+        f"--- Starting Test Matrix: {len(args.scenarios)} scenario(s) x {len(models)} model(s) x "
+        f"{len(architectures)} architecture(s) x {args.trials} trial(s), "
+        f"concurrency {args.concurrency} ---"
+    )
+    print(f"Logs and evaluations are written to '{matrix_dir}'.")
+
+    setup_logging()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    pool = None
+    if args.warm_pool:
+        pool = await start_warm_pool(args, architectures)
+
+    try:
+        outcomes = await run_matrix_trials(args, matrix_dir, models, architectures, semaphore)
+    finally:
+        if pool is not None:
+            await pool.close()
+            set_default_pool(None)
+
+    print_matrix_summary(outcomes)
+
+    os.makedirs(matrix_dir, exist_ok=True)
+    summary_file = os.path.join(matrix_dir, "summary.json")
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump(outcomes, f, indent=2)
+    metrics_file = os.path.join(matrix_dir, "metrics.prom")
+    write_metrics_textfile(metrics_file)
+    print(f"\n--- Test Matrix Finished. Per-trial results: '{summary_file}', metrics: '{metrics_file}' ---")
+
+
+async def main():
+    """
+    Centralizes the process of running a conference agent and evaluating its output.
+    Allows selection of the architecture (e.g., static vs. dynamic servers).
+    """
+    # Set up command-line argument parsing
+    parser = argparse.ArgumentParser(
+        description="Run conference agent test with a specified model and architecture."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="gpt-4o",
+        choices=list(MODELS.keys()),
+        help="The model to use for the test run. Defaults to gpt-4o.",
+    )
+    parser.add_argument(
+        "--architecture",
+        type=str,
+        default="second",
+        choices=list(ARCHITECTURES.keys()),
+        help="The architecture to run ('second' for static, 'third' for dynamic). Defaults to 'second'.",
+    )
+    add_stage_model_arguments(parser)
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help="Run a concurrent test matrix over scenarios, models, architectures and trials.",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=[DEFAULT_SCENARIO],
+        choices=list(SCENARIOS.keys()),
+        help=f"Matrix mode: the scenarios to run. Defaults to {DEFAULT_SCENARIO}.",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODELS.keys()),
+        help="Matrix mode: the models to run. Defaults to the value of --model.",
+    )
+    parser.add_argument(
+        "--architectures",
+        nargs="+",
+        choices=list(ARCHITECTURES.keys()),
+        help="Matrix mode: the architectures to run. Defaults to the value of --architecture.",
+    )
+    parser.add_argument(
+        "--trials",
+        type=positive_int,
+        default=1,
+        help="Matrix mode: the number of trials per combination. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="Matrix mode: the maximum number of trials running at once. Defaults to 4.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=os.path.join("logs", "matrix"),
+        help="Matrix mode: the directory for per-trial logs. Defaults to logs/matrix.",
+    )
+    parser.add_argument(
+        "--warm-pool",
+        action="store_true",
+        help="Matrix mode: lease MCP servers from a pool of pre-started servers instead of spawning them per trial.",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=positive_int,
+        default=1,
+        help="Matrix mode: the number of pre-started instances per MCP server. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--pool-max-uses",
+        type=positive_int,
+        default=50,
+        help="Matrix mode: the number of leases after which a pooled MCP server is recycled. Defaults to 50.",
+    )
+    args = parser.parse_args()
+
+    if args.matrix:
+        await run_matrix(args)
+    else:
+        await run_single(args)
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,81 @@
+import json
+from dataclasses import dataclass, fields
+
+
+@dataclass
+class Scenario:
+    """A dataclass to hold a user query and the bookings it is expected to produce."""
+
+    name: str
+    query: str
+    expected_flight_id: str
+    expected_arrival_date: str
+    expected_return_date: str
+    expected_hotel_id: str
+    expected_check_in: str
+    expected_check_out: str
+
+
+# A dictionary mapping a friendly name to its scenario.
+# This is the central registry for all test scenarios.
+SCENARIOS = {
+    "iswc-2025": Scenario(
+        name="iswc-2025",
+        query=(
+            "i want to go to the INTERNATIONAL SEMANTIC WEB CONFERENCE from vienna. "
+            "Book the flight and hotel for me, you dont need to get my permission for booking"
+        ),
+        expected_flight_id="CONF-FLIGHT-NARA",
+        expected_arrival_date="2025-11-01",
+        expected_return_date="2025-11-07",
+        expected_hotel_id="ISWC-OFFER-1",
+        expected_check_in="2025-11-01",
+        expected_check_out="2025-11-07",
+    ),
+    "eswc-2025": Scenario(
+        name="eswc-2025",
+        query=(
+            "i want to go to the EUROPEAN SEMANTIC WEB CONFERENCE from vienna. "
+            "Book the flight and hotel for me, you dont need to get my permission for booking"
+        ),
+        expected_flight_id="CONF-FLIGHT-PORTOROZ",
+        expected_arrival_date="2025-11-30",
+        expected_return_date="2025-12-06",
+        expected_hotel_id="ESWC-OFFER-1",
+        expected_check_in="2025-11-30",
+        expected_check_out="2025-12-06",
+    ),
+}
+
+DEFAULT_SCENARIO = "iswc-2025"
+
+
+def get_scenario(name: str) -> Scenario:
+    """Retrieves the scenario for a given scenario name."""
+    if name not in SCENARIOS:
+        raise ValueError(
+            f"Scenario '{name}' not found. Available scenarios: {list(SCENARIOS.keys())}"
+        )
+    return SCENARIOS[name]
+
+
+def load_scenarios(path: str) -> dict:
+    """
+    Loads scenarios from a JSON file holding a list of objects with the
+    fields of Scenario, and returns them by name. The query may be left out
+    if the scenarios are only used to evaluate archived runs.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = [{"name": name, **entry} for name, entry in entries.items()]
+
+    names = {field.name for field in fields(Scenario)}
+    scenarios = {}
+    for entry in entries:
+        unknown = set(entry) - names
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)} in scenario '{entry.get('name')}' of '{path}'.")
+        scenario = Scenario(**{"query": "", **entry})
+        scenarios[scenario.name] = scenario
+    return scenarios
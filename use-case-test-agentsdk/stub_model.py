@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from dataclasses import dataclass
+import httpx
+
+
+@dataclass
+class StubFlow:
+    """
+    A dataclass to hold a scripted conversation of the stub model. Each step
+    is a list of (tool name, arguments) calls the model makes in one turn.
+    After the last step, the model answers with the final output.
+    """
+
+    name: str
+    keywords: list
+    steps: list
+    final_output: str
+
+
+# The scripted flows of the travel agent. A flow is selected by the first of
+# its keywords found in the user's query.
+STUB_FLOWS = [
+    StubFlow(
+        name="eswc-2025",
+        keywords=["european semantic web", "eswc"],
+        steps=[
+            [("search_conferences", {"query": "EUROPEAN SEMANTIC WEB CONFERENCE"})],
+            [
+                ("get_conference_details", {"conference_name": "ESWC 2025"}),
+                ("get_coordinates", {"address": "Vienna, Austria"}),
+            ],
+            [("get_nearest_airports", {"latitude": 45.514, "longitude": 13.591})],
+            [
+                (
+                    "search_flight_offers",
+                    {
+                        "originLocationCode": "VIE",
+                        "destinationLocationCode": "TRS",
+                        "departureDate": "2025-11-30",
+                        "returnDate": "2025-12-06",
+                        "adults": 1,
+                    },
+                ),
+                (
+                    "search_hotels_by_geocode",
+                    {
+                        "latitude": 45.514,
+                        "longitude": 13.591,
+                        "checkInDate": "2025-11-30",
+                        "checkOutDate": "2025-12-06",
+                    },
+                ),
+            ],
+            [
+                ("book_flight", {"flightOfferId": "CONF-FLIGHT-PORTOROZ"}),
+                ("book_hotel", {"hotelOfferId": "ESWC-OFFER-1"}),
+            ],
+        ],
+        final_output="I booked flight CONF-FLIGHT-PORTOROZ and hotel offer ESWC-OFFER-1 for ESWC 2025.",
+    ),
+    StubFlow(
+        name="iswc-2025",
+        keywords=["international semantic web", "iswc"],
+        steps=[
+            [("search_conferences", {"query": "INTERNATIONAL SEMANTIC WEB CONFERENCE"})],
+            [
+                ("get_conference_details", {"conference_name": "ISWC 2025"}),
+                ("get_coordinates", {"address": "Nara, Japan"}),
+            ],
+            # Uses the coordinates get_coordinates returned, as a model would
+            [("get_nearest_airports", {"latitude": 34.6833362, "longitude": 135.8052412})],
+            [
+                (
+                    "search_flight_offers",
+                    {
+                        "originLocationCode": "VIE",
+                        "destinationLocationCode": "KIX",
+                        "departureDate": "2025-10-31",
+                        "returnDate": "2025-11-07",
+                        "adults": 1,
+                    },
+                ),
+                (
+                    "search_hotels_by_geocode",
+                    {
+                        "latitude": 34.6833362,
+                        "longitude": 135.8052412,
+                        "checkInDate": "2025-11-01",
+                        "checkOutDate": "2025-11-07",
+                    },
+                ),
+            ],
+            [
+                ("book_flight", {"flightOfferId": "CONF-FLIGHT-NARA"}),
+                ("book_hotel", {"hotelOfferId": "ISWC-OFFER-1"}),
+            ],
+        ],
+        final_output="I booked flight CONF-FLIGHT-NARA and hotel offer ISWC-OFFER-1 for ISWC 2025.",
+    ),
+]
+
+# The flow used when no keyword matches
+DEFAULT_STUB_FLOW = "iswc-2025"
+
+# The scripted flow of the discovery agent. Its final output is built from
+# the addresses the registry returned.
+DISCOVERY_FLOW = StubFlow(
+    name="discovery",
+    keywords=[],
+    steps=[
+        [("get_servers", {})],
+        [
+            ("get_server_address", {"server_name": "mcp-conference-discovery-mock"}),
+            ("get_server_address", {"server_name": "mcp-conference-mediation-helpers-mock"}),
+            ("get_server_address", {"server_name": "mcp-booking-mock"}),
+        ],
+    ],
+    final_output="",
+)
+
+
+def select_flow(messages: list, tool_names: set) -> StubFlow:
+    """Selects the scripted flow for a conversation."""
+    if "get_server_address" in tool_names:
+        return DISCOVERY_FLOW
+    query = next(
+        (str(message.get("content", "")) for message in messages if message.get("role") == "user"), ""
+    ).lower()
+    for flow in STUB_FLOWS:
+        if any(keyword in query for keyword in flow.keywords):
+            return flow
+    return next(flow for flow in STUB_FLOWS if flow.name == DEFAULT_STUB_FLOW)
+
+
+def get_discovered_servers(messages: list) -> list:
+    """Builds the discovery result from the registry's answers in the conversation."""
+    requested = {}
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            if tool_call["function"]["name"] == "get_server_address":
+                arguments = json.loads(tool_call["function"]["arguments"])
+                requested[tool_call["id"]] = arguments["server_name"]
+
+    servers = []
+    for message in messages:
+        if message.get("role") == "tool" and message.get("tool_call_id") in requested:
+            content = message["content"]
+            # Tool results are passed on either as text or as a list of text parts
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content)
+            try:
+                address = json.loads(content)["address"]
+                servers.append({"name": requested[message["tool_call_id"]], "params": address})
+            except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+                continue
+    return servers
+
+
+class StubModelTransport(httpx.AsyncBaseTransport):
+    """
+    An httpx transport that answers chat completions requests in-process
+    with the scripted flows, so a run exercises the whole framework without
+    any model latency. The latency and token counts it reports are set via
+    the STUB_MODEL_LATENCY_MS, STUB_MODEL_JITTER_MS, STUB_MODEL_PROMPT_TOKENS
+    and STUB_MODEL_COMPLETION_TOKENS variables. Without token counts, they
+    are estimated as four characters per token. STUB_MODEL_ERROR_RATE sets
+    the share of requests that fail with a server error.
+    """
+
+    def __init__(self):
+        self.latency = float(os.getenv("STUB_MODEL_LATENCY_MS", "0")) / 1000
+        self.jitter = float(os.getenv("STUB_MODEL_JITTER_MS", "0")) / 1000
+        self.error_rate = float(os.getenv("STUB_MODEL_ERROR_RATE", "0"))
+        self.prompt_tokens = os.getenv("STUB_MODEL_PROMPT_TOKENS")
+        self.completion_tokens = os.getenv("STUB_MODEL_COMPLETION_TOKENS")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(
+                404, json={"error": {"message": f"The stub model does not serve '{request.url.path}'."}}
+            )
+
+        if random.random() < self.error_rate:
+            return httpx.Response(500, json={"error": {"message": "Simulated stub model failure."}})
+
+        body = json.loads(request.content)
+        message = self.get_next_message(body)
+        usage = {
+            "prompt_tokens": int(self.prompt_tokens or len(request.content) // 4),
+            "completion_tokens": int(self.completion_tokens or len(json.dumps(message)) // 4),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        completion = {
+            "id": f"chatcmpl-stub-{time.time_ns()}",
+            "created": int(time.time()),
+            "model": body["model"],
+        }
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self.to_event_stream(completion, message, finish_reason, usage),
+            )
+        completion.update(
+            {
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+        )
+        return httpx.Response(200, json=completion)
+
+    @staticmethod
+    def get_next_message(body: dict) -> dict:
+        """Returns the assistant message of the next step of the scripted flow."""
+        messages = body.get("messages", [])
+        tool_names = {tool["function"]["name"] for tool in body.get("tools", [])}
+        flow = select_flow(messages, tool_names)
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+
+        # Skip calls of tools the agent does not have, e.g. if a server is missing
+        calls = []
+        if step < len(flow.steps):
+            calls = [(name, arguments) for name, arguments in flow.steps[step] if name in tool_names]
+        if calls:
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_stub_{step}_{index}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(arguments)},
+                    }
+                    for index, (name, arguments) in enumerate(calls)
+                ],
+            }
+
+        final_output = flow.final_output
+        if flow is DISCOVERY_FLOW:
+            final_output = json.dumps(get_discovered_servers(messages))
+        return {"role": "assistant", "content": final_output}
+
+    @staticmethod
+    def to_event_stream(completion: dict, message: dict, finish_reason: str, usage: dict) -> bytes:
+        """Returns the assistant message as a chat completions event stream."""
+        if message.get("tool_calls"):
+            deltas = [
+                {
+                    "role": "assistant",
+                    "tool_calls": [
+                        {"index": index, **tool_call} for index, tool_call in enumerate(message["tool_calls"])
+                    ],
+                }
+            ]
+        else:
+            # Stream the content word by word, like a model streams its tokens
+            words = re.findall(r"\S+\s*|\s+", message["content"]) or [""]
+            deltas = [{"role": "assistant", "content": words[0]}] + [{"content": word} for word in words[1:]]
+
+        chunks = [{"choices": [{"index": 0, "delta": delta, "finish_reason": None}]} for delta in deltas]
+        chunks += [
+            {"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]},
+            {"choices": [], "usage": usage},
+        ]
+        events = [
+            "data: " + json.dumps({**completion, "object": "chat.completion.chunk", **chunk}) + "\n\n"
+            for chunk in chunks
+        ]
+        events.append("data: [DONE]\n\n")
+        return "".join(events).encode("utf-8")
+
+
+def create_stub_http_client() -> httpx.AsyncClient:
+    """Returns an httpx client that is answered by the stub model."""
+    return httpx.AsyncClient(transport=StubModelTransport())
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from agents.mcp import MCPServerStdio
+from mcp.types import Tool
+
+
+# The on-disk cache of MCP tool schemas, shared by all runs started from the same directory
+TOOL_CACHE_FILE = os.path.join(".cache", "tool_schemas.json")
+
+# The cached tool schemas, loaded from disk on first use
+_tool_cache = None
+
+# Maps (path, mtime, size) of a build file to its content hash
+_file_hashes = {}
+
+
+def is_tool_cache_enabled() -> bool:
+    """Returns whether the tool-schema cache is enabled via the TOOL_CACHE variable."""
+    return os.getenv("TOOL_CACHE", "1").lower() in ["1", "true", "yes"]
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the SHA-256 hash of a file. The hash is only recomputed when the
+    file's modification time or size changes.
+    """
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if signature not in _file_hashes:
+        with open(path, "rb") as f:
+            _file_hashes[signature] = hashlib.sha256(f.read()).hexdigest()
+    return _file_hashes[signature]
+
+
+def get_server_id(command: str, args: list) -> str:
+    """Returns a readable identifier of a server's command line."""
+    return " ".join([command, *args])
+
+
+def get_cache_key(command: str, args: list) -> str:
+    """
+    Returns the cache key of a stdio server. It covers the command, its
+    arguments and the content of every argument that is a file, such as the
+    server's build/index.js, so rebuilding a server invalidates its entry.
+    """
+    build_files = {arg: hash_file(arg) for arg in args if os.path.isfile(arg)}
+    key = json.dumps({"command": command, "args": list(args), "build_files": build_files}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_tool_cache() -> dict:
+    """Loads the tool-schema cache from disk, or returns the already loaded cache."""
+    global _tool_cache
+    if _tool_cache is None:
+        try:
+            with open(TOOL_CACHE_FILE, "r", encoding="utf-8") as f:
+                _tool_cache = json.load(f)
+        except FileNotFoundError:
+            _tool_cache = {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable tool-schema cache '{TOOL_CACHE_FILE}': {e}")
+            _tool_cache = {}
+    return _tool_cache
+
+
+def write_cache_file(path: str, data) -> None:
+    """Writes JSON data to a cache file, replacing the file atomically."""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_file, path)
+    except OSError as e:
+        logging.warning(f"Failed to write cache file '{path}': {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def save_tool_cache() -> None:
+    """Writes the tool-schema cache to disk."""
+    write_cache_file(TOOL_CACHE_FILE, load_tool_cache())
+
+
+def get_cached_tools(key: str):
+    """Returns the cached tools for a cache key, or None if there are none."""
+    entry = load_tool_cache().get(key)
+    if entry is None:
+        return None
+    return [Tool.model_validate(tool) for tool in entry["tools"]]
+
+
+def put_cached_tools(key: str, server_id: str, tools: list) -> None:
+    """
+    Stores the tools of a server and drops the entries of its previous
+    builds, then writes the cache to disk.
+    """
+    cache = load_tool_cache()
+    for stale_key in [k for k, entry in cache.items() if entry["server"] == server_id and k != key]:
+        del cache[stale_key]
+    cache[key] = {
+        "server": server_id,
+        "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+    }
+    save_tool_cache()
+
+
+class CachedMCPServerStdio(MCPServerStdio):
+    """
+    An MCPServerStdio that takes its tool list from the on-disk tool-schema
+    cache, so connecting to a server whose build did not change does not
+    need a tools/list round trip. The tool list is kept in memory for the
+    lifetime of the server, as with `cache_tools_list=True`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("cache_tools_list", True)
+        super().__init__(*args, **kwargs)
+        self._tool_cache_key = None
+        if is_tool_cache_enabled():
+            self._tool_cache_key = get_cache_key(self.params.command, self.params.args)
+
+    async def list_tools(self, run_context=None, agent=None):
+        if self._tool_cache_key is None or self._tools_list is not None:
+            return await super().list_tools(run_context, agent)
+
+        cached_tools = get_cached_tools(self._tool_cache_key)
+        if cached_tools is not None:
+            logging.info(f"Tool-schema cache hit for '{self.name}'.")
+            self._tools_list = cached_tools
+            self._cache_dirty = False
+            return await super().list_tools(run_context, agent)
+
+        logging.info(f"Tool-schema cache miss for '{self.name}', listing tools from the server.")
+        tools = await super().list_tools(run_context, agent)
+        put_cached_tools(
+            self._tool_cache_key,
+            get_server_id(self.params.command, self.params.args),
+            self._tools_list,
+        )
+        return tools